@@ -1,24 +1,106 @@
-from atlas_memory.memory import add_memory, search_memory
-from atlas_memory.branching import save_point, load_point, delete_branch, list_branches
-from atlas_memory.embeddings import embed
-from atlas_memory.db import get_session, engine, TiDBConnectionError
+import weakref
+
+from atlas_memory.memory import add_memory, add_memories, search_memory
+from atlas_memory.results import SearchResult, RESULT_FIELDS
+from atlas_memory.branching import (
+    save_point,
+    load_point,
+    delete_branch,
+    list_branches,
+    materialize_snapshot,
+    maintain_snapshots,
+    SnapshotExpiredError,
+)
+from atlas_memory.merge import diff_branches, merge_branch, MERGE_STRATEGIES
+from atlas_memory.changes import read_changes, follow_changes, prune_changes, CHANGE_OPS
+from atlas_memory.embeddings import embed, migrate_inline_embeddings
+from atlas_memory.rerank import CrossEncoderReranker, set_reranker
+from atlas_memory.db import get_session, engine, warm_pool, pool_stats, TiDBConnectionError
+from atlas_memory.metrics import embedding_stats, search_stats, search_latency_stats, buffer_stats
 from atlas_memory.schema import Memory, init_db
+from atlas_memory.tracing import set_sink, timings, LoggingSink, OpenTelemetrySink
+from atlas_memory.profiling import profile, format_queries
+from atlas_memory.transfer import export_memories, import_memories
+from atlas_memory.ingest import ingest
+from atlas_memory.registry import active_model
+from atlas_memory.reembed import reembed, activate_model, coverage
+from atlas_memory.tiering import archive_memories, restore_memories
+from atlas_memory.reaper import reap_branches, BranchReaper
+from atlas_memory.partitioning import migrate_memories, check_pruning
+from atlas_memory.vector_cache import enable_vector_cache, disable_vector_cache
+from atlas_memory.buffer import WriteBuffer, merge_pending, FLUSH_SIZE, FLUSH_INTERVAL
 
 
 class MemoryClient:
-    def __init__(self, user_id: str, branch: str = "main"):
+    def __init__(
+        self,
+        user_id: str,
+        branch: str = "main",
+        dedup: str = None,
+        write_behind: bool = False,
+        durability: str = "memory",
+        journal_path: str = None,
+        flush_size: int = FLUSH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        chunk: bool = False,
+        pooling: str = "max"
+    ):
         self.user_id = user_id
         self.branch = branch
+        self.dedup = dedup
+        # chunk: long texts are split into passages, and search ranks by them with `pooling`
+        self.chunk = chunk
+        self.pooling = pooling if chunk else None
         init_db(engine)
 
-    def add(self, text: str, metadata: dict = None) -> int:
-        return add_memory(self.user_id, text, metadata, self.branch)
+        # write-behind: add() returns a Future and a background thread writes in batches
+        self._buffer = None
+        if write_behind:
+            self._buffer = WriteBuffer(dedup, durability, journal_path, flush_size, flush_interval, chunk)
+            # closes the buffer at exit or when the client is collected, without keeping it alive
+            self._finalizer = weakref.finalize(self, self._buffer.close)
+
+    def add(self, text: str, metadata: dict = None):
+        if self._buffer is not None:
+            return self._buffer.add(self.user_id, text, metadata, self.branch)
+        return add_memory(self.user_id, text, metadata, self.branch, self.dedup, chunk=self.chunk)
+
+    def add_many(self, texts: list, metadatas: list = None) -> list:
+        if self._buffer is not None:
+            metadatas = metadatas or [None] * len(texts)
+            return [self._buffer.add(self.user_id, t, m, self.branch) for t, m in zip(texts, metadatas)]
+        return add_memories(self.user_id, texts, metadatas, self.branch, self.dedup, chunk=self.chunk)
+
+    def search(self, query: str, top_k: int = 5, mode: str = "hybrid", fall_through: float = None,
+               fields: list = None, diversify: float = None, rerank: bool = False):
+        if self._buffer is None:
+            return search_memory(
+                self.user_id, query, top_k, self.branch, mode, pooling=self.pooling, fall_through=fall_through,
+                fields=fields, diversify=diversify, rerank=rerank
+            )
 
-    def search(self, query: str, top_k: int = 5, mode: str = "hybrid"):
-        return search_memory(self.user_id, query, top_k, self.branch, mode)
+        # read-your-writes: take pending writes before the query so none fall between the two
+        pending = self._buffer.pending(self.user_id, self.branch)
+        query_vector = embed(query) if mode != "fulltext" else None
+        results = search_memory(
+            self.user_id, query, top_k, self.branch, mode,
+            query_vector=query_vector, pooling=self.pooling, fall_through=fall_through, fields=fields,
+            diversify=diversify, rerank=rerank
+        )
+        return merge_pending(results, pending, query, query_vector, top_k, mode, fields)
 
-    def save_point(self, tag: str) -> str:
-        new_branch = save_point(self.user_id, tag, self.branch)
+    def flush(self, timeout: float = None) -> bool:
+        if self._buffer is None:
+            return True
+        return self._buffer.flush(timeout)
+
+    def close(self):
+        if self._buffer is not None:
+            self._buffer.close()
+
+    def save_point(self, tag: str, mode: str = "copy", ttl: float = None) -> str:
+        self.flush()
+        new_branch = save_point(self.user_id, tag, self.branch, mode, ttl)
         self.branch = new_branch
         return new_branch
 
@@ -26,27 +108,82 @@ class MemoryClient:
         self.branch = branch
 
     def delete_branch(self, branch: str = None) -> int:
+        self.flush()
         target = branch or self.branch
         if target == self.branch and target != "main":
             self.branch = "main"
         return delete_branch(self.user_id, target)
 
     def list_branches(self):
+        self.flush()
         return list_branches(self.user_id)
 
+    def diff(self, other: str = "main", limit: int = None) -> dict:
+        """What this client's branch adds to and removes from `other`."""
+        self.flush()
+        return diff_branches(self.user_id, other, self.branch, limit)
+
+    def merge(self, target: str = "main", strategy: str = "union") -> dict:
+        self.flush()
+        return merge_branch(self.user_id, self.branch, target, strategy)
+
 
 __all__ = [
     "MemoryClient",
+    "WriteBuffer",
     "add_memory",
+    "add_memories",
     "search_memory",
+    "SearchResult",
+    "RESULT_FIELDS",
     "save_point",
     "load_point",
     "delete_branch",
     "list_branches",
+    "diff_branches",
+    "merge_branch",
+    "MERGE_STRATEGIES",
+    "read_changes",
+    "follow_changes",
+    "prune_changes",
+    "CHANGE_OPS",
+    "CrossEncoderReranker",
+    "set_reranker",
+    "materialize_snapshot",
+    "maintain_snapshots",
     "embed",
+    "migrate_inline_embeddings",
+    "export_memories",
+    "import_memories",
+    "ingest",
+    "reembed",
+    "activate_model",
+    "active_model",
+    "coverage",
+    "archive_memories",
+    "restore_memories",
+    "reap_branches",
+    "BranchReaper",
+    "migrate_memories",
+    "check_pruning",
+    "enable_vector_cache",
+    "disable_vector_cache",
     "get_session",
     "engine",
+    "warm_pool",
+    "pool_stats",
+    "embedding_stats",
+    "search_stats",
+    "search_latency_stats",
+    "buffer_stats",
     "Memory",
     "init_db",
+    "set_sink",
+    "timings",
+    "LoggingSink",
+    "OpenTelemetrySink",
+    "profile",
+    "format_queries",
     "TiDBConnectionError",
+    "SnapshotExpiredError",
 ]
@@ -1,32 +1,155 @@
-from datetime import datetime
-from typing import List
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
 
-from atlas_memory.db import get_session
-from atlas_memory.schema import Memory
+from atlas_memory.db import get_session, get_autocommit_connection, is_tidb
+from atlas_memory.schema import Memory, MemoryArchive, SavePoint
+from atlas_memory.registry import ModelVersion, get_model
+from atlas_memory.tracing import span
+from atlas_memory.vector_cache import bump_version, get_vector_cache
+from atlas_memory.changes import record_change
 
+SNAPSHOT_MARK = "@"
+SAVE_POINT_MODES = ("copy", "snapshot")
+
+# materialize TiDB snapshots this long before GC can collect the versions they read
+SNAPSHOT_GC_MARGIN = timedelta(seconds=int(os.getenv("ATLAS_SNAPSHOT_GC_MARGIN", "120")))
+DEFAULT_GC_LIFE_TIME = timedelta(minutes=10)
+
+_GC_TOO_EARLY = 9006
+_COPY_COLUMNS = ("user_id", "text", "metadata_json", "embedding", "content_hash", "occurrences")
+_ARCHIVE_COPY_COLUMNS = (
+    "id", "user_id", "text", "metadata_json", "content_hash", "occurrences", "created_at", "last_retrieved_at",
+    "archived_at", "model", "vector", "scale",
+)
+
+
+
+class SnapshotExpiredError(Exception):
+    pass
+
+
+def vector_column(model: ModelVersion) -> str:
+    # legacy rows carry their own vector, everything else points at the shared one (as e)
+    return "COALESCE(m.embedding, e.embedding)" if model.legacy else "e.embedding"
+
+
+class BranchScope:
+    """The rows a branch name reads: a plain branch, or a snapshot of its source.
+
+    Vectors come from `model`, the active embedding model unless one is named.
+    """
+
+    def __init__(self, branch: str, snapshot_ts: Optional[int] = None, max_id: Optional[int] = None,
+                 model: Optional[str] = None):
+        self.branch = branch
+        self.snapshot_ts = snapshot_ts
+        self.max_id = max_id
+        self.model = get_model(model)
+
+    @property
+    def stale_read(self) -> bool:
+        return self.snapshot_ts is not None
+
+    def table(self, name: str = "memories", alias: str = "") -> str:
+        sql = f"{name} {alias}".rstrip()
+        if self.stale_read:
+            sql += " AS OF TIMESTAMP TIDB_PARSE_TSO(:snapshot_ts)"
+        return sql
+
+    @property
+    def vector_column(self) -> str:
+        return vector_column(self.model)
+
+    @property
+    def passage_vector_column(self) -> str:
+        # with passage_table(): a passage's vector, or the row's own when it was never split
+        return f"COALESCE(pe.embedding, {self.vector_column})"
+
+    def vector_table(self) -> str:
+        """memories (as m) joined to the shared vectors their rows reference (as e)."""
+        return (
+            f"{self.table('memories', 'm')} LEFT JOIN {self.table(self.model.table_name, 'e')} "
+            "ON e.model = :model AND e.content_hash = m.content_hash"
+        )
+
+    def passage_table(self) -> str:
+        """vector_table() plus each row's passages (as p) and their vectors (as pe), one row per passage."""
+        return (
+            f"{self.vector_table()} LEFT JOIN {self.table('passages', 'p')} ON p.parent_hash = m.content_hash "
+            f"LEFT JOIN {self.table(self.model.table_name, 'pe')} "
+            "ON pe.model = :model AND pe.content_hash = p.content_hash"
+        )
+
+    def where(self, alias: str = "") -> str:
+        prefix = f"{alias}." if alias else ""
+        clause = f"{prefix}user_id = :user_id AND {prefix}branch = :branch"
+        if self.max_id is not None:
+            clause += f" AND {prefix}id <= :max_id"
+        return clause
+
+    def params(self, user_id: str) -> dict:
+        params = {"user_id": user_id, "branch": self.branch, "model": self.model.name}
+        if self.stale_read:
+            params["snapshot_ts"] = self.snapshot_ts
+        if self.max_id is not None:
+            params["max_id"] = self.max_id
+        return params
+
+
+def is_snapshot(branch: str) -> bool:
+    # only a cheap pre-check: snapshot names carry the mark, but so can any user branch
+    return SNAPSHOT_MARK in branch
+
+
+def check_writable(user_id: str, branch: str, db=None):
+    """Raise if `branch` is a snapshot that still reads through its source.
+
+    Decided by the save point, not the name; a materialized snapshot has its own rows and
+    takes writes like any other branch.
+    """
+    if not is_snapshot(branch):
+        return
+    if db is None:
+        with get_session() as db:
+            point = _find_snapshot(db, user_id, branch)
+    else:
+        point = _find_snapshot(db, user_id, branch)
+    if point is not None and not point.materialized:
+        raise ValueError(f"Snapshot branch '{branch}' is read-only")
+
+
+def save_point(user_id: str, tag: str, source_branch: str = "main", mode: str = "copy",
+               ttl: Optional[float] = None) -> str:
+    """Branch off `source_branch`. With `ttl` (seconds) the branch is ephemeral and reap_branches() deletes it."""
+    if mode not in SAVE_POINT_MODES:
+        raise ValueError(f"Unknown save point mode '{mode}', expected one of {SAVE_POINT_MODES}")
+    if ttl is not None and ttl <= 0:
+        raise ValueError("ttl must be a positive number of seconds")
 
-def save_point(user_id: str, tag: str, source_branch: str = "main") -> str:
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-    new_branch = f"{tag}-{timestamp}"
+    separator = SNAPSHOT_MARK if mode == "snapshot" else "-"
 
-    with get_session() as db:
-        source_memories = db.query(Memory).filter(
-            Memory.user_id == user_id,
-            Memory.branch == source_branch
-        ).all()
+    with span("save_point", mode=mode), get_session() as db:
+        with span("sql"):
+            new_branch = _unique_branch_name(db, user_id, f"{tag}{separator}{timestamp}")
 
-        for mem in source_memories:
-            new_memory = Memory(
-                user_id=mem.user_id,
-                text=mem.text,
-                metadata_json=mem.metadata_json,
-                embedding=mem.embedding,
-                branch=new_branch
-            )
-            db.add(new_memory)
+            if mode == "snapshot":
+                point = _snapshot_point(db, user_id, new_branch, source_branch)
+            else:
+                _copy_rows(db, user_id, resolve_branch(db, user_id, source_branch), new_branch)
+                point = SavePoint(user_id=user_id, branch=new_branch, source_branch=source_branch, mode="copy")
+            if ttl is not None:
+                point.expires_at = _utcnow() + timedelta(seconds=ttl)
 
-        db.commit()
+        with span("commit"):
+            db.add(point)
+            record_change(db, user_id, new_branch, "save_point", source_branch=source_branch, mode=mode)
+            db.commit()
 
     return new_branch
 
@@ -35,26 +158,230 @@ def load_point(branch: str) -> str:
     return branch
 
 
+def resolve_branch(db, user_id: str, branch: str, model: Optional[str] = None) -> BranchScope:
+    if not is_snapshot(branch):
+        return BranchScope(branch, model=model)
+
+    point = _find_snapshot(db, user_id, branch)
+    if point is None or point.materialized:
+        return BranchScope(branch, model=model)
+
+    if point.snapshot_ts is None:
+        return BranchScope(point.source_branch, max_id=point.max_memory_id, model=model)
+
+    if point.stale_read_until <= _utcnow():
+        raise SnapshotExpiredError(
+            f"Snapshot '{branch}' expired at {point.stale_read_until} UTC before it was materialized"
+        )
+    if point.stale_read_until - SNAPSHOT_GC_MARGIN <= _utcnow():
+        _materialize(db, point)
+        return BranchScope(branch, model=model)
+
+    return BranchScope(point.source_branch, snapshot_ts=point.snapshot_ts, model=model)
+
+
+@contextmanager
+def snapshot_connection():
+    with get_autocommit_connection() as conn:
+        try:
+            yield conn
+        except OperationalError as e:
+            if e.orig is not None and e.orig.args and e.orig.args[0] == _GC_TOO_EARLY:
+                raise SnapshotExpiredError(f"Snapshot data was garbage collected: {e.orig}") from e
+            raise
+
+
+def materialize_snapshot(user_id: str, branch: str) -> int:
+    with get_session() as db:
+        point = _find_snapshot(db, user_id, branch)
+        if point is None or point.materialized:
+            return 0
+        return _materialize(db, point)
+
+
+def materialize_dependents(db, user_id: str, branch: str, watermark_only: bool = False) -> int:
+    """Give snapshots that still read through `branch` their own rows before it is rewritten.
+
+    With `watermark_only`, only id high-water-mark snapshots are copied: they see rows updated
+    in place, while TiDB stale reads don't.
+    """
+    query = db.query(SavePoint).filter(
+        SavePoint.user_id == user_id,
+        SavePoint.source_branch == branch,
+        SavePoint.mode == "snapshot",
+        SavePoint.materialized.is_(False),
+    )
+    if watermark_only:
+        query = query.filter(SavePoint.snapshot_ts.is_(None))
+    return sum(_materialize(db, point) for point in query.all())
+
+
+def maintain_snapshots() -> int:
+    """Materialize TiDB snapshots that are about to fall behind the GC safe point."""
+    materialized = 0
+    with get_session() as db:
+        expiring = db.query(SavePoint).filter(
+            SavePoint.mode == "snapshot",
+            SavePoint.materialized.is_(False),
+            SavePoint.stale_read_until.isnot(None),
+            SavePoint.stale_read_until <= _utcnow() + SNAPSHOT_GC_MARGIN,
+        ).all()
+
+        for point in expiring:
+            materialized += _materialize(db, point)
+
+    return materialized
+
+
 def delete_branch(user_id: str, branch: str) -> int:
     if branch == "main":
         raise ValueError("Can't delete main branch")
 
-    with get_session() as db:
-        deleted = db.query(Memory).filter(
-            Memory.user_id == user_id,
-            Memory.branch == branch
-        ).delete()
-        db.commit()
+    with span("delete_branch"), get_session() as db:
+        with span("materialize"):
+            materialize_dependents(db, user_id, branch)
+        with span("sql"):
+            deleted = db.query(Memory).filter(
+                Memory.user_id == user_id,
+                Memory.branch == branch
+            ).delete()
+            db.query(MemoryArchive).filter(
+                MemoryArchive.user_id == user_id,
+                MemoryArchive.branch == branch
+            ).delete()
+            db.query(SavePoint).filter(
+                SavePoint.user_id == user_id,
+                SavePoint.branch == branch
+            ).delete()
+            bump_version(db, user_id, branch)
+            record_change(db, user_id, branch, "delete_branch")
+        with span("commit"):
+            db.commit()
 
+    cache = get_vector_cache()
+    if cache is not None:
+        cache.discard(user_id, branch)
     return deleted
 
 
 def list_branches(user_id: str) -> List[str]:
     with get_session() as db:
         sql = text("""
-            SELECT DISTINCT branch FROM memories
-            WHERE user_id = :user_id ORDER BY branch
+            SELECT branch FROM memories WHERE user_id = :user_id
+            UNION
+            SELECT branch FROM memory_archive WHERE user_id = :user_id
+            UNION
+            SELECT branch FROM save_points WHERE user_id = :user_id AND mode = 'snapshot'
+            ORDER BY branch
         """)
         results = db.execute(sql, {"user_id": user_id}).fetchall()
 
     return [r.branch for r in results]
+
+
+def _find_snapshot(db, user_id: str, branch: str) -> Optional[SavePoint]:
+    return db.query(SavePoint).filter(
+        SavePoint.user_id == user_id,
+        SavePoint.branch == branch,
+        SavePoint.mode == "snapshot"
+    ).order_by(SavePoint.id.desc()).first()
+
+
+def _unique_branch_name(db, user_id: str, name: str) -> str:
+    taken = {
+        r.branch for r in db.execute(text("""
+            SELECT branch FROM save_points WHERE user_id = :user_id AND branch LIKE :prefix
+            UNION
+            SELECT DISTINCT branch FROM memories WHERE user_id = :user_id AND branch LIKE :prefix
+        """), {"user_id": user_id, "prefix": f"{name}%"}).fetchall()
+    }
+    candidate, n = name, 1
+    while candidate in taken:
+        n += 1
+        candidate = f"{name}-{n}"
+    return candidate
+
+
+def _snapshot_point(db, user_id: str, new_branch: str, source_branch: str) -> SavePoint:
+    origin = _find_snapshot(db, user_id, source_branch) if is_snapshot(source_branch) else None
+    if origin is not None and not origin.materialized:
+        # snapshot of a snapshot reads the same version of the same source
+        return SavePoint(
+            user_id=user_id,
+            branch=new_branch,
+            source_branch=origin.source_branch,
+            mode="snapshot",
+            snapshot_ts=origin.snapshot_ts,
+            max_memory_id=origin.max_memory_id,
+            stale_read_until=origin.stale_read_until,
+        )
+
+    point = SavePoint(user_id=user_id, branch=new_branch, source_branch=source_branch, mode="snapshot")
+    max_id = db.execute(
+        text("SELECT MAX(id) FROM memories WHERE user_id = :user_id AND branch = :branch"),
+        {"user_id": user_id, "branch": source_branch}
+    ).scalar()
+    point.max_memory_id = max_id or 0
+
+    if is_tidb():
+        point.snapshot_ts = db.execute(text("SELECT TIDB_CURRENT_TSO()")).scalar()
+        point.stale_read_until = _utcnow() + _gc_life_time(db)
+
+    return point
+
+
+def _materialize(db, point: SavePoint) -> int:
+    scope = BranchScope(point.source_branch, snapshot_ts=point.snapshot_ts, max_id=point.max_memory_id)
+    copied = _copy_rows(db, point.user_id, scope, point.branch)
+    point.materialized = True
+    db.commit()
+    return copied
+
+
+def _copy_rows(db, user_id: str, scope: BranchScope, target: str) -> int:
+    # archived rows stay archived in the copy, under the ids they had in the source
+    _copy_table(db, user_id, scope, target, "memory_archive", _ARCHIVE_COPY_COLUMNS)
+    bump_version(db, user_id, target)
+    return _copy_table(db, user_id, scope, target, "memories", _COPY_COLUMNS)
+
+
+def _copy_table(db, user_id: str, scope: BranchScope, target: str, table: str, copy_columns: tuple) -> int:
+    params = scope.params(user_id)
+    columns = ", ".join(copy_columns)
+
+    if scope.stale_read:
+        # TiDB only allows AS OF TIMESTAMP on plain SELECTs, so read then insert
+        with snapshot_connection() as conn:
+            rows = conn.execute(
+                text(f"SELECT {columns} FROM {scope.table(table)} WHERE {scope.where()}"),
+                params
+            ).fetchall()
+        if rows:
+            db.execute(text(f"""
+                INSERT INTO {table} (branch, {columns})
+                VALUES (:branch, {", ".join(":" + c for c in copy_columns)})
+            """), [dict(r._mapping, branch=target) for r in rows])
+        return len(rows)
+
+    result = db.execute(text(f"""
+        INSERT INTO {table} (branch, {columns})
+        SELECT :target, {columns}
+        FROM {table} WHERE {scope.where()}
+    """), {**params, "target": target})
+    return result.rowcount
+
+
+def _gc_life_time(db) -> timedelta:
+    try:
+        value = db.execute(text("SELECT @@global.tidb_gc_life_time")).scalar()
+    except OperationalError:
+        return DEFAULT_GC_LIFE_TIME
+
+    # Go duration string, e.g. "10m0s" or "1h30m0s"
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    seconds = sum(float(n) * units[u] for n, u in re.findall(r"([\d.]+)(ms|h|m|s)", value or ""))
+    return timedelta(seconds=seconds) if seconds else DEFAULT_GC_LIFE_TIME
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,288 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+from atlas_memory.embeddings import embed_batch
+from atlas_memory.memory import add_memories, DEDUP_POLICIES
+from atlas_memory.branching import check_writable
+from atlas_memory.metrics import buffer_metrics
+from atlas_memory.results import SearchResult, merge_ranked, result_fields
+
+logger = logging.getLogger("atlas_memory.buffer")
+
+# memory: lost if the process dies; journal: survives a crash; fsync: survives a power cut
+DURABILITY_LEVELS = ("memory", "journal", "fsync")
+FLUSH_SIZE = 64
+FLUSH_INTERVAL = 0.05
+
+
+class PendingMemory:
+    __slots__ = ("seq", "user_id", "branch", "text", "metadata", "future", "vector", "enqueued_at")
+
+    def __init__(self, seq: int, user_id: str, branch: str, text: str, metadata: Optional[dict]):
+        self.seq = seq
+        self.user_id = user_id
+        self.branch = branch
+        self.text = text
+        self.metadata = metadata
+        self.future = Future()
+        self.vector = None
+        self.enqueued_at = time.monotonic()
+
+
+class WriteBuffer:
+    """Queues add_memory calls and writes them in batches from a background thread.
+
+    add() returns a Future that resolves to the memory id once its batch commits. A batch goes
+    out when `flush_size` writes are queued or the oldest has waited `flush_interval` seconds.
+    With a journal every write is appended to a local file before add() returns, and writes
+    that never reached the database are queued again when the next buffer opens the same file.
+    Delivery is at-least-once: a crash between the commit and the journal marker replays that
+    batch. A batch that fails gets its exception on the futures and is not replayed, so
+    retrying it is up to the caller.
+    """
+
+    def __init__(
+        self,
+        dedup: Optional[str] = None,
+        durability: str = "memory",
+        journal_path: Optional[str] = None,
+        flush_size: int = FLUSH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        chunk: bool = False
+    ):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Unknown durability '{durability}', expected one of {DURABILITY_LEVELS}")
+        if dedup is not None and dedup not in DEDUP_POLICIES:
+            raise ValueError(f"Unknown dedup policy '{dedup}', expected one of {DEDUP_POLICIES}")
+        if durability != "memory" and not journal_path:
+            raise ValueError(f"durability='{durability}' needs a journal_path")
+
+        self.dedup = dedup
+        self.durability = durability
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.chunk = chunk
+
+        self._cond = threading.Condition()
+        self._queue: List[PendingMemory] = []
+        self._in_flight: List[PendingMemory] = []
+        self._seq = 0
+        self._closed = False
+        self._flush_requested = False
+
+        self._journal = None
+        if durability != "memory":
+            replay, self._seq = _read_journal(journal_path)
+            self._journal = open(journal_path, "a", encoding="utf-8")
+            # replayed writes keep their journal seq, so their "done" markers line up
+            for record in replay:
+                item = PendingMemory(
+                    record["seq"], record["user_id"], record["branch"], record["text"], record["metadata"]
+                )
+                self._queue.append(item)
+            buffer_metrics.incr("queued", len(self._queue))
+
+        self._thread = threading.Thread(target=self._run, name="atlas-write-buffer", daemon=True)
+        self._thread.start()
+
+    def add(self, user_id: str, content: str, metadata: Optional[dict] = None, branch: str = "main") -> Future:
+        check_writable(user_id, branch)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Write buffer is closed")
+            return self._enqueue(user_id, branch, content, metadata).future
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every write queued before this call has committed (or failed)."""
+        with self._cond:
+            futures = [p.future for p in self._queue + self._in_flight]
+            self._flush_requested = True
+            self._cond.notify_all()
+        done, not_done = wait(futures, timeout=timeout)
+        return not not_done
+
+    def pending(self, user_id: str, branch: str) -> List[PendingMemory]:
+        """Writes to `branch` that readers can't see in the database yet."""
+        with self._cond:
+            return [p for p in self._in_flight + self._queue if p.user_id == user_id and p.branch == branch]
+
+    def close(self, timeout: Optional[float] = None):
+        """Stop taking writes and wait up to `timeout` for the queued ones to go out.
+
+        The writer thread closes the journal when it exits, so a close that times out
+        doesn't pull the file out from under a batch still being written.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _enqueue(self, user_id: str, branch: str, text: str, metadata: Optional[dict]) -> PendingMemory:
+        self._seq += 1
+        item = PendingMemory(self._seq, user_id, branch, text, metadata)
+        self._write_journal({
+            "op": "add", "seq": item.seq, "user_id": user_id, "branch": branch, "text": text, "metadata": metadata
+        })
+        self._queue.append(item)
+        buffer_metrics.incr("queued")
+        # the first write starts the writer's flush_interval timer, a full batch goes out now
+        if len(self._queue) == 1 or len(self._queue) >= self.flush_size:
+            self._cond.notify_all()
+        return item
+
+    def _write_journal(self, record: dict):
+        if self._journal is None:
+            return
+        self._journal.write(json.dumps(record) + "\n")
+        self._journal.flush()
+        if self.durability == "fsync":
+            os.fsync(self._journal.fileno())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._ready():
+                    if self._queue:
+                        wait_for = self.flush_interval - (time.monotonic() - self._oldest)
+                        self._cond.wait(max(wait_for, 0))
+                    else:
+                        self._cond.wait()
+                if not self._queue and self._closed:
+                    if self._journal is not None:
+                        self._journal.close()
+                    return
+                batch, self._queue = self._queue[:self.flush_size], self._queue[self.flush_size:]
+                self._in_flight = batch
+                if not self._queue:
+                    self._flush_requested = False
+
+            start = time.perf_counter()
+            self._write_batch(batch)
+            buffer_metrics.incr("flush_seconds", time.perf_counter() - start)
+            buffer_metrics.incr("queued", -len(batch))
+
+            with self._cond:
+                self._in_flight = []
+                if not self._queue and self._journal is not None:
+                    # every write has committed or failed, start the journal over
+                    self._journal.truncate(0)
+                self._cond.notify_all()
+
+    def _ready(self) -> bool:
+        if not self._queue:
+            return self._closed
+        return (
+            self._closed
+            or self._flush_requested
+            or len(self._queue) >= self.flush_size
+            or time.monotonic() - self._oldest >= self.flush_interval
+        )
+
+    @property
+    def _oldest(self) -> float:
+        return self._queue[0].enqueued_at
+
+    def _write_batch(self, batch: List[PendingMemory]):
+        groups: Dict[tuple, List[PendingMemory]] = {}
+        for item in batch:
+            groups.setdefault((item.user_id, item.branch), []).append(item)
+
+        for (user_id, branch), items in groups.items():
+            try:
+                ids = add_memories(
+                    user_id, [i.text for i in items], [i.metadata for i in items], branch, self.dedup, chunk=self.chunk
+                )
+            except Exception as e:
+                # the caller sees the error on the future; replaying it too would add the row twice on a retry
+                logger.exception("Write-behind batch of %d memories failed", len(items))
+                buffer_metrics.incr("batches_failed")
+                buffer_metrics.incr("memories_failed", len(items))
+                with self._cond:
+                    self._write_journal({"op": "failed", "seqs": [i.seq for i in items]})
+                for item in items:
+                    item.future.set_exception(e)
+                continue
+
+            buffer_metrics.incr("batches_flushed")
+            buffer_metrics.incr("memories_flushed", len(items))
+            with self._cond:
+                self._write_journal({"op": "done", "seqs": [i.seq for i in items]})
+            for item, memory_id in zip(items, ids):
+                item.future.set_result(memory_id)
+
+
+def merge_pending(
+    results: List[SearchResult],
+    pending: List[PendingMemory],
+    query: str,
+    query_vector: List[float],
+    top_k: int,
+    mode: str,
+    fields: Optional[Sequence[str]] = None
+) -> List[SearchResult]:
+    """Fold writes that haven't reached the database into search results, scored the same way.
+
+    They are slotted in by score, so a diversified or reranked order among `results` is kept.
+    """
+    fields = result_fields(fields)
+    committed = {r["id"] for r in results}
+    pending = [
+        p for p in pending
+        if not (p.future.done() and not p.future.exception() and p.future.result() in committed)
+    ]
+    if not pending:
+        return results
+
+    query_lower = query.lower()
+    if mode == "fulltext":
+        scores = [1.0 if query_lower in p.text.lower() else None for p in pending]
+    else:
+        missing = [p for p in pending if p.vector is None]
+        if missing:
+            for p, vector in zip(missing, embed_batch([p.text for p in missing])):
+                p.vector = vector
+        vectors = np.array([p.vector for p in pending], dtype=np.float32)
+        q = np.asarray(query_vector, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(q)
+        scores = (vectors @ q / np.where(norms == 0, 1, norms)).tolist()
+        if mode != "vector":
+            # same boost as _hybrid_search
+            scores = [min(s + 0.1, 1.0) if query_lower in p.text.lower() else s for s, p in zip(scores, pending)]
+
+    extra = []
+    for p, score in zip(pending, scores):
+        if score is None:
+            continue
+        memory_id = p.future.result() if p.future.done() and not p.future.exception() else None
+        extra.append(SearchResult(memory_id, score, p.text, p.metadata, fields, pending=True))
+    return merge_ranked(results, extra, top_k)
+
+
+def _read_journal(path: str):
+    """Uncommitted writes in journal order, and the highest seq used so far."""
+    if not os.path.exists(path):
+        return [], 0
+
+    adds, done = {}, set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a torn last line from a crash mid-write
+                continue
+            if record["op"] == "add":
+                adds[record["seq"]] = record
+            else:
+                # "done" and "failed" both settle their seqs
+                done.update(record["seqs"])
+    last_seq = max(list(adds) + list(done), default=0)
+    return [record for seq, record in sorted(adds.items()) if seq not in done], last_seq
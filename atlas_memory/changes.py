@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional
+from sqlalchemy import event, insert, text
+from sqlalchemy.orm import Session
+
+from atlas_memory.db import get_session
+from atlas_memory.schema import ChangeEvent
+
+CHANGE_OPS = ("add", "update", "delete_branch", "save_point", "merge", "import", "compact", "archive", "restore")
+CHANGE_BATCH_SIZE = 500
+# a missing seq younger than this may be a transaction that hasn't committed yet, so readers wait for it
+CHANGE_SETTLE_SECONDS = float(os.getenv("ATLAS_CHANGE_SETTLE_SECONDS", "5"))
+CHANGE_RETENTION_DAYS = float(os.getenv("ATLAS_CHANGE_RETENTION_DAYS", "7"))
+
+_PENDING = "atlas_pending_changes"
+
+
+def record_change(db, user_id: str, branch: str, op: str, memory_ids: Optional[List[int]] = None, **detail):
+    """Append an event to the change feed as part of the caller's transaction.
+
+    The row is written by the session's next commit, as its last statement, so its seq and
+    created_at are taken just before COMMIT however long the transaction keeps working after
+    this call. A rollback drops it.
+    """
+    if op not in CHANGE_OPS:
+        raise ValueError(f"Unknown change op '{op}', expected one of {CHANGE_OPS}")
+    if not db.in_transaction():
+        # so a rollback or close before any statement still ends a transaction and drops the event
+        db.begin()
+    db.info.setdefault(_PENDING, []).append({
+        "user_id": user_id,
+        "branch": branch,
+        "op": op,
+        "memory_ids": list(memory_ids) if memory_ids is not None else None,
+        "detail": detail or None,
+    })
+
+
+def insert_floor(db, user_id: str, branch: str) -> int:
+    """The highest id in `branch` as this transaction sees it; read it before a bulk INSERT."""
+    return db.execute(
+        text("SELECT MAX(id) FROM memories WHERE user_id = :user_id AND branch = :branch"),
+        {"user_id": user_id, "branch": branch}
+    ).scalar() or 0
+
+
+def inserted_ids(db, user_id: str, branch: str, floor: int) -> List[int]:
+    """Ids this transaction added to `branch` since insert_floor() returned `floor`.
+
+    Multi-row INSERTs don't hand back their ids, so this reads the rows above the floor. Rows
+    another writer commits in between would count too: bump the branch version before reading
+    the floor, and its row lock holds other writers to the branch off until this commit.
+    """
+    return db.execute(
+        text("SELECT id FROM memories WHERE user_id = :user_id AND branch = :branch AND id > :floor ORDER BY id"),
+        {"user_id": user_id, "branch": branch, "floor": floor}
+    ).scalars().all()
+
+
+@event.listens_for(Session, "before_commit")
+def _write_changes(session):
+    events = session.info.pop(_PENDING, None)
+    if events:
+        session.flush()
+        now = _utcnow()
+        session.execute(insert(ChangeEvent.__table__), [{**e, "created_at": now} for e in events])
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_unwritten(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_PENDING, None)
+
+
+def read_changes(
+    after: int = 0,
+    limit: int = CHANGE_BATCH_SIZE,
+    user_id: Optional[str] = None,
+    settle: float = CHANGE_SETTLE_SECONDS
+) -> Dict:
+    """Events with seq > `after`, oldest first, and the checkpoint to pass as `after` next time.
+
+    Seqs are handed out just before a write commits but show up once it has, so the feed stops
+    at a missing seq until the event after it is `settle` seconds old. By then the missing one
+    was rolled back. `user_id` filters the events, not the checkpoint.
+    """
+    with get_session() as db:
+        seqs = db.query(ChangeEvent.seq, ChangeEvent.created_at).filter(
+            ChangeEvent.seq > after
+        ).order_by(ChangeEvent.seq).limit(limit).all()
+
+        checkpoint, cutoff = after, _utcnow() - timedelta(seconds=settle)
+        for seq, created_at in seqs:
+            if seq != checkpoint + 1 and created_at > cutoff:
+                break
+            checkpoint = seq
+        if checkpoint == after:
+            return {"changes": [], "checkpoint": after}
+
+        query = db.query(ChangeEvent).filter(ChangeEvent.seq > after, ChangeEvent.seq <= checkpoint)
+        if user_id is not None:
+            query = query.filter(ChangeEvent.user_id == user_id)
+        events = [_event(e) for e in query.order_by(ChangeEvent.seq).all()]
+    return {"changes": events, "checkpoint": checkpoint}
+
+
+def follow_changes(
+    after: int = 0,
+    user_id: Optional[str] = None,
+    poll_interval: float = 1.0,
+    stop: Optional[threading.Event] = None
+) -> Iterator[Dict]:
+    """Yield events from `after` on, polling every `poll_interval` seconds once caught up, until `stop` is set.
+
+    To resume after a restart, pass the seq of the last event you finished handling.
+    """
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        page = read_changes(after, user_id=user_id)
+        yield from page["changes"]
+        if page["checkpoint"] == after:
+            stop.wait(poll_interval)
+        after = page["checkpoint"]
+
+
+def prune_changes(older_than_days: float = CHANGE_RETENTION_DAYS, batch_size: int = 5000) -> int:
+    """Delete events older than `older_than_days`. Consumers further behind than that have to resync."""
+    cutoff = _utcnow() - timedelta(days=older_than_days)
+    pruned = 0
+    while True:
+        with get_session() as db:
+            seqs = [r.seq for r in db.query(ChangeEvent.seq).filter(
+                ChangeEvent.created_at < cutoff
+            ).order_by(ChangeEvent.seq).limit(batch_size)]
+            if not seqs:
+                return pruned
+            db.query(ChangeEvent).filter(ChangeEvent.seq.in_(seqs)).delete(synchronize_session=False)
+            db.commit()
+        pruned += len(seqs)
+
+
+def _event(e: ChangeEvent) -> Dict:
+    return {
+        "seq": e.seq,
+        "user_id": e.user_id,
+        "branch": e.branch,
+        "op": e.op,
+        "memory_ids": e.memory_ids,
+        "detail": e.detail,
+        "created_at": e.created_at.isoformat(),
+    }
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the memory change feed as JSON lines.")
+    parser.add_argument("--after", type=int, default=0, help="seq to start after")
+    parser.add_argument("--user-id")
+    parser.add_argument("--follow", action="store_true", help="keep polling for new events")
+    parser.add_argument("--prune", type=float, metavar="DAYS", help="delete events older than DAYS and exit")
+    args = parser.parse_args()
+
+    if args.prune is not None:
+        print(json.dumps({"pruned": prune_changes(args.prune)}))
+        return
+    if args.follow:
+        for event in follow_changes(args.after, args.user_id):
+            print(json.dumps(event), flush=True)
+        return
+    after = args.after
+    while True:
+        page = read_changes(after, user_id=args.user_id)
+        for event in page["changes"]:
+            print(json.dumps(event))
+        if page["checkpoint"] == after:
+            return
+        after = page["checkpoint"]
+
+
+if __name__ == "__main__":
+    main()
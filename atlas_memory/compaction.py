@@ -0,0 +1,242 @@
+import argparse
+import json
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import bindparam, insert, text
+
+from atlas_memory.db import engine, get_session
+from atlas_memory.schema import MemoryCompaction
+from atlas_memory.embeddings import decode_vectors
+from atlas_memory.branching import BranchScope, check_writable, materialize_dependents
+from atlas_memory.memory import merge_metadata
+from atlas_memory.vector_cache import bump_version
+from atlas_memory.changes import record_change
+
+COMPACTION_THRESHOLD = 0.92
+# rows read per query while scanning a branch
+COMPACTION_BATCH_SIZE = 1000
+
+# cap on similarity-matrix entries computed per block (~128 MB of float32)
+_BLOCK_ELEMENTS = 32 * 1024 * 1024
+# fixed per-row cost besides text, metadata and vector: id, keys, hash, counters, timestamps
+_ROW_OVERHEAD_BYTES = 120
+
+
+def compact_branch(
+    user_id: str,
+    branch: str = "main",
+    threshold: float = COMPACTION_THRESHOLD,
+    dry_run: bool = False,
+    chunk_size: int = 200,
+    batch_size: int = COMPACTION_BATCH_SIZE
+) -> Dict:
+    """Fold near-duplicate memories of `branch` into one survivor each.
+
+    The branch is read `batch_size` rows at a time and only vectors, ids, counts and sizes are
+    kept, since clustering compares every row with every other. Clusters are applied
+    `chunk_size` per transaction against rows re-read under lock, so writes that land after
+    the scan are merged in rather than lost.
+    """
+    check_writable(user_id, branch)
+
+    ids, occurrences, sizes, vectors = _scan(user_id, BranchScope(branch), batch_size)
+    report = {
+        "user_id": user_id,
+        "branch": branch,
+        "threshold": threshold,
+        "dry_run": dry_run,
+        "rows_before": len(ids),
+        "clusters": 0,
+        "rows_removed": 0,
+        "bytes_saved": 0,
+    }
+    if len(ids) < 2:
+        report["rows_after"] = len(ids)
+        return report
+
+    # survivors are the most restated memories, then the oldest
+    leaders = cluster_vectors(vectors, threshold, np.lexsort((ids, -occurrences)))
+
+    clusters = _group_clusters(leaders)
+    removed = [i for members in clusters.values() for i in members]
+    if not dry_run and clusters:
+        removed = _apply(user_id, branch, ids, vectors, clusters, chunk_size)
+    report["clusters"] = len(clusters)
+    report["rows_removed"] = len(removed)
+    report["rows_after"] = len(ids) - len(removed)
+    report["bytes_saved"] = int(sizes[removed].sum())
+    return report
+
+
+def _scan(user_id: str, scope: BranchScope, batch_size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """ids, occurrences, row sizes and vectors of every row in `scope` that has a vector, in id order."""
+    sql = text(f"""
+        SELECT m.id, m.text, m.metadata_json, m.occurrences,
+               m.embedding IS NOT NULL AS inline_vector,
+               {scope.vector_column} AS vector
+        FROM {scope.vector_table()}
+        WHERE {scope.where("m")} AND m.id > :after
+        ORDER BY m.id
+        LIMIT :limit
+    """)
+    ids, occurrences, sizes, blocks = [], [], [], []
+    after = 0
+    with get_session() as db:
+        while True:
+            rows = db.execute(sql, {**scope.params(user_id), "after": after, "limit": batch_size}).fetchall()
+            if not rows:
+                break
+            after = rows[-1].id
+            rows = [r for r in rows if r.vector is not None]
+            if not rows:
+                continue
+            block = decode_vectors([r.vector for r in rows])
+            blocks.append(block)
+            ids.extend(r.id for r in rows)
+            occurrences.extend(r.occurrences or 1 for r in rows)
+            sizes.extend(_row_bytes(r, user_id, scope.branch, block.shape[1]) for r in rows)
+            db.rollback()
+
+    vectors = np.concatenate(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+    return np.array(ids, dtype=np.int64), np.array(occurrences), np.array(sizes, dtype=np.int64), vectors
+
+
+def cluster_vectors(vectors: np.ndarray, threshold: float, order: np.ndarray) -> np.ndarray:
+    """Greedy leader clustering on the cosine >= threshold graph.
+
+    Visits rows in `order`; each unclaimed row becomes a leader and claims every unclaimed
+    neighbour, so every member is within the threshold of its survivor (no single-link chaining).
+    Returns the leader index of each row.
+    """
+    n = len(vectors)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms == 0, 1, norms)
+
+    neighbors: List[Optional[np.ndarray]] = [None] * n
+    block = max(1, min(1024, _BLOCK_ELEMENTS // n))
+    for start in range(0, n, block):
+        sims = unit[start:start + block] @ unit.T
+        rows, cols = np.nonzero(sims >= threshold)
+        splits = np.searchsorted(rows, np.arange(1, sims.shape[0]))
+        for offset, cols_i in enumerate(np.split(cols, splits)):
+            neighbors[start + offset] = cols_i
+
+    leaders = np.full(n, -1)
+    for i in order:
+        if leaders[i] != -1:
+            continue
+        candidates = neighbors[i]
+        leaders[candidates[leaders[candidates] == -1]] = i
+        leaders[i] = i
+    return leaders
+
+
+def _group_clusters(leaders: np.ndarray) -> Dict[int, List[int]]:
+    clusters = {}
+    for i, leader in enumerate(leaders):
+        if leader != i:
+            clusters.setdefault(int(leader), []).append(i)
+    return clusters
+
+
+def _apply(user_id: str, branch: str, ids: np.ndarray, vectors: np.ndarray, clusters: Dict[int, List[int]],
+           chunk_size: int) -> List[int]:
+    """Merge `clusters` into their leaders; returns the indexes of the rows actually removed."""
+    # user_id keeps every write on one partition when memories is partitioned
+    delete_sql = text("DELETE FROM memories WHERE user_id = :user_id AND id IN :ids").bindparams(
+        bindparam("ids", expanding=True)
+    )
+    # SQLite has no FOR UPDATE; its writers are serialized anyway
+    lock_sql = text(f"""
+        SELECT id, metadata_json, occurrences FROM memories
+        WHERE user_id = :user_id AND branch = :branch AND id IN :ids
+        {"FOR UPDATE" if engine.dialect.name == "mysql" else ""}
+    """).bindparams(bindparam("ids", expanding=True))
+    norms = np.linalg.norm(vectors, axis=1)
+    items = list(clusters.items())
+    removed = []
+
+    with get_session() as db:
+        # watermark snapshots of this branch would otherwise lose the rows we delete
+        materialize_dependents(db, user_id, branch)
+
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            wanted = [int(ids[i]) for leader, members in chunk for i in [leader] + members]
+            # the scan is stale by now: take the current counts and metadata, and skip rows that are gone
+            current = {
+                r.id: r for r in db.execute(lock_sql, {"user_id": user_id, "branch": branch, "ids": wanted})
+            }
+            updates, audit, doomed = [], [], []
+            for leader, members in chunk:
+                survivor = current.get(int(ids[leader]))
+                members = [i for i in members if int(ids[i]) in current]
+                if survivor is None or not members:
+                    continue
+                metadata = _load_json(survivor.metadata_json)
+                occurrences = survivor.occurrences or 1
+                for i in members:
+                    row = current[int(ids[i])]
+                    metadata = merge_metadata(metadata, _load_json(row.metadata_json))
+                    occurrences += row.occurrences or 1
+                    similarity = float(vectors[i] @ vectors[leader] / ((norms[i] * norms[leader]) or 1))
+                    audit.append({
+                        "user_id": user_id,
+                        "branch": branch,
+                        "old_id": row.id,
+                        "survivor_id": survivor.id,
+                        "similarity": similarity,
+                    })
+                    doomed.append(row.id)
+                    removed.append(i)
+                updates.append({
+                    "id": survivor.id,
+                    "user_id": user_id,
+                    "occurrences": occurrences,
+                    "metadata_json": json.dumps(metadata) if metadata is not None else None,
+                })
+            if not updates:
+                db.rollback()
+                continue
+
+            db.execute(
+                text("UPDATE memories SET occurrences = :occurrences, metadata_json = :metadata_json "
+                     "WHERE id = :id AND user_id = :user_id"),
+                updates
+            )
+            db.execute(insert(MemoryCompaction), audit)
+            db.execute(delete_sql, {"user_id": user_id, "ids": doomed})
+            bump_version(db, user_id, branch)
+            record_change(db, user_id, branch, "compact", doomed + [u["id"] for u in updates])
+            db.commit()
+    return removed
+
+
+def _row_bytes(row, user_id: str, branch: str, dim: int) -> int:
+    size = _ROW_OVERHEAD_BYTES + len(user_id) + len(branch) + len(row.text.encode("utf-8"))
+    if row.metadata_json is not None:
+        size += len(row.metadata_json if isinstance(row.metadata_json, str) else json.dumps(row.metadata_json))
+    if row.inline_vector:
+        size += dim * 4
+    return size
+
+
+def _load_json(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collapse near-duplicate memories in a branch.")
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--branch", default="main")
+    parser.add_argument("--threshold", type=float, default=COMPACTION_THRESHOLD)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=COMPACTION_BATCH_SIZE, help="rows read per query")
+    args = parser.parse_args()
+
+    report = compact_branch(args.user, args.branch, args.threshold, args.dry_run, batch_size=args.batch_size)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,106 @@
 import os
+import ssl
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from typing import Optional
 from urllib.parse import quote_plus
 
+import numpy as np
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from atlas_memory.tracing import span
 
 load_dotenv()
 
 
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+POOL_SIZE = int(os.getenv("ATLAS_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("ATLAS_POOL_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("ATLAS_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("ATLAS_POOL_RECYCLE", "3600"))
+POOL_PRE_PING = _env_bool("ATLAS_POOL_PRE_PING", True)
+POOL_WARMUP = int(os.getenv("ATLAS_POOL_WARMUP", str(POOL_SIZE)))
+TLS_SESSION_REUSE = _env_bool("ATLAS_TLS_SESSION_REUSE", True)
+
+
 class TiDBConnectionError(Exception):
     pass
 
 
-def get_db_url():
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.checkout_wait_seconds = 0.0
+        self.checkout_wait_max_seconds = 0.0
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.connections_invalidated = 0
+
+    def record_checkout(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_wait_seconds += seconds
+            self.checkout_wait_max_seconds = max(self.checkout_wait_max_seconds, seconds)
+
+    def incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {k: v for k, v in vars(self).items() if not k.startswith("_")}
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait to check out a connection."""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            with span("checkout"):
+                conn = super().connect()
+        except PoolTimeoutError:
+            pool_metrics.incr("checkout_timeouts")
+            raise
+        pool_metrics.record_checkout(time.perf_counter() - start)
+        return conn
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """Client context shared by every pooled connection that offers the last TLS session back to the server."""
+
+    _session = None
+    _last_socket = None
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        if TLS_SESSION_REUSE and kwargs.get("session") is None:
+            # TLS 1.3 tickets arrive after the handshake, so pick them up from the previous socket lazily
+            last = self._last_socket() if self._last_socket else None
+            session = last.session if last is not None else None
+            if session is not None and (session.has_ticket or self._session is None):
+                self._session = session
+            kwargs["session"] = self._session
+        wrapped = super().wrap_socket(sock, *args, **kwargs)
+        self._last_socket = weakref.ref(wrapped)
+        return wrapped
+
+
+def get_db_url(ssl_params: bool = True):
     user = os.getenv("TIDB_USER")
     password = quote_plus(os.getenv("TIDB_PASSWORD", ""))
     host = os.getenv("TIDB_HOST")
@@ -36,21 +122,73 @@ def get_db_url():
             "Copy .env.example to .env and fill in your TiDB credentials."
         )
 
-    return (
-        f"mysql+pymysql://{user}:{password}@{host}:{port}/{db}"
-        f"?ssl_ca={ca_path}&ssl_verify_cert=true&ssl_verify_identity=true"
-    )
+    url = f"mysql+pymysql://{user}:{password}@{host}:{port}/{db}"
+    if ssl_params:
+        url += f"?ssl_ca={ca_path}&ssl_verify_cert=true&ssl_verify_identity=true"
+    return url
+
+
+def get_ssl_context(ca_path: Optional[str] = None) -> ssl.SSLContext:
+    ca_path = ca_path or os.getenv("TIDB_CA_PATH", "/etc/ssl/cert.pem")
+    # PROTOCOL_TLS_CLIENT verifies the certificate and hostname, like ssl_verify_identity
+    ctx = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    if os.path.exists(ca_path):
+        ctx.load_verify_locations(cafile=ca_path)
+    else:
+        ctx.load_default_certs()
+    return ctx
 
 
 def create_db_engine():
+    # ATLAS_DB_URL points the library at another backend, e.g. sqlite:///atlas.db as a local stand-in
+    local_url = os.getenv("ATLAS_DB_URL")
     try:
-        url = get_db_url()
-        return create_engine(url, pool_recycle=3600)
+        url = local_url or get_db_url(ssl_params=False)
+        if url.startswith("sqlite"):
+            connect_args = {"check_same_thread": False}
+        elif local_url:
+            connect_args = {}
+        else:
+            # one context for the pool: the CA bundle is parsed once and sessions can resume
+            connect_args = {"ssl": get_ssl_context()}
+
+        eng = create_engine(
+            url,
+            poolclass=TimedQueuePool,
+            pool_size=POOL_SIZE,
+            max_overflow=POOL_MAX_OVERFLOW,
+            pool_timeout=POOL_TIMEOUT,
+            pool_recycle=POOL_RECYCLE,
+            pool_pre_ping=POOL_PRE_PING,
+            connect_args=connect_args,
+        )
     except TiDBConnectionError:
         raise
     except Exception as e:
         raise TiDBConnectionError(f"Failed to create database engine: {e}")
 
+    if eng.dialect.name == "sqlite":
+        event.listen(eng, "connect", _register_sqlite_functions)
+    event.listen(eng.pool, "connect", lambda *_: pool_metrics.incr("connections_opened"))
+    event.listen(eng.pool, "close", lambda *_: pool_metrics.incr("connections_closed"))
+    event.listen(eng.pool, "close_detached", lambda *_: pool_metrics.incr("connections_closed"))
+    event.listen(eng.pool, "invalidate", lambda *_: pool_metrics.incr("connections_invalidated"))
+    return eng
+
+
+def _cosine_distance(a, b):
+    if a is None or b is None:
+        return None
+    x = np.fromstring(a[1:-1], dtype=np.float32, sep=",")
+    y = np.fromstring(b[1:-1], dtype=np.float32, sep=",")
+    denom = float(np.linalg.norm(x) * np.linalg.norm(y))
+    return 1.0 - float(x @ y) / denom if denom else None
+
+
+def _register_sqlite_functions(dbapi_conn, _record):
+    # the TiDB vector functions the queries rely on, evaluated in Python
+    dbapi_conn.create_function("vec_cosine_distance", 2, _cosine_distance, deterministic=True)
+
 
 def test_connection(eng):
     try:
@@ -68,6 +206,42 @@ engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def warm_pool(size: Optional[int] = None) -> int:
+    """Open pool connections up front so the first requests don't pay for the TLS handshake."""
+    size = POOL_WARMUP if size is None else size
+    if size <= 0:
+        return 0
+
+    with ThreadPoolExecutor(max_workers=size) as executor:
+        futures = [executor.submit(engine.raw_connection) for _ in range(size)]
+
+    conns, errors = [], []
+    for f in futures:
+        try:
+            conns.append(f.result())
+        except Exception as e:
+            errors.append(e)
+    for conn in conns:
+        conn.close()
+
+    if errors and not conns:
+        raise TiDBConnectionError(f"Failed to warm up the connection pool: {errors[0]}")
+    return len(conns)
+
+
+def pool_stats() -> dict:
+    stats = pool_metrics.snapshot()
+    pool = engine.pool
+    if isinstance(pool, QueuePool):
+        stats.update(
+            pool_size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow(),
+        )
+    return stats
+
+
 @contextmanager
 def get_session():
     db = SessionLocal()
@@ -75,3 +249,25 @@ def get_session():
         yield db
     finally:
         db.close()
+
+
+@contextmanager
+def get_autocommit_connection():
+    # stale reads (AS OF TIMESTAMP) can't run inside an explicit transaction
+    with engine.connect() as conn:
+        yield conn.execution_options(isolation_level="AUTOCOMMIT")
+
+
+_is_tidb = None
+
+
+def is_tidb() -> bool:
+    global _is_tidb
+    if _is_tidb is None:
+        if engine.dialect.name != "mysql":
+            _is_tidb = False
+        else:
+            with engine.connect() as conn:
+                version = conn.execute(text("SELECT VERSION()")).scalar() or ""
+            _is_tidb = "TiDB" in version
+    return _is_tidb
@@ -0,0 +1,35 @@
+import os
+from typing import List
+import numpy as np
+
+# search_memory(diversify=...) reranks this many times top_k candidates
+MMR_POOL_FACTOR = int(os.getenv("ATLAS_MMR_POOL_FACTOR", "4"))
+
+
+def mmr(relevance: np.ndarray, vectors: np.ndarray, k: int, lambda_: float = 0.5) -> List[int]:
+    """Maximal Marginal Relevance: indices of `k` rows, each chosen for relevance minus similarity to those before it.
+
+    `lambda_` 1.0 keeps the relevance order, 0.0 only spreads results out. Similarities come
+    from one matrix product, and each pick is one vectorized pass over the pool.
+    """
+    n = len(relevance)
+    k = min(k, n)
+    if k == 0:
+        return []
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms == 0, 1.0, norms)
+    similarity = unit @ unit.T
+
+    relevance = np.asarray(relevance, dtype=np.float32)
+    # highest similarity to anything picked so far; nothing is redundant before the first pick
+    redundancy = np.zeros(n, dtype=np.float32)
+    chosen = np.zeros(n, dtype=bool)
+    picks = []
+    for _ in range(k):
+        scores = lambda_ * relevance - (1 - lambda_) * redundancy
+        scores[chosen] = -np.inf
+        pick = int(np.argmax(scores))
+        picks.append(pick)
+        chosen[pick] = True
+        np.maximum(redundancy, similarity[pick], out=redundancy)
+    return picks
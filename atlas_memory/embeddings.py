@@ -1,8 +1,127 @@
-from typing import List
+import hashlib
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from sqlalchemy import bindparam, insert, text
 from sentence_transformers import SentenceTransformer
 
-_model = SentenceTransformer("all-MiniLM-L6-v2")
+from atlas_memory.db import get_session
+from atlas_memory.metrics import embedding_metrics
+from atlas_memory.schema import Memory
+from atlas_memory.vectors import encode_vector, decode_vectors
+from atlas_memory.registry import DEFAULT_MODEL, get_model, live_models
 
+# the model deployments started on; get_model() says which one searches use now
+MODEL_NAME = DEFAULT_MODEL
 
-def embed(text: str) -> List[float]:
-    return _model.encode(text).tolist()
+_encoders = {MODEL_NAME: SentenceTransformer(MODEL_NAME)}
+_encoders_lock = threading.Lock()
+
+
+def encoder(model: str) -> SentenceTransformer:
+    with _encoders_lock:
+        if model not in _encoders:
+            _encoders[model] = SentenceTransformer(model)
+        return _encoders[model]
+
+
+# vectors stay float32 arrays from encode() until encode_vector() writes them out
+def embed(text: str, model: Optional[str] = None) -> np.ndarray:
+    embedding_metrics.incr("queries_embedded")
+    return np.asarray(encoder(model or get_model().name).encode(text), dtype=np.float32)
+
+
+def embed_batch(texts: List[str], batch_size: int = 64, model: Optional[str] = None) -> np.ndarray:
+    embedding_metrics.incr("batches")
+    embedding_metrics.incr("texts_embedded", len(texts))
+    embedding_metrics.observe_max("largest_batch", len(texts))
+    return np.asarray(encoder(model or get_model().name).encode(texts, batch_size=batch_size), dtype=np.float32)
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def has_embedding(db, digest: str, model: Optional[str] = None) -> bool:
+    version = get_model(model)
+    return db.execute(
+        text(f"SELECT 1 FROM {version.table_name} WHERE model = :model AND content_hash = :content_hash"),
+        {"model": version.name, "content_hash": digest}
+    ).first() is not None
+
+
+def existing_hashes(db, digests: List[str], model: Optional[str] = None) -> set:
+    version = get_model(model)
+    sql = text(
+        f"SELECT content_hash FROM {version.table_name} WHERE model = :model AND content_hash IN :digests"
+    ).bindparams(bindparam("digests", expanding=True))
+
+    found = set()
+    for i in range(0, len(digests), 500):
+        rows = db.execute(sql, {"model": version.name, "digests": digests[i:i + 500]}).fetchall()
+        found.update(r.content_hash for r in rows)
+    return found
+
+
+def store_embedding(db, digest: str, vector, model: Optional[str] = None):
+    store_embeddings(db, {digest: vector}, model)
+
+
+def store_embeddings(db, vectors: Dict[str, np.ndarray], model: Optional[str] = None):
+    version = get_model(model)
+    # concurrent writers may embed the same text, the first insert wins
+    stmt = insert(version.table).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+    db.execute(stmt, [
+        {"model": version.name, "content_hash": digest, "embedding": vector}
+        for digest, vector in vectors.items()
+    ])
+
+
+def ensure_embeddings(db, contents: List[str], model: Optional[str] = None) -> List[str]:
+    """Return content hashes for `contents`, embedding (in one batch) only texts with no shared vector yet.
+
+    Without `model` this writes for every live model, so a model being backfilled also gets
+    vectors for rows added after its backfill passed them.
+    """
+    digests = [content_hash(c) for c in contents]
+    unique = dict(zip(digests, contents))
+
+    for version in [get_model(model)] if model else live_models():
+        found = existing_hashes(db, list(unique), version.name)
+        missing = [d for d in unique if d not in found]
+        embedding_metrics.incr("cache_hits", len(unique) - len(missing))
+        embedding_metrics.incr("cache_misses", len(missing))
+        if missing:
+            vectors = embed_batch([unique[d] for d in missing], model=version.name)
+            store_embeddings(db, dict(zip(missing, vectors)), version.name)
+
+    return digests
+
+
+def migrate_inline_embeddings(batch_size: int = 500, model: str = MODEL_NAME) -> int:
+    """Move vectors stored on legacy memory rows into the shared embeddings table."""
+    migrated = 0
+
+    while True:
+        with get_session() as db:
+            rows = db.query(Memory.id, Memory.user_id, Memory.text, Memory.embedding).filter(
+                Memory.content_hash.is_(None)
+            ).order_by(Memory.id).limit(batch_size).all()
+            if not rows:
+                return migrated
+
+            updates = []
+            for r in rows:
+                digest = content_hash(r.text)
+                if not has_embedding(db, digest, model):
+                    vector = r.embedding if r.embedding is not None else embed(r.text, model)
+                    store_embedding(db, digest, vector, model)
+                updates.append({"id": r.id, "user_id": r.user_id, "content_hash": digest})
+
+            db.execute(
+                text("UPDATE memories SET content_hash = :content_hash, embedding = NULL "
+                     "WHERE id = :id AND user_id = :user_id"),
+                updates
+            )
+            db.commit()
+            migrated += len(rows)
@@ -0,0 +1,272 @@
+import argparse
+import csv
+import json
+import queue
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from sqlalchemy import insert
+
+from atlas_memory.db import get_session, POOL_SIZE, POOL_MAX_OVERFLOW
+from atlas_memory.schema import Memory
+from atlas_memory.embeddings import content_hash, embed_batch, existing_hashes, store_embeddings
+from atlas_memory.registry import live_models
+from atlas_memory.passages import plan_passages, store_passages
+from atlas_memory.branching import check_writable
+from atlas_memory.vector_cache import bump_version
+from atlas_memory.changes import inserted_ids, insert_floor, record_change
+
+BATCH_SIZE = 256
+EMBED_WORKERS = 2
+INSERT_WORKERS = 4
+QUEUE_DEPTH = 4
+
+Record = Union[str, dict, Tuple[str, Optional[dict]]]
+
+_DONE = object()
+
+
+class _StageStats:
+    def __init__(self, workers: int):
+        self._lock = threading.Lock()
+        self.workers = workers
+        self.rows = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.embedded = 0
+
+    def record(self, rows: int, busy: float, blocked: float = 0.0, embedded: int = 0):
+        with self._lock:
+            self.rows += rows
+            self.busy_seconds += busy
+            self.blocked_seconds += blocked
+            self.embedded += embedded
+
+    def report(self) -> dict:
+        # busy time is summed over workers, so rows/sec here is what the whole stage sustained
+        per_worker = self.busy_seconds / self.workers if self.workers else 0.0
+        return {
+            "workers": self.workers,
+            "rows": self.rows,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "rows_per_second": round(self.rows / per_worker, 1) if per_worker else None,
+        }
+
+
+def ingest(
+    user_id: str,
+    records: Iterable[Record],
+    branch: str = "main",
+    batch_size: int = BATCH_SIZE,
+    embed_workers: int = EMBED_WORKERS,
+    insert_workers: int = INSERT_WORKERS,
+    queue_depth: int = QUEUE_DEPTH,
+    chunk: bool = False
+) -> Dict:
+    """Bulk-load memories with reading, embedding and inserting running concurrently.
+
+    Batches flow reader -> embed workers -> insert workers through queues of `queue_depth`
+    batches each, so a slow stage stalls the ones before it instead of buffering the corpus.
+    Each insert worker commits its own multi-row INSERTs on its own pooled connection.
+    With `chunk`, long texts are split into passages embedded in the same batch as their parents.
+    Returns row counts and per-stage throughput.
+    """
+    check_writable(user_id, branch)
+    if embed_workers + insert_workers > POOL_SIZE + POOL_MAX_OVERFLOW:
+        raise ValueError(
+            f"{embed_workers + insert_workers} workers need more connections than the pool allows "
+            f"({POOL_SIZE} + {POOL_MAX_OVERFLOW} overflow)"
+        )
+
+    to_embed: queue.Queue = queue.Queue(maxsize=queue_depth)
+    to_insert: queue.Queue = queue.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+    errors: List[BaseException] = []
+    stats = {
+        "read": _StageStats(1),
+        "embed": _StageStats(embed_workers),
+        "insert": _StageStats(insert_workers),
+    }
+
+    def put(q: queue.Queue, item) -> float:
+        # returns how long the stage waited on backpressure; gives up if another stage failed
+        started = time.perf_counter()
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        return time.perf_counter() - started
+
+    def take(q: queue.Queue):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def guarded(fn):
+        def run(*args):
+            try:
+                fn(*args)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+        return run
+
+    def embed_worker():
+        while True:
+            batch = take(to_embed)
+            if batch is _DONE:
+                return
+            started = time.perf_counter()
+            texts = [text for text, _ in batch]
+            digests = [content_hash(t) for t in texts]
+            unique = dict(zip(digests, texts))
+            embedded = 0
+            with get_session() as db:
+                rows, passages = plan_passages(db, list(unique.values())) if chunk else ([], [])
+                wanted = {**{content_hash(p): p for p in passages}, **unique}
+                # a model being backfilled gets vectors for new rows too
+                for model in live_models():
+                    found = existing_hashes(db, list(wanted), model.name)
+                    missing = [d for d in wanted if d not in found]
+                    if missing:
+                        vectors = embed_batch([wanted[d] for d in missing], model=model.name)
+                        store_embeddings(db, dict(zip(missing, vectors)), model.name)
+                        embedded += len(missing)
+                if rows:
+                    store_passages(db, rows, passages)
+                if embedded or rows:
+                    db.commit()
+            busy = time.perf_counter() - started
+            blocked = put(to_insert, [(t, m, d) for (t, m), d in zip(batch, digests)])
+            stats["embed"].record(len(batch), busy, blocked, embedded=embedded)
+
+    def insert_worker():
+        with get_session() as db:
+            while True:
+                batch = take(to_insert)
+                if batch is _DONE:
+                    return
+                started = time.perf_counter()
+                # the version bump goes first: its lock keeps the other inserters out of the floor..commit window
+                bump_version(db, user_id, branch)
+                floor = insert_floor(db, user_id, branch)
+                db.execute(insert(Memory), [
+                    {"user_id": user_id, "branch": branch, "text": t, "metadata_json": m, "content_hash": d}
+                    for t, m, d in batch
+                ])
+                record_change(db, user_id, branch, "add", inserted_ids(db, user_id, branch, floor))
+                db.commit()
+                stats["insert"].record(len(batch), time.perf_counter() - started)
+
+    embedders = [threading.Thread(target=guarded(embed_worker), name=f"atlas-ingest-embed-{i}", daemon=True)
+                 for i in range(embed_workers)]
+    inserters = [threading.Thread(target=guarded(insert_worker), name=f"atlas-ingest-insert-{i}", daemon=True)
+                 for i in range(insert_workers)]
+    for t in embedders + inserters:
+        t.start()
+
+    wall_started = time.perf_counter()
+    try:
+        read_started, batch = time.perf_counter(), []
+        for record in records:
+            batch.append(_normalize(record))
+            if len(batch) == batch_size:
+                busy = time.perf_counter() - read_started
+                blocked = put(to_embed, batch)
+                stats["read"].record(len(batch), busy, blocked)
+                if stop.is_set():
+                    break
+                read_started, batch = time.perf_counter(), []
+        if batch and not stop.is_set():
+            busy = time.perf_counter() - read_started
+            stats["read"].record(len(batch), busy, put(to_embed, batch))
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        for _ in embedders:
+            put(to_embed, _DONE)
+        for t in embedders:
+            t.join()
+        for _ in inserters:
+            put(to_insert, _DONE)
+        for t in inserters:
+            t.join()
+
+    if errors:
+        raise errors[0]
+
+    seconds = time.perf_counter() - wall_started
+    rows = stats["insert"].rows
+    return {
+        "rows": rows,
+        "embedded": stats["embed"].embedded,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds else None,
+        "stages": {name: s.report() for name, s in stats.items()},
+    }
+
+
+def read_records(path: str) -> Iterator[Tuple[str, Optional[dict]]]:
+    """Parse a corpus file lazily: .jsonl/.ndjson ({"text"|"content": ..., "metadata": ...}),
+    .csv (a "text" column, other columns become metadata) or plain text (one memory per line)."""
+    if path.endswith((".jsonl", ".ndjson")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield _normalize(json.loads(line))
+    elif path.endswith(".csv"):
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                yield _normalize(row)
+    else:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield line.strip(), None
+
+
+def _normalize(record: Record) -> Tuple[str, Optional[dict]]:
+    if isinstance(record, str):
+        return record, None
+    if isinstance(record, tuple):
+        return record[0], record[1]
+
+    record = dict(record)
+    text = record.pop("text", None) or record.pop("content", None)
+    if not text:
+        raise ValueError(f"Record has no 'text' or 'content': {record}")
+    metadata = record.pop("metadata", None)
+    # chat exports carry role, timestamp, etc. next to the text; keep them as metadata
+    if metadata is None and record:
+        metadata = record
+    return text, metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load memories from a chat history or text corpus.")
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--path", required=True, help=".jsonl/.ndjson, .csv or plain text")
+    parser.add_argument("--branch", default="main")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--embed-workers", type=int, default=EMBED_WORKERS)
+    parser.add_argument("--insert-workers", type=int, default=INSERT_WORKERS)
+    parser.add_argument("--queue-depth", type=int, default=QUEUE_DEPTH)
+    parser.add_argument("--chunk", action="store_true", help="split long texts into passages")
+    args = parser.parse_args()
+
+    report = ingest(
+        args.user, read_records(args.path), args.branch,
+        args.batch_size, args.embed_workers, args.insert_workers, args.queue_depth, args.chunk
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
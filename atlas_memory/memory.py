@@ -1,31 +1,196 @@
-from typing import Optional, List, Dict
-from sqlalchemy import text
+import json
+import time
+from typing import Optional, List, Sequence, Tuple
+import numpy as np
+from sqlalchemy import bindparam, text
 
 from atlas_memory.db import get_session
 from atlas_memory.schema import Memory
-from atlas_memory.embeddings import embed
+from atlas_memory.embeddings import embed, ensure_embeddings, decode_vectors, encode_vector
+from atlas_memory.registry import get_model
+from atlas_memory.branching import (
+    BranchScope, check_writable, materialize_dependents, resolve_branch, snapshot_connection
+)
+from atlas_memory.passages import POOLING_MODES, ensure_passages
+from atlas_memory.tiering import retrievals, search_archive
+from atlas_memory.vector_cache import bump_version, get_vector_cache
+from atlas_memory.changes import record_change
+from atlas_memory.results import RESULT_FIELDS, SearchResult, merge_ranked, result_fields, select_columns
+from atlas_memory.metrics import search_latency, search_metrics
+from atlas_memory.tracing import span
+from atlas_memory.diversity import MMR_POOL_FACTOR, mmr
+from atlas_memory.rerank import RERANK_BUDGET_MS, RERANK_CANDIDATES, rerank_available, rerank_scores
+
+DEDUP_POLICIES = ("skip", "merge", "count")
+DEDUP_THRESHOLD = 0.95
+
+# score of a memory from its passages' distances: best passage, or the sum over all of them
+_POOLED_SCORE = {
+    "max": "1 - MIN(vec_cosine_distance({vector}, :query_vec))",
+    "sum": "SUM(1 - vec_cosine_distance({vector}, :query_vec))",
+}
 
 
 def add_memory(
     user_id: str,
     content: str,
     metadata: Optional[dict] = None,
-    branch: str = "main"
+    branch: str = "main",
+    dedup: Optional[str] = None,
+    dedup_threshold: float = DEDUP_THRESHOLD,
+    chunk: bool = False
 ) -> int:
-    vector = embed(content)
+    return add_memories(user_id, [content], [metadata], branch, dedup, dedup_threshold, chunk)[0]
 
-    with get_session() as db:
+
+def add_memories(
+    user_id: str,
+    contents: List[str],
+    metadatas: Optional[List[Optional[dict]]] = None,
+    branch: str = "main",
+    dedup: Optional[str] = None,
+    dedup_threshold: float = DEDUP_THRESHOLD,
+    chunk: bool = False
+) -> List[int]:
+    """Insert `contents` into `branch`, embedding every new text in one batch.
+
+    With `chunk`, texts too long for the model are also split into passages (embedded in the
+    same batch) that search_memory(pooling=...) ranks them by.
+    """
+    check_writable(user_id, branch)
+    if dedup is not None and dedup not in DEDUP_POLICIES:
+        raise ValueError(f"Unknown dedup policy '{dedup}', expected one of {DEDUP_POLICIES}")
+
+    metadatas = metadatas or [None] * len(contents)
+    if len(metadatas) != len(contents):
+        raise ValueError("metadatas must be the same length as contents")
+
+    with span("add_memory", rows=len(contents), dedup=dedup), get_session() as db:
+        if dedup in ("merge", "count"):
+            # these update rows in place, which a high-water-mark snapshot of the branch would see
+            materialize_dependents(db, user_id, branch, watermark_only=True)
+        with span("embed"):
+            digests = ensure_passages(db, contents) if chunk else ensure_embeddings(db, contents)
+
+        with span("sql"):
+            if dedup is None:
+                memories = [
+                    Memory(user_id=user_id, text=c, metadata_json=m, content_hash=d, branch=branch)
+                    for c, m, d in zip(contents, metadatas, digests)
+                ]
+                db.add_all(memories)
+                db.flush()
+                ids = added = [m.id for m in memories]
+                updated = []
+            else:
+                scope = BranchScope(branch)
+                outcomes = [
+                    _add_deduplicated(db, user_id, c, m, d, scope, dedup, 1 - dedup_threshold)
+                    for c, m, d in zip(contents, metadatas, digests)
+                ]
+                ids = [memory_id for memory_id, _ in outcomes]
+                added = [memory_id for memory_id, outcome in outcomes if outcome == "added"]
+                updated = list(dict.fromkeys(memory_id for memory_id, outcome in outcomes if outcome == "updated"))
+            version = bump_version(db, user_id, branch)
+            # rows dedup skipped didn't change, so the feed doesn't hear about them
+            if added:
+                record_change(db, user_id, branch, "add", added)
+            if updated:
+                record_change(db, user_id, branch, "update", updated, dedup=dedup)
+
+        with span("commit"):
+            db.commit()
+
+        cache = get_vector_cache()
+        if cache is not None:
+            cache.write_through(db, user_id, branch, get_model(), version, ids, digests)
+        return ids
+
+
+def _add_deduplicated(db, user_id: str, content: str, metadata: Optional[dict], digest: str,
+                      scope: BranchScope, policy: str, max_distance: float) -> Tuple[int, Optional[str]]:
+    """The id `content` ended up under, and whether that row was "added", "updated" or left alone (None)."""
+    params = {
+        **scope.params(user_id),
+        "content_hash": digest,
+        "max_distance": max_distance,
+    }
+
+    if policy == "skip":
+        # the top-1 check and the insert go out as one statement
+        result = db.execute(text(f"""
+            INSERT INTO memories (user_id, branch, text, metadata_json, content_hash, occurrences)
+            SELECT :user_id, :branch, :text, :metadata_json, :content_hash, 1
+            FROM {scope.model.table_name} q
+            WHERE q.model = :model AND q.content_hash = :content_hash AND NOT EXISTS (
+                SELECT 1 FROM {scope.vector_table()}
+                WHERE {scope.where("m")}
+                  AND vec_cosine_distance({scope.vector_column}, q.embedding) <= :max_distance
+            )
+        """), {**params, "text": content, "metadata_json": _dump_json(metadata)})
+        if result.rowcount:
+            return result.lastrowid, "added"
+        nearest = _nearest_memory(db, scope, params)
+        if nearest is not None and nearest.distance <= max_distance:
+            return nearest.id, None
+        # the near-duplicate went away between the two statements: insert after all
+
+    nearest = None if policy == "skip" else _nearest_memory(db, scope, params)
+    if nearest is None or nearest.distance > max_distance:
         memory = Memory(
-            user_id=user_id,
-            text=content,
-            metadata_json=metadata,
-            embedding=vector,
-            branch=branch
+            user_id=user_id, text=content, metadata_json=metadata, content_hash=digest, branch=scope.branch
         )
         db.add(memory)
-        db.commit()
-        db.refresh(memory)
-        return memory.id
+        db.flush()
+        return memory.id, "added"
+
+    if policy == "merge":
+        merged = merge_metadata(_load_json(nearest.metadata_json), metadata)
+        db.execute(
+            text("UPDATE memories SET occurrences = occurrences + 1, metadata_json = :metadata_json "
+                 "WHERE id = :id AND user_id = :user_id"),
+            {"id": nearest.id, "user_id": user_id, "metadata_json": _dump_json(merged)}
+        )
+    else:
+        # user_id keeps the update on one partition when memories is partitioned
+        db.execute(
+            text("UPDATE memories SET occurrences = occurrences + 1 WHERE id = :id AND user_id = :user_id"),
+            {"id": nearest.id, "user_id": user_id}
+        )
+    return nearest.id, "updated"
+
+
+def _nearest_memory(db, scope: BranchScope, params: dict):
+    return db.execute(text(f"""
+        SELECT m.id, m.metadata_json,
+               vec_cosine_distance({scope.vector_column}, q.embedding) as distance
+        FROM {scope.vector_table()}
+        JOIN {scope.model.table_name} q ON q.model = :model AND q.content_hash = :content_hash
+        WHERE {scope.where("m")}
+        ORDER BY distance ASC
+        LIMIT 1
+    """), params).first()
+
+
+def merge_metadata(existing: Optional[dict], new: Optional[dict]) -> Optional[dict]:
+    if existing is None:
+        return new
+    merged = dict(existing)
+    for key, value in (new or {}).items():
+        old = merged.get(key)
+        if isinstance(old, list) and isinstance(value, list):
+            merged[key] = old + [v for v in value if v not in old]
+        else:
+            merged[key] = value
+    return merged
+
+
+def _load_json(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def _dump_json(value) -> Optional[str]:
+    return json.dumps(value) if value is not None else None
 
 
 def search_memory(
@@ -33,71 +198,282 @@ def search_memory(
     query: str,
     top_k: int = 5,
     branch: str = "main",
-    mode: str = "hybrid"
-) -> List[Dict]:
-    query_vector = embed(query)
+    mode: str = "hybrid",
+    query_vector: Optional[List[float]] = None,
+    pooling: Optional[str] = None,
+    fall_through: Optional[float] = None,
+    fields: Optional[Sequence[str]] = None,
+    diversify: Optional[float] = None,
+    rerank: bool = False,
+    rerank_budget_ms: Optional[float] = None
+) -> List[SearchResult]:
+    """Search the hot memories of `branch`.
 
+    With `fall_through`, archived memories are scanned too when the best hot result scores
+    below it (or nothing matched), and come back with "archived": True. `fields` picks which
+    of RESULT_FIELDS the SQL selects; id and score are always there. `diversify` is an MMR
+    lambda: results are picked from MMR_POOL_FACTOR * top_k candidates, trading relevance
+    (1.0) against similarity to the ones already picked (0.0). Scores stay first-stage scores.
+
+    With `rerank`, the first RERANK_CANDIDATES candidates are reordered by a cross-encoder
+    (see set_reranker). If it takes longer than `rerank_budget_ms` (RERANK_BUDGET_MS by
+    default) or fails, the first-stage order is returned instead. Scores stay first-stage scores here
+    too, and archived rows are slotted in by them without reordering the reranked rows.
+    """
+    if pooling is not None and pooling not in POOLING_MODES:
+        raise ValueError(f"Unknown pooling '{pooling}', expected one of {POOLING_MODES}")
+    if diversify is not None and not 0.0 <= diversify <= 1.0:
+        raise ValueError("diversify must be an MMR lambda between 0 and 1")
+    fields = result_fields(fields)
+
+    start = time.perf_counter()
+    # one registry read per search, so the query vector and the column it's compared to agree
+    model = get_model().name
+    with span("search_memory", mode=mode, top_k=top_k):
+        if query_vector is None:
+            with span("embed"):
+                query_vector = embed(query, model)
+
+        with get_session() as db:
+            scope = resolve_branch(db, user_id, branch, model)
+            args = (
+                user_id, query, query_vector, top_k, scope, mode, pooling, fall_through, fields, diversify,
+                (RERANK_BUDGET_MS if rerank_budget_ms is None else rerank_budget_ms) if rerank else None
+            )
+            if scope.stale_read:
+                with snapshot_connection() as conn:
+                    results = _search(conn, *args)
+            else:
+                results = _search(db, *args)
+
+    retrievals.record(user_id, (r.id for r in results if not r.archived))
+    search_metrics.incr("searches")
+    search_metrics.incr("results_returned", len(results))
+    search_latency.observe(time.perf_counter() - start)
+    return results
+
+
+def branch_vectors(user_id: str, branch: str = "main") -> Tuple[List[int], np.ndarray]:
+    """All ids in a branch with their vectors as one float32 matrix (rows in id order)."""
     with get_session() as db:
-        if mode == "vector":
-            return _vector_search(db, user_id, query_vector, top_k, branch)
-        elif mode == "fulltext":
-            return _fulltext_search(db, user_id, query, top_k, branch)
+        scope = resolve_branch(db, user_id, branch)
+        sql = text(f"""
+            SELECT m.id, {scope.vector_column} AS vector
+            FROM {scope.vector_table()}
+            WHERE {scope.where("m")}
+            ORDER BY m.id
+        """)
+        params = scope.params(user_id)
+        if scope.stale_read:
+            with snapshot_connection() as conn:
+                rows = conn.execute(sql, params).fetchall()
         else:
-            return _hybrid_search(db, user_id, query, query_vector, top_k, branch)
+            rows = db.execute(sql, params).fetchall()
 
+    rows = [r for r in rows if r.vector is not None]
+    return [r.id for r in rows], decode_vectors([r.vector for r in rows])
 
-def _vector_search(db, user_id: str, query_vector: list, top_k: int, branch: str) -> List[Dict]:
-    sql = text("""
-        SELECT id, text, metadata_json,
-               vec_cosine_distance(embedding, :query_vec) as distance
-        FROM memories
-        WHERE user_id = :user_id AND branch = :branch
-        ORDER BY distance ASC
-        LIMIT :top_k
-    """)
 
-    results = db.execute(sql, {
-        "query_vec": str(query_vector),
-        "user_id": user_id,
-        "branch": branch,
-        "top_k": top_k
-    }).fetchall()
+def _search(db, user_id: str, query: str, query_vector: list, top_k: int, scope: BranchScope, mode: str,
+            pooling: Optional[str] = None, fall_through: Optional[float] = None,
+            fields: Tuple[str, ...] = RESULT_FIELDS, diversify: Optional[float] = None,
+            rerank_budget_ms: Optional[float] = None) -> List[SearchResult]:
+    pool = top_k if diversify is None else top_k * MMR_POOL_FACTOR
+    # a search that will skip the cross-encoder doesn't need its wider pool
+    if rerank_budget_ms is not None and rerank_available():
+        pool = max(pool, RERANK_CANDIDATES)
+    if mode == "vector":
+        results = _vector_search(db, user_id, query_vector, pool, scope, pooling, fields)
+    elif mode == "fulltext":
+        results = _fulltext_search(db, user_id, query, pool, scope, fields)
+    else:
+        results = _hybrid_search(db, user_id, query, query_vector, pool, scope, pooling, fields)
+
+    relevance = None
+    if rerank_budget_ms is not None:
+        with span("cross_encoder", candidates=min(len(results), RERANK_CANDIDATES)):
+            results, relevance = _rerank(db, user_id, scope, query, results, rerank_budget_ms)
+    if diversify is not None:
+        with span("diversify", candidates=len(results)):
+            results = _diversify(db, user_id, scope, results, top_k, diversify, relevance)
+    results = results[:top_k]
+
+    # reordering stages can move the best first-stage score off the top
+    if fall_through is None or (results and max(r.score for r in results) >= fall_through):
+        return results
+    with span("archive"):
+        archived = search_archive(db, user_id, query, query_vector, top_k, scope, mode, fields)
+    return merge_ranked(results, archived, top_k)
+
+
+def _vector_search(db, user_id: str, query_vector: list, top_k: int, scope: BranchScope,
+                   pooling: Optional[str] = None, fields: Tuple[str, ...] = RESULT_FIELDS) -> List[SearchResult]:
+    cache = get_vector_cache()
+    if cache is not None and pooling is None and not scope.stale_read and scope.max_id is None:
+        with span("cache"):
+            hits = cache.search(db, user_id, scope, query_vector, top_k)
+        if hits is not None:
+            return _cached_results(db, user_id, scope, hits, fields)
+
+    columns = select_columns(fields, "m")
+    if pooling is None:
+        sql = text(f"""
+            SELECT m.id{columns},
+                   vec_cosine_distance({scope.vector_column}, :query_vec) as distance
+            FROM {scope.vector_table()}
+            WHERE {scope.where("m")}
+            ORDER BY distance ASC
+            LIMIT :top_k
+        """)
+    else:
+        # pool passage hits per parent first, then fetch text for the top_k winners only
+        sql = text(f"""
+            SELECT m.id{columns}, hits.score
+            FROM (
+                SELECT m.id, {_POOLED_SCORE[pooling].format(vector=scope.passage_vector_column)} as score
+                FROM {scope.passage_table()}
+                WHERE {scope.where("m")}
+                GROUP BY m.id
+                ORDER BY score DESC
+                LIMIT :top_k
+            ) hits
+            JOIN {scope.table("memories", "m")} ON m.id = hits.id
+            ORDER BY hits.score DESC
+        """)
+
+    with span("sql"):
+        results = db.execute(sql, {
+            **scope.params(user_id),
+            "query_vec": encode_vector(query_vector),
+            "top_k": top_k
+        }).fetchall()
+    search_metrics.incr("rows_returned_by_sql", len(results))
 
-    return [
-        {"id": r.id, "text": r.text, "metadata": r.metadata_json, "score": 1 - r.distance}
-        for r in results
-    ]
+    with span("decode"):
+        return [_result(r, r.score if pooling else 1 - r.distance, fields) for r in results]
 
 
-def _fulltext_search(db, user_id: str, query: str, top_k: int, branch: str) -> List[Dict]:
-    sql = text("""
-        SELECT id, text, metadata_json
-        FROM memories
-        WHERE user_id = :user_id AND branch = :branch AND text LIKE :pattern
+def _cached_results(db, user_id: str, scope: BranchScope, hits: List[Tuple[int, float]],
+                    fields: Tuple[str, ...]) -> List[SearchResult]:
+    columns = select_columns(fields)
+    if not hits or not columns:
+        return [SearchResult(i, score, fields=fields) for i, score in hits]
+    sql = text(f"""
+        SELECT id{columns} FROM {scope.table()}
+        WHERE {scope.where()} AND id IN :ids
+    """).bindparams(bindparam("ids", expanding=True))
+    with span("sql"):
+        rows = {r.id: r for r in db.execute(sql, {**scope.params(user_id), "ids": [i for i, _ in hits]})}
+    search_metrics.incr("rows_returned_by_sql", len(rows))
+
+    # rows deleted since the version check just drop out
+    return [_result(rows[i], score, fields) for i, score in hits if i in rows]
+
+
+def _result(row, score: float, fields: Tuple[str, ...]) -> SearchResult:
+    mapping = row._mapping
+    return SearchResult(row.id, score, mapping.get("text"), mapping.get("metadata_json"), fields)
+
+
+def _fulltext_search(db, user_id: str, query: str, top_k: int, scope: BranchScope,
+                     fields: Tuple[str, ...] = RESULT_FIELDS) -> List[SearchResult]:
+    sql = text(f"""
+        SELECT id{select_columns(fields)}
+        FROM {scope.table()}
+        WHERE {scope.where()} AND text LIKE :pattern
         LIMIT :top_k
     """)
 
-    results = db.execute(sql, {
-        "user_id": user_id,
-        "branch": branch,
-        "pattern": f"%{query}%",
-        "top_k": top_k
-    }).fetchall()
+    with span("sql"):
+        results = db.execute(sql, {
+            **scope.params(user_id),
+            "pattern": f"%{query}%",
+            "top_k": top_k
+        }).fetchall()
+    search_metrics.incr("rows_returned_by_sql", len(results))
 
-    return [
-        {"id": r.id, "text": r.text, "metadata": r.metadata_json, "score": 1.0}
-        for r in results
-    ]
+    with span("decode"):
+        return [_result(r, 1.0, fields) for r in results]
 
 
-def _hybrid_search(db, user_id: str, query: str, query_vector: list, top_k: int, branch: str) -> List[Dict]:
+def _hybrid_search(db, user_id: str, query: str, query_vector: list, top_k: int, scope: BranchScope,
+                   pooling: Optional[str] = None, fields: Tuple[str, ...] = RESULT_FIELDS) -> List[SearchResult]:
     # get more results than needed, then boost matches that also hit fulltext
-    vector_results = _vector_search(db, user_id, query_vector, top_k * 2, branch)
+    vector_results = _vector_search(db, user_id, query_vector, top_k * 2, scope, pooling, fields)
+    # summed passage scores aren't bounded by 1
+    ceiling = float("inf") if pooling == "sum" else 1.0
+
+    with span("rerank"):
+        query_lower = query.lower()
+        if "text" in fields:
+            hits = {r.id for r in vector_results if query_lower in r.text.lower()}
+        else:
+            hits = _text_hits(db, user_id, scope, [r.id for r in vector_results], query_lower)
+        for result in vector_results:
+            if result.id in hits:
+                result.score = min(result.score + 0.1, ceiling)
+
+        vector_results.sort(key=lambda x: x.score, reverse=True)
+        return vector_results[:top_k]
+
+
+def _rerank(db, user_id: str, scope: BranchScope, query: str, results: List[SearchResult],
+            budget_ms: float) -> Tuple[List[SearchResult], Optional[np.ndarray]]:
+    """`results` with the head reordered by the cross-encoder, and its scores scaled to 0..1 for MMR."""
+    head, tail = results[:RERANK_CANDIDATES], results[RERANK_CANDIDATES:]
+    if len(head) <= 1:
+        return results, None
+    if any(r.text is None for r in head):
+        sql = text(f"SELECT id, text FROM {scope.table()} WHERE {scope.where()} AND id IN :ids").bindparams(
+            bindparam("ids", expanding=True)
+        )
+        texts = dict(db.execute(sql, {**scope.params(user_id), "ids": [r.id for r in head]}).fetchall())
+    else:
+        texts = {r.id: r.text for r in head}
+
+    scores = rerank_scores(query, [texts.get(r.id, "") for r in head], budget_ms)
+    if scores is None:
+        return results, None
+    order = np.argsort(-scores, kind="stable")
+    spread = float(scores.max() - scores.min()) or 1.0
+    relevance = np.concatenate([(scores[order] - scores.min()) / spread, np.zeros(len(tail), dtype=np.float32)])
+    return [head[i] for i in order] + tail, relevance
+
+
+def _diversify(db, user_id: str, scope: BranchScope, results: List[SearchResult], top_k: int,
+               lambda_: float, relevance: Optional[np.ndarray] = None) -> List[SearchResult]:
+    if len(results) <= 1:
+        return results[:top_k]
+    sql = text(f"""
+        SELECT m.id, {scope.vector_column} AS vector
+        FROM {scope.vector_table()}
+        WHERE {scope.where("m")} AND m.id IN :ids
+    """).bindparams(bindparam("ids", expanding=True))
+    with span("sql"):
+        rows = db.execute(sql, {**scope.params(user_id), "ids": [r.id for r in results]}).fetchall()
+    found = {r.id: r.vector for r in rows if r.vector is not None}
+    if not found:
+        return results[:top_k]
+
+    vectors = decode_vectors(list(found.values()))
+    index = dict(zip(found, range(len(found))))
+    # a row without a vector is similar to nothing
+    matrix = np.zeros((len(results), vectors.shape[1]), dtype=np.float32)
+    for i, r in enumerate(results):
+        if r.id in index:
+            matrix[i] = vectors[index[r.id]]
+    if relevance is None:
+        relevance = np.array([r.score for r in results], dtype=np.float32)
+    picks = mmr(relevance, matrix, top_k, lambda_)
+    return [results[i] for i in picks]
 
-    query_lower = query.lower()
-    for result in vector_results:
-        if query_lower in result["text"].lower():
-            result["score"] = min(result["score"] + 0.1, 1.0)
 
-    vector_results.sort(key=lambda x: x["score"], reverse=True)
-    return vector_results[:top_k]
+def _text_hits(db, user_id: str, scope: BranchScope, ids: List[int], needle: str) -> set:
+    # without text in the projection, match on the server instead of shipping every candidate's text
+    if not ids:
+        return set()
+    sql = text(f"""
+        SELECT id FROM {scope.table()}
+        WHERE {scope.where()} AND id IN :ids AND INSTR(LOWER(text), :needle) > 0
+    """).bindparams(bindparam("ids", expanding=True))
+    return {r.id for r in db.execute(sql, {**scope.params(user_id), "ids": ids, "needle": needle})}
@@ -0,0 +1,181 @@
+import json
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, text
+
+from atlas_memory.db import get_session
+from atlas_memory.branching import (
+    BranchScope, _find_snapshot, _materialize, is_snapshot, materialize_dependents, resolve_branch
+)
+from atlas_memory.tracing import span
+from atlas_memory.vector_cache import bump_version, get_vector_cache
+from atlas_memory.changes import inserted_ids, insert_floor, record_change
+
+# union: add what the source has that the target lacks; mirror: also drop what the source lacks
+MERGE_STRATEGIES = ("union", "mirror")
+MERGE_BATCH_SIZE = 1000
+
+_COPY_COLUMNS = ("user_id", "text", "metadata_json", "embedding", "content_hash", "occurrences")
+
+
+def diff_branches(user_id: str, a: str, b: str, limit: Optional[int] = None) -> Dict[str, List[Dict]]:
+    """Memories of `b` that `a` lacks ("added") and of `a` that `b` lacks ("removed").
+
+    Rows match by content hash, in one anti-join per side, so neither branch is loaded into
+    Python. A row the other branch holds archived counts as present. Legacy rows with no
+    content hash (see migrate_inline_embeddings) never match.
+    """
+    with span("diff_branches"), get_session() as db:
+        left, right = _scope(db, user_id, a), _scope(db, user_id, b)
+        with span("sql"):
+            return {
+                "added": _missing(db, user_id, right, left, limit),
+                "removed": _missing(db, user_id, left, right, limit),
+            }
+
+
+def merge_branch(user_id: str, source: str, target: str = "main", strategy: str = "union",
+                 batch_size: int = MERGE_BATCH_SIZE) -> Dict:
+    """Apply the diff from `target` to `source` onto `target`, `batch_size` id range per transaction.
+
+    Each chunk is one INSERT ... SELECT (and with "mirror", one DELETE) whose anti-join skips
+    rows that already match, so only the differing rows are written. A merge stopped halfway
+    can simply be run again.
+    """
+    if strategy not in MERGE_STRATEGIES:
+        raise ValueError(f"Unknown merge strategy '{strategy}', expected one of {MERGE_STRATEGIES}")
+    if source == target:
+        raise ValueError("Can't merge a branch into itself")
+
+    report = {"source": source, "target": target, "strategy": strategy, "added": 0, "removed": 0}
+    with span("merge_branch", strategy=strategy), get_session() as db:
+        src = _scope(db, user_id, source)
+        point = _find_snapshot(db, user_id, target) if is_snapshot(target) else None
+        if point is not None and not point.materialized:
+            # a snapshot target gets its own rows before it's written to
+            _materialize(db, point)
+        materialize_dependents(db, user_id, target)
+        db.commit()
+        dst = BranchScope(target)
+
+        if strategy == "mirror":
+            report["removed"] = _chunked(db, user_id, dst, batch_size, lambda after, upto: _delete_missing(
+                db, user_id, dst, src, after, upto
+            ))
+        report["added"] = _chunked(db, user_id, src, batch_size, lambda after, upto: _insert_missing(
+            db, user_id, src, dst, after, upto
+        ))
+
+    cache = get_vector_cache()
+    if cache is not None and (report["added"] or report["removed"]):
+        cache.discard(user_id, target)
+    return report
+
+
+def _scope(db, user_id: str, branch: str) -> BranchScope:
+    scope = resolve_branch(db, user_id, branch)
+    if scope.stale_read:
+        # AS OF TIMESTAMP can't be joined with current rows, so the snapshot gets its own first
+        _materialize(db, _find_snapshot(db, user_id, branch))
+        scope = BranchScope(branch)
+    return scope
+
+
+def _side(scope: BranchScope, alias: str) -> Tuple[str, dict]:
+    """`scope`'s rows as a WHERE clause over `alias`, with parameters named after the alias."""
+    clause = f"{alias}.user_id = :user_id AND {alias}.branch = :{alias}_branch"
+    params = {f"{alias}_branch": scope.branch}
+    if scope.max_id is not None:
+        clause += f" AND {alias}.id <= :{alias}_max_id"
+        params[f"{alias}_max_id"] = scope.max_id
+    return clause, params
+
+
+def _absent(scope: BranchScope) -> Tuple[str, dict]:
+    """A condition true when no row of `scope`, hot or archived, has s.content_hash."""
+    clause, params = _side(scope, "o")
+    archived, archived_params = _side(scope, "oa")
+    return f"""
+        NOT EXISTS (SELECT 1 FROM memories o WHERE {clause} AND o.content_hash = s.content_hash)
+        AND NOT EXISTS (SELECT 1 FROM memory_archive oa WHERE {archived} AND oa.content_hash = s.content_hash)
+    """, {**params, **archived_params}
+
+
+def _missing(db, user_id: str, scope: BranchScope, other: BranchScope, limit: Optional[int]) -> List[Dict]:
+    clause, params = _side(scope, "s")
+    absent, absent_params = _absent(other)
+    sql = f"""
+        SELECT s.id, s.text, s.metadata_json, s.content_hash
+        FROM memories s
+        WHERE {clause} AND {absent}
+        ORDER BY s.id
+    """
+    if limit is not None:
+        sql += " LIMIT :limit"
+    rows = db.execute(text(sql), {**params, **absent_params, "user_id": user_id, "limit": limit}).fetchall()
+    return [
+        {
+            "id": r.id,
+            "text": r.text,
+            "metadata": json.loads(r.metadata_json) if isinstance(r.metadata_json, str) else r.metadata_json,
+            "content_hash": r.content_hash,
+        }
+        for r in rows
+    ]
+
+
+def _chunked(db, user_id: str, scope: BranchScope, batch_size: int, apply) -> int:
+    """Run `apply(after, upto)` over `scope`'s id ranges, one transaction each."""
+    total, after = 0, 0
+    clause, params = _side(scope, "s")
+    while True:
+        upto = db.execute(text(f"""
+            SELECT MAX(id) FROM (
+                SELECT s.id FROM memories s WHERE {clause} AND s.id > :after ORDER BY s.id LIMIT :limit
+            ) chunk
+        """), {**params, "user_id": user_id, "after": after, "limit": batch_size}).scalar()
+        if upto is None:
+            return total
+        total += apply(after, upto)
+        db.commit()
+        after = upto
+
+
+def _insert_missing(db, user_id: str, src: BranchScope, dst: BranchScope, after: int, upto: int) -> int:
+    clause, params = _side(src, "s")
+    absent, absent_params = _absent(dst)
+    columns = ", ".join(_COPY_COLUMNS)
+    # read in the snapshot _chunked's range query opened, like the INSERT below
+    floor = insert_floor(db, user_id, dst.branch)
+    result = db.execute(text(f"""
+        INSERT INTO memories (branch, {columns})
+        SELECT :target, {", ".join("s." + c for c in _COPY_COLUMNS)}
+        FROM memories s
+        WHERE {clause} AND s.id > :after AND s.id <= :upto AND {absent}
+    """), {**params, **absent_params, "user_id": user_id, "target": dst.branch, "after": after, "upto": upto})
+    if result.rowcount:
+        bump_version(db, user_id, dst.branch)
+        record_change(db, user_id, dst.branch, "merge", inserted_ids(db, user_id, dst.branch, floor),
+                      source=src.branch, added=result.rowcount)
+    return result.rowcount
+
+
+def _delete_missing(db, user_id: str, dst: BranchScope, src: BranchScope, after: int, upto: int) -> int:
+    # ids first: MySQL won't DELETE from a table its own subquery reads
+    clause, params = _side(dst, "s")
+    absent, absent_params = _absent(src)
+    ids = db.execute(text(f"""
+        SELECT s.id FROM memories s
+        WHERE {clause} AND s.id > :after AND s.id <= :upto AND {absent}
+    """), {**params, **absent_params, "user_id": user_id, "after": after, "upto": upto}).scalars().all()
+    if not ids:
+        return 0
+    for i in range(0, len(ids), 500):
+        db.execute(
+            text("DELETE FROM memories WHERE user_id = :user_id AND id IN :ids").bindparams(
+                bindparam("ids", expanding=True)
+            ),
+            {"user_id": user_id, "ids": ids[i:i + 500]}
+        )
+    bump_version(db, user_id, dst.branch)
+    record_change(db, user_id, dst.branch, "merge", ids, source=src.branch, removed=len(ids))
+    return len(ids)
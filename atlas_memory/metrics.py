@@ -0,0 +1,100 @@
+import bisect
+import threading
+from typing import Sequence
+
+
+class Counters:
+    """Thread-safe named counters, cheap enough to bump on every call and read at scrape time."""
+
+    def __init__(self, *names: str):
+        self._lock = threading.Lock()
+        self._values = {name: 0 for name in names}
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + value
+
+    def observe_max(self, name: str, value: float):
+        with self._lock:
+            self._values[name] = max(self._values.get(name, 0), value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+
+class LatencyHistogram:
+    """Thread-safe fixed-bucket histogram of durations in seconds, in Prometheus' cumulative shape."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self._lock = threading.Lock()
+        self._buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self._buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, seconds: float):
+        index = bisect.bisect_left(self._buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += seconds
+
+    def snapshot(self) -> dict:
+        """{"buckets": [(upper bound, cumulative count), ...], "count": n, "sum": seconds}; the last bound is inf."""
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative, running = [], 0
+        for bound, count in zip(self._buckets + (float("inf"),), counts):
+            running += count
+            cumulative.append((bound, running))
+        return {"buckets": cumulative, "count": running, "sum": total}
+
+
+# same buckets as the web UI's request latency histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+embedding_metrics = Counters(
+    "queries_embedded",   # single-text embed() calls
+    "batches",            # embed_batch() calls
+    "texts_embedded",     # texts sent to the model in batches
+    "largest_batch",
+    "cache_hits",         # texts whose vector was already stored
+    "cache_misses",
+)
+
+search_metrics = Counters(
+    "searches",
+    "rows_returned_by_sql",  # rows the search queries returned; the database may have scanned many more
+    "results_returned",
+    "cached_searches",    # vector searches served from the in-process cache
+    "cache_loads",        # branches (re)loaded into it
+    "reranked",           # searches reordered by the cross-encoder
+    "rerank_timeouts",    # ... that ran past their budget and kept the first-stage order
+    "rerank_skipped",     # ... that found every rerank worker busy
+    "rerank_errors",      # ... whose reranker raised
+)
+search_latency = LatencyHistogram(LATENCY_BUCKETS)
+
+buffer_metrics = Counters(
+    "queued",             # writes waiting in a write buffer or being written, across all buffers
+    "batches_flushed",    # batches the writer threads committed
+    "memories_flushed",
+    "batches_failed",     # batches whose add_memories raised
+    "memories_failed",
+    "flush_seconds",      # time spent writing batches
+)
+
+
+def embedding_stats() -> dict:
+    return embedding_metrics.snapshot()
+
+
+def search_stats() -> dict:
+    return search_metrics.snapshot()
+
+
+def search_latency_stats() -> dict:
+    return search_latency.snapshot()
+
+
+def buffer_stats() -> dict:
+    return buffer_metrics.snapshot()
@@ -0,0 +1,202 @@
+import argparse
+import json
+import re
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text
+
+from atlas_memory.db import engine, get_session, get_autocommit_connection
+from atlas_memory.schema import MEMORY_PARTITIONS, Memory, partitioned_memories
+from atlas_memory.memory import search_memory
+from atlas_memory.branching import list_branches
+from atlas_memory.profiling import profile
+
+DEFAULT_PARTITIONS = MEMORY_PARTITIONS or 64
+MIGRATION_BATCH_SIZE = 5000
+PARTITIONED_TABLE = "memories_partitioned"
+RETIRED_TABLE = "memories_unpartitioned"
+
+# writers keep inserting into the old table until the rename, so the new counter starts this far ahead
+_ID_GAP = 100000
+_COLUMNS = ", ".join(c.name for c in Memory.__table__.columns)
+# everything a write can change, folded into one checksum per chunk
+_ROW_DIGEST = (
+    "CRC32(CONCAT_WS('#', id, user_id, branch, content_hash, occurrences, metadata_json, "
+    "embedding IS NULL, updated_at, last_retrieved_at))"
+)
+_TIDB_PARTITION = re.compile(r"partition:([\w,]+)")
+
+
+def migrate_memories(
+    partitions: int = DEFAULT_PARTITIONS,
+    batch_size: int = MIGRATION_BATCH_SIZE,
+    pause: float = 0.0,
+    cutover: bool = True
+) -> Dict:
+    """Move memories into a KEY(user_id)-partitioned copy while it stays in use, then swap them.
+
+    Rows are copied in id ranges of `batch_size`, one transaction each, sleeping `pause`
+    seconds in between; a stopped run resumes from the copy's highest id. Chunks whose checksum
+    differs afterwards (rows updated or deleted since they were copied) are copied again. With
+    `cutover` the tables are swapped in one RENAME, and rows inserted during the swap follow.
+    Updates that land between the last sync and the rename are lost, so cut over while writes
+    are quiet. The old table is kept as memories_unpartitioned.
+    """
+    if engine.dialect.name != "mysql":
+        raise ValueError("Partitioning needs TiDB or MySQL")
+    if is_partitioned():
+        return {"partitioned": True, "copied": 0, "resynced": 0, "cutover": False}
+
+    partitioned_memories(PARTITIONED_TABLE, partitions).create(bind=engine, checkfirst=True)
+    report = {"partitioned": False, "partitions": partitions, "copied": 0, "resynced": 0, "cutover": False}
+
+    report["copied"] += _copy_new("memories", PARTITIONED_TABLE, batch_size, pause)
+    report["resynced"] += _sync(batch_size, pause)
+    if not cutover:
+        return report
+
+    # the second pass only has the chunks written to since the first
+    report["copied"] += _copy_new("memories", PARTITIONED_TABLE, batch_size, pause)
+    report["resynced"] += _sync(batch_size, 0.0)
+    with get_session() as db:
+        high = db.execute(text("SELECT MAX(id) FROM memories")).scalar() or 0
+        db.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} AUTO_INCREMENT = {high + _ID_GAP}"))
+        db.execute(text(
+            f"RENAME TABLE memories TO {RETIRED_TABLE}, {PARTITIONED_TABLE} TO memories"
+        ))
+    # rows inserted between the sync and the rename, below the new table's counter
+    report["copied"] += _copy_new(RETIRED_TABLE, "memories", batch_size, 0.0, after=high)
+    report["cutover"] = report["partitioned"] = True
+    return report
+
+
+def is_partitioned(table: str = "memories") -> bool:
+    if engine.dialect.name != "mysql":
+        return False
+    with get_session() as db:
+        return db.execute(text("""
+            SELECT COUNT(*) FROM information_schema.partitions
+            WHERE table_schema = DATABASE() AND table_name = :table AND partition_name IS NOT NULL
+        """), {"table": table}).scalar() > 0
+
+
+def check_pruning(user_id: str, branch: str = "main") -> List[Dict]:
+    """EXPLAIN what searches and branch listing send for `user_id`, and which partitions each reads.
+
+    A query on memories without a user_id filter shows up with pruned=False.
+    """
+    if engine.dialect.name != "mysql":
+        raise ValueError("Partition pruning only applies to TiDB or MySQL")
+    with profile() as queries:
+        for mode in ("vector", "fulltext", "hybrid"):
+            search_memory(user_id, "partition pruning check", branch=branch, mode=mode)
+        list_branches(user_id)
+
+    report = []
+    with get_autocommit_connection() as conn:
+        for q in queries:
+            if q["executemany"] or not q["sql"].lstrip().upper().startswith("SELECT") or "memories" not in q["sql"]:
+                continue
+            rows = conn.exec_driver_sql("EXPLAIN " + q["sql"], q["params"] or None).fetchall()
+            read, pruned = plan_partitions([dict(r._mapping) for r in rows])
+            report.append({"sql": " ".join(q["sql"].split())[:120], "partitions": read, "pruned": pruned})
+    return report
+
+
+def plan_partitions(rows: List[Dict]) -> Tuple[List[str], bool]:
+    """Partitions an EXPLAIN reads, and whether that is fewer than all of them.
+
+    TiDB reports them in `access object` (partition:p3, or partition:all), MySQL in `partitions`.
+    """
+    read, pruned = [], True
+    for row in rows:
+        values = {str(k).lower(): v for k, v in row.items()}
+        match = _TIDB_PARTITION.search(str(values.get("access object") or ""))
+        names = match.group(1).split(",") if match else str(values.get("partitions") or "").split(",")
+        names = [n for n in names if n]
+        if "all" in names or len(names) > 1:
+            pruned = False
+        read.extend(n for n in names if n not in read)
+    return read, pruned
+
+
+def _copy_new(source: str, target: str, batch_size: int, pause: float, after: Optional[int] = None) -> int:
+    """Copy rows of `source` above `after` (default: the highest id already copied), one id range at a time."""
+    copied = 0
+    if after is None:
+        with get_session() as db:
+            after = db.execute(text(f"SELECT MAX(id) FROM {target}")).scalar() or 0
+
+    while True:
+        with get_session() as db:
+            upto = _range_end(db, source, after, batch_size)
+            if upto is None:
+                return copied
+            result = db.execute(text(f"""
+                INSERT IGNORE INTO {target} ({_COLUMNS})
+                SELECT {_COLUMNS} FROM {source} WHERE id > :after AND id <= :upto
+            """), {"after": after, "upto": upto})
+            db.commit()
+        copied += result.rowcount
+        after = upto
+        if pause:
+            time.sleep(pause)
+
+
+def _sync(batch_size: int, pause: float) -> int:
+    """Re-copy the id ranges whose rows changed in memories after they were copied."""
+    resynced, after = 0, 0
+    while True:
+        with get_session() as db:
+            upto = _range_end(db, "memories", after, batch_size)
+            if upto is None:
+                # copied rows whose ids are all past the source's end were deleted since
+                db.execute(text(f"DELETE FROM {PARTITIONED_TABLE} WHERE id > :after"), {"after": after})
+                db.commit()
+                return resynced
+            params = {"after": after, "upto": upto}
+            if _checksum(db, "memories", params) != _checksum(db, PARTITIONED_TABLE, params):
+                db.execute(text(f"DELETE FROM {PARTITIONED_TABLE} WHERE id > :after AND id <= :upto"), params)
+                result = db.execute(text(f"""
+                    INSERT INTO {PARTITIONED_TABLE} ({_COLUMNS})
+                    SELECT {_COLUMNS} FROM memories WHERE id > :after AND id <= :upto
+                """), params)
+                db.commit()
+                resynced += result.rowcount
+                if pause:
+                    time.sleep(pause)
+        after = upto
+
+
+def _range_end(db, table: str, after: int, batch_size: int) -> Optional[int]:
+    return db.execute(text(f"""
+        SELECT MAX(id) FROM (SELECT id FROM {table} WHERE id > :after ORDER BY id LIMIT :limit) chunk
+    """), {"after": after, "limit": batch_size}).scalar()
+
+
+def _checksum(db, table: str, params: dict) -> tuple:
+    return tuple(db.execute(text(f"""
+        SELECT COUNT(*), BIT_XOR({_ROW_DIGEST}) FROM {table} WHERE id > :after AND id <= :upto
+    """), params).first())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition the memories table by user, online.")
+    parser.add_argument("--partitions", type=int, default=DEFAULT_PARTITIONS)
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between chunks")
+    parser.add_argument("--no-cutover", action="store_true", help="copy and sync, but keep reading the old table")
+    parser.add_argument("--check", metavar="USER_ID", help="EXPLAIN a user's queries and report partition pruning")
+    args = parser.parse_args()
+
+    if args.check:
+        report = check_pruning(args.check)
+        print(json.dumps(report, indent=2))
+        sys.exit(0 if all(q["pruned"] for q in report) else 1)
+    report = migrate_memories(args.partitions, args.batch_size, args.pause, not args.no_cutover)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
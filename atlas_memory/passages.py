@@ -0,0 +1,88 @@
+import os
+import re
+from typing import List, Optional, Tuple
+from sqlalchemy import bindparam, insert, text
+
+from atlas_memory.schema import Passage
+from atlas_memory.embeddings import content_hash, ensure_embeddings
+
+# MiniLM truncates at 256 word pieces, roughly 180 words of English
+PASSAGE_WORDS = int(os.getenv("ATLAS_PASSAGE_WORDS", "160"))
+PASSAGE_OVERLAP = int(os.getenv("ATLAS_PASSAGE_OVERLAP", "32"))
+POOLING_MODES = ("max", "sum")
+
+_WORD = re.compile(r"\S+")
+
+
+def split_passages(content: str, max_words: int = PASSAGE_WORDS, overlap: int = PASSAGE_OVERLAP) -> List[Tuple[int, int]]:
+    """(start, end) character spans of overlapping passages, or [] if `content` fits in one."""
+    words = [m.span() for m in _WORD.finditer(content)]
+    if len(words) <= max_words:
+        return []
+
+    spans, start = [], 0
+    while True:
+        end = min(start + max_words, len(words))
+        if end < len(words):
+            # end on a sentence boundary when there is one in the back half of the window
+            for i in range(end - 1, start + max_words // 2, -1):
+                if content[words[i][1] - 1] in ".!?":
+                    end = i + 1
+                    break
+        spans.append((words[start][0], words[end - 1][1]))
+        if end == len(words):
+            return spans
+        start = max(end - overlap, start + 1)
+
+
+def plan_passages(db, contents: List[str]) -> Tuple[List[dict], List[str]]:
+    """Passage rows (without their content_hash) and texts for long `contents` not split yet."""
+    long = {}
+    for c in contents:
+        spans = split_passages(c)
+        if spans:
+            long[content_hash(c)] = (c, spans)
+    if not long:
+        return [], []
+
+    done = chunked_hashes(db, list(long))
+    rows, passages = [], []
+    for parent, (content, spans) in long.items():
+        if parent in done:
+            continue
+        for position, (start, end) in enumerate(spans):
+            rows.append({"parent_hash": parent, "position": position, "start_char": start, "end_char": end})
+            passages.append(content[start:end])
+    return rows, passages
+
+
+def store_passages(db, rows: List[dict], passages: List[str]):
+    for row, passage in zip(rows, passages):
+        row["content_hash"] = content_hash(passage)
+    # two writers splitting the same text produce the same rows, the first insert wins
+    stmt = insert(Passage).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+    db.execute(stmt, rows)
+
+
+def ensure_passages(db, contents: List[str], model: Optional[str] = None) -> List[str]:
+    """ensure_embeddings() for `contents` that also splits the long ones into passages.
+
+    Parents and every new passage go to the model as one batch. Returns the parents' content hashes.
+    """
+    rows, passages = plan_passages(db, contents)
+    digests = ensure_embeddings(db, list(contents) + passages, model)
+    if rows:
+        store_passages(db, rows, passages)
+    return digests[:len(contents)]
+
+
+def chunked_hashes(db, digests: List[str]) -> set:
+    sql = text(
+        "SELECT DISTINCT parent_hash FROM passages WHERE parent_hash IN :digests"
+    ).bindparams(bindparam("digests", expanding=True))
+
+    found = set()
+    for i in range(0, len(digests), 500):
+        rows = db.execute(sql, {"digests": digests[i:i + 500]}).fetchall()
+        found.update(r.parent_hash for r in rows)
+    return found
@@ -0,0 +1,143 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from sqlalchemy import bindparam, text
+
+from atlas_memory.db import get_session
+from atlas_memory.schema import SavePoint
+from atlas_memory.branching import maintain_snapshots, materialize_dependents
+from atlas_memory.vector_cache import bump_version
+from atlas_memory.changes import record_change
+
+logger = logging.getLogger(__name__)
+
+REAP_BATCH_SIZE = 1000
+REAP_INTERVAL = float(os.getenv("ATLAS_REAP_INTERVAL", "60"))
+# deletes are cheap per row but hold locks and churn the indexes foreground queries use
+REAP_ROWS_PER_SECOND = float(os.getenv("ATLAS_REAP_ROWS_PER_SECOND", "5000"))
+
+
+def reap_branches(
+    batch_size: int = REAP_BATCH_SIZE,
+    rows_per_second: Optional[float] = REAP_ROWS_PER_SECOND,
+    max_branches: Optional[int] = None
+) -> Dict:
+    """Delete branches whose TTL has passed, `batch_size` rows per transaction.
+
+    The save point goes last, so a reap that stops halfway is picked up again by the next one.
+    `rows_per_second` paces the deletes (None or 0 for unthrottled).
+    """
+    started = time.perf_counter()
+    report = {"branches": [], "memories_deleted": 0, "archived_deleted": 0}
+
+    with get_session() as db:
+        expired = db.query(SavePoint.user_id, SavePoint.branch).filter(
+            SavePoint.expires_at.isnot(None),
+            SavePoint.expires_at <= _utcnow(),
+        ).distinct().order_by(SavePoint.user_id, SavePoint.branch).limit(max_branches).all()
+
+    for user_id, branch in expired:
+        params = {"user_id": user_id, "branch": branch}
+        with get_session() as db:
+            # snapshots reading through this branch need their own rows before it goes
+            materialize_dependents(db, user_id, branch)
+
+        for table, counter in (("memories", "memories_deleted"), ("memory_archive", "archived_deleted")):
+            select = text(f"""
+                SELECT id FROM {table} WHERE user_id = :user_id AND branch = :branch
+                ORDER BY id LIMIT :limit
+            """)
+            delete = text(
+                f"DELETE FROM {table} WHERE user_id = :user_id AND branch = :branch AND id IN :ids"
+            ).bindparams(bindparam("ids", expanding=True))
+            while True:
+                with get_session() as db:
+                    ids = [r.id for r in db.execute(select, {**params, "limit": batch_size})]
+                    if not ids:
+                        break
+                    db.execute(delete, {**params, "ids": ids})
+                    bump_version(db, user_id, branch)
+                    db.commit()
+                report[counter] += len(ids)
+                _pace(started, report["memories_deleted"] + report["archived_deleted"], rows_per_second)
+
+        with get_session() as db:
+            db.query(SavePoint).filter(SavePoint.user_id == user_id, SavePoint.branch == branch).delete()
+            record_change(db, user_id, branch, "delete_branch", expired=True)
+            db.commit()
+        report["branches"].append({"user_id": user_id, "branch": branch})
+
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+class BranchReaper:
+    """Runs reap_branches() and maintain_snapshots() every `interval` seconds on a daemon thread."""
+
+    def __init__(self, interval: float = REAP_INTERVAL, **options):
+        self.interval = interval
+        self.options = options
+        self.last_report: Optional[Dict] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "BranchReaper":
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="atlas-reaper", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.last_report = reap_branches(**self.options)
+                if self.last_report["branches"]:
+                    logger.info("Reaped expired branches: %s", self.last_report)
+            except Exception:
+                # the next pass resumes wherever this one stopped
+                logger.exception("Failed to reap expired branches")
+            try:
+                # stale-read snapshots have to be copied before GC passes them, however long we run
+                materialized = maintain_snapshots()
+                if materialized:
+                    logger.info("Materialized %d rows of expiring snapshots", materialized)
+            except Exception:
+                logger.exception("Failed to materialize expiring snapshots")
+            self._stop.wait(self.interval)
+
+
+def _pace(started: float, rows: int, rows_per_second: Optional[float]):
+    if rows_per_second:
+        ahead = rows / rows_per_second - (time.perf_counter() - started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete branches whose TTL has passed.")
+    parser.add_argument("--batch-size", type=int, default=REAP_BATCH_SIZE)
+    parser.add_argument("--rows-per-second", type=float, default=REAP_ROWS_PER_SECOND, help="0 for unthrottled")
+    parser.add_argument("--max-branches", type=int)
+    args = parser.parse_args()
+
+    print(json.dumps(reap_branches(args.batch_size, args.rows_per_second, args.max_branches), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+import argparse
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, text
+from sqlalchemy.sql import func
+
+from atlas_memory.db import engine, get_session
+from atlas_memory.schema import EmbeddingModel
+from atlas_memory.embeddings import decode_vectors, encoder, embed_batch, existing_hashes, store_embeddings
+from atlas_memory.registry import (
+    DEFAULT_DIM, DEFAULT_MODEL, ModelVersion, get_model, invalidate, model_table_name, model_versions
+)
+from atlas_memory.tiering import quantize
+
+BATCH_SIZE = 256
+
+# backfill order: every distinct memory text, every archived one, then every passage
+_PHASES = ("memories", "archive", "passages", "done")
+# passages outlive their parent when every row with that text is deleted; those don't need vectors
+_PARENT_EXISTS = "EXISTS (SELECT 1 FROM memories pm WHERE pm.content_hash = p.parent_hash)"
+
+
+def register_model(name: str) -> ModelVersion:
+    """Start backfilling `name` into a vector table of its own. New writes embed for it from now on."""
+    version = model_versions(refresh=True).get(name)
+    if version is not None and version.status != "retired":
+        return version
+
+    dim = version.dim if version is not None else encoder(name).get_sentence_embedding_dimension()
+    table_name = model_table_name(name)
+    # the table has to exist before writers see the model and start writing to it
+    ModelVersion(name, dim, table_name, "backfilling").table.create(bind=engine, checkfirst=True)
+
+    with get_session() as db:
+        if db.get(EmbeddingModel, DEFAULT_MODEL) is None:
+            # the original model predates the registry; give it a row so it can be retired
+            default = model_versions()[DEFAULT_MODEL]
+            db.add(EmbeddingModel(name=DEFAULT_MODEL, dim=DEFAULT_DIM, table_name=default.table_name,
+                                  status=default.status))
+            db.flush()
+
+        row = db.get(EmbeddingModel, name)
+        if row is None:
+            row = EmbeddingModel(name=name, dim=dim, table_name=table_name)
+            db.add(row)
+        # a retired model coming back has missed every write since it was retired, so start over
+        row.status, row.phase, row.checkpoint, row.backfilled = "backfilling", _PHASES[0], "", 0
+        db.commit()
+
+    invalidate()
+    return get_model(name)
+
+
+def reembed(
+    model: str,
+    batch_size: int = BATCH_SIZE,
+    rows_per_second: Optional[float] = None,
+    max_batches: Optional[int] = None,
+    activate: bool = False
+) -> Dict:
+    """Backfill `model`'s vectors for every memory and passage, then optionally switch searches to it.
+
+    Each batch's vectors and the checkpoint after it commit together, so a stopped run resumes
+    where it left off. `rows_per_second` caps the pace so live traffic keeps the database and the
+    model. Searches keep using the active model until activate_model() flips the registry.
+    """
+    version = register_model(model)
+    started = time.perf_counter()
+    scanned = embedded = batches = 0
+
+    while max_batches is None or batches < max_batches:
+        with get_session() as db:
+            state = db.get(EmbeddingModel, version.name)
+            if state.phase == "done":
+                break
+            keys, texts = _next_batch(db, state, batch_size)
+            if texts:
+                found = existing_hashes(db, list(texts), version.name)
+                missing = [d for d in texts if d not in found]
+                if missing:
+                    vectors = embed_batch([texts[d] for d in missing], model=version.name)
+                    store_embeddings(db, dict(zip(missing, vectors)), version.name)
+                state.backfilled += len(missing)
+                embedded += len(missing)
+            db.commit()
+
+        scanned += keys
+        batches += 1
+        _throttle(started, scanned, rows_per_second)
+
+    report = {"model": version.name, "scanned": scanned, "embedded": embedded, **coverage(version.name)}
+    if activate and report["complete"]:
+        activate_model(version.name)
+        report["active"] = True
+    return report
+
+
+def activate_model(model: str, batch_size: int = BATCH_SIZE) -> ModelVersion:
+    """Point every search at `model` in one transaction, once its vectors cover every memory and passage.
+
+    Rows written since the backfill passed them are embedded first. Other processes pick the
+    switch up within ATLAS_MODEL_REFRESH seconds. Archived rows get int8 vectors from `model`
+    right after the switch; until then search_archive() reads their shared vectors instead.
+    """
+    version = get_model(model)
+    if version.status == "active":
+        return version
+
+    _catch_up(version, batch_size)
+    report = coverage(version.name)
+    if not report["complete"]:
+        raise ValueError(f"'{version.name}' doesn't cover every memory yet: {report}")
+
+    with get_session() as db:
+        db.query(EmbeddingModel).filter(EmbeddingModel.status == "active").update({"status": "retired"})
+        db.query(EmbeddingModel).filter(EmbeddingModel.name == version.name).update(
+            {"status": "active", "phase": "done", "activated_at": func.now()}
+        )
+        db.commit()
+    invalidate()
+    requantize_archive(version.name, batch_size)
+    return get_model(version.name)
+
+
+def requantize_archive(model: str, batch_size: int = BATCH_SIZE) -> int:
+    """Re-encode archived rows whose int8 vector came from another model, `batch_size` per transaction."""
+    version = get_model(model)
+    select = text(f"""
+        SELECT a.user_id, a.branch, a.id, v.embedding
+        FROM memory_archive a
+        JOIN {version.table_name} v ON v.model = :model AND v.content_hash = a.content_hash
+        WHERE a.model != :model
+        LIMIT :limit
+    """)
+    update = text("""
+        UPDATE memory_archive SET model = :model, vector = :vector, scale = :scale
+        WHERE user_id = :user_id AND branch = :branch AND id = :id
+    """)
+    requantized = 0
+    while True:
+        with get_session() as db:
+            rows = db.execute(select, {"model": version.name, "limit": batch_size}).fetchall()
+            if not rows:
+                return requantized
+            vectors, scales = quantize(decode_vectors([r.embedding for r in rows]))
+            db.execute(update, [
+                {"model": version.name, "vector": v.tobytes(), "scale": float(sc),
+                 "user_id": r.user_id, "branch": r.branch, "id": r.id}
+                for r, v, sc in zip(rows, vectors, scales)
+            ])
+            db.commit()
+        requantized += len(rows)
+
+
+def coverage(model: str) -> Dict:
+    """How many distinct memory, archived and passage texts have a vector from `model`."""
+    version = get_model(model)
+    params = {"model": version.name}
+    with get_session() as db:
+        memories = db.execute(text(f"""
+            SELECT COUNT(DISTINCT m.content_hash) AS total, COUNT(DISTINCT v.content_hash) AS covered
+            FROM memories m
+            LEFT JOIN {version.table_name} v ON v.model = :model AND v.content_hash = m.content_hash
+            WHERE m.content_hash IS NOT NULL
+        """), params).first()
+        archive = db.execute(text(f"""
+            SELECT COUNT(DISTINCT a.content_hash) AS total, COUNT(DISTINCT v.content_hash) AS covered
+            FROM memory_archive a
+            LEFT JOIN {version.table_name} v ON v.model = :model AND v.content_hash = a.content_hash
+        """), params).first()
+        passages = db.execute(text(f"""
+            SELECT COUNT(DISTINCT p.content_hash) AS total, COUNT(DISTINCT v.content_hash) AS covered
+            FROM passages p
+            LEFT JOIN {version.table_name} v ON v.model = :model AND v.content_hash = p.content_hash
+            WHERE {_PARENT_EXISTS}
+        """), params).first()
+        # rows from before content hashing only have an inline vector from the original model
+        unhashed = 0 if version.legacy else db.execute(
+            text("SELECT COUNT(*) FROM memories WHERE content_hash IS NULL")
+        ).scalar()
+
+    return {
+        "memories": {"covered": memories.covered, "total": memories.total},
+        "archive": {"covered": archive.covered, "total": archive.total},
+        "passages": {"covered": passages.covered, "total": passages.total},
+        "unhashed": unhashed,
+        "complete": all(
+            part.covered == part.total for part in (memories, archive, passages)
+        ) and not unhashed,
+    }
+
+
+def _next_batch(db, state: EmbeddingModel, batch_size: int) -> Tuple[int, Dict[str, str]]:
+    """Texts for the next `batch_size` keys after the checkpoint, advancing it (or the phase)."""
+    if state.phase == "memories":
+        # one row per distinct text, walked along the content_hash index
+        keys = db.execute(text("""
+            SELECT content_hash, MIN(id) AS id FROM memories
+            WHERE content_hash > :after
+            GROUP BY content_hash
+            ORDER BY content_hash
+            LIMIT :limit
+        """), {"after": state.checkpoint or "", "limit": batch_size}).fetchall()
+        if not keys:
+            state.phase, state.checkpoint = "archive", ""
+            return 0, {}
+        state.checkpoint = keys[-1].content_hash
+        return len(keys), _texts(db, [k.id for k in keys])
+
+    if state.phase == "archive":
+        keys = db.execute(text("""
+            SELECT DISTINCT content_hash FROM memory_archive
+            WHERE content_hash > :after
+            ORDER BY content_hash
+            LIMIT :limit
+        """), {"after": state.checkpoint or "", "limit": batch_size}).scalars().all()
+        if not keys:
+            state.phase, state.checkpoint = "passages", ""
+            return 0, {}
+        state.checkpoint = keys[-1]
+        return len(keys), _archived_texts(db, keys)
+
+    parent, _, position = (state.checkpoint or "").partition(":")
+    keys = db.execute(text("""
+        SELECT parent_hash, position, content_hash, start_char, end_char FROM passages
+        WHERE parent_hash > :parent OR (parent_hash = :parent AND position > :position)
+        ORDER BY parent_hash, position
+        LIMIT :limit
+    """), {"parent": parent, "position": int(position or -1), "limit": batch_size}).fetchall()
+    if not keys:
+        state.phase, state.checkpoint = "done", None
+        return 0, {}
+    state.checkpoint = f"{keys[-1].parent_hash}:{keys[-1].position}"
+    return len(keys), _passage_texts(db, keys)
+
+
+def _catch_up(version: ModelVersion, batch_size: int):
+    # anything the backfill walked past before it was written, found by anti-join
+    missing_memories = text(f"""
+        SELECT m.content_hash, MIN(m.id) AS id
+        FROM memories m
+        LEFT JOIN {version.table_name} v ON v.model = :model AND v.content_hash = m.content_hash
+        WHERE m.content_hash IS NOT NULL AND v.content_hash IS NULL
+        GROUP BY m.content_hash
+        LIMIT :limit
+    """)
+    missing_archive = text(f"""
+        SELECT DISTINCT a.content_hash
+        FROM memory_archive a
+        LEFT JOIN {version.table_name} v ON v.model = :model AND v.content_hash = a.content_hash
+        WHERE v.content_hash IS NULL
+        LIMIT :limit
+    """)
+    missing_passages = text(f"""
+        SELECT p.parent_hash, p.position, p.content_hash, p.start_char, p.end_char
+        FROM passages p
+        LEFT JOIN {version.table_name} v ON v.model = :model AND v.content_hash = p.content_hash
+        WHERE v.content_hash IS NULL AND {_PARENT_EXISTS}
+        LIMIT :limit
+    """)
+    params = {"model": version.name, "limit": batch_size}
+
+    for sql, load in ((missing_memories, lambda db, keys: _texts(db, [k.id for k in keys])),
+                      (missing_archive, lambda db, keys: _archived_texts(db, [k.content_hash for k in keys])),
+                      (missing_passages, _passage_texts)):
+        while True:
+            with get_session() as db:
+                keys = db.execute(sql, params).fetchall()
+                texts = load(db, keys) if keys else {}
+                if not texts:
+                    break
+                store_embeddings(db, dict(zip(texts, embed_batch(list(texts.values()), model=version.name))),
+                                 version.name)
+                db.commit()
+
+
+def _texts(db, ids: List[int]) -> Dict[str, str]:
+    sql = text("SELECT content_hash, text FROM memories WHERE id IN :ids").bindparams(
+        bindparam("ids", expanding=True)
+    )
+    return {r.content_hash: r.text for r in db.execute(sql, {"ids": ids})}
+
+
+def _archived_texts(db, hashes: List[str]) -> Dict[str, str]:
+    sql = text("SELECT content_hash, text FROM memory_archive WHERE content_hash IN :hashes").bindparams(
+        bindparam("hashes", expanding=True)
+    )
+    return {r.content_hash: r.text for r in db.execute(sql, {"hashes": hashes})}
+
+
+def _passage_texts(db, passages) -> Dict[str, str]:
+    # passages only keep offsets, slice them out of one copy of each parent
+    sql = text("""
+        SELECT content_hash, text FROM memories WHERE id IN (
+            SELECT MIN(id) FROM memories WHERE content_hash IN :parents GROUP BY content_hash
+        )
+    """).bindparams(bindparam("parents", expanding=True))
+    parents = {r.content_hash: r.text for r in db.execute(sql, {"parents": list({p.parent_hash for p in passages})})}
+    return {
+        p.content_hash: parents[p.parent_hash][p.start_char:p.end_char]
+        for p in passages if p.parent_hash in parents
+    }
+
+
+def _throttle(started: float, rows: int, rows_per_second: Optional[float]):
+    if rows_per_second:
+        ahead = rows / rows_per_second - (time.perf_counter() - started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed every memory with another model, then switch to it.")
+    parser.add_argument("--model", required=True, help="sentence-transformers model name")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--rows-per-second", type=float, help="default: unthrottled")
+    parser.add_argument("--activate", action="store_true", help="switch searches over once coverage is complete")
+    parser.add_argument("--status", action="store_true", help="print coverage and exit")
+    args = parser.parse_args()
+
+    if args.status:
+        print(json.dumps(coverage(args.model), indent=2))
+        return
+    report = reembed(args.model, args.batch_size, args.rows_per_second, activate=args.activate)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy import Table
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from atlas_memory.db import get_session
+from atlas_memory.schema import Embedding, EmbeddingModel, vectors_table
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+DEFAULT_DIM = Embedding.embedding.type.dim
+MODEL_STATES = ("backfilling", "active", "retired")
+
+# how long a process keeps its view of the registry before reading it again
+REFRESH_SECONDS = float(os.getenv("ATLAS_MODEL_REFRESH", "5"))
+
+
+class ModelVersion(NamedTuple):
+    name: str
+    dim: int
+    table_name: str
+    status: str
+
+    @property
+    def table(self) -> Table:
+        return vectors_table(self.table_name, self.dim)
+
+    @property
+    def legacy(self) -> bool:
+        # vectors stored inline on old memory rows were made by the original model
+        return self.name == DEFAULT_MODEL
+
+
+_lock = threading.Lock()
+_versions: Dict[str, ModelVersion] = {}
+_read_at: Optional[float] = None
+
+
+def model_versions(refresh: bool = False) -> Dict[str, ModelVersion]:
+    global _versions, _read_at
+    with _lock:
+        if refresh or _read_at is None or time.monotonic() - _read_at >= REFRESH_SECONDS:
+            _versions = _read_registry()
+            _read_at = time.monotonic()
+        return _versions
+
+
+def invalidate():
+    global _read_at
+    with _lock:
+        _read_at = None
+
+
+def active_model() -> ModelVersion:
+    return next(v for v in model_versions().values() if v.status == "active")
+
+
+def live_models() -> List[ModelVersion]:
+    """The active model first, then any being backfilled. New vectors are written for all of them."""
+    versions = model_versions().values()
+    return sorted((v for v in versions if v.status != "retired"), key=lambda v: v.status != "active")
+
+
+def get_model(name: Optional[str] = None) -> ModelVersion:
+    if name is None:
+        return active_model()
+    version = model_versions().get(name) or model_versions(refresh=True).get(name)
+    if version is None:
+        raise ValueError(f"Embedding model '{name}' isn't registered, run atlas_memory.reembed first")
+    return version
+
+
+def model_table_name(name: str) -> str:
+    if name == DEFAULT_MODEL:
+        return Embedding.__tablename__
+    slug = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")[:40]
+    return f"embeddings_{slug}_{hashlib.sha256(name.encode('utf-8')).hexdigest()[:8]}"
+
+
+def _read_registry() -> Dict[str, ModelVersion]:
+    try:
+        with get_session() as db:
+            rows = db.query(EmbeddingModel).all()
+    except (OperationalError, ProgrammingError):
+        # tables not created yet
+        rows = []
+
+    versions = {r.name: ModelVersion(r.name, r.dim, r.table_name, r.status) for r in rows}
+    if DEFAULT_MODEL not in versions:
+        # deployments start on the original model without a registry row for it
+        status = "retired" if any(v.status == "active" for v in versions.values()) else "active"
+        versions[DEFAULT_MODEL] = ModelVersion(DEFAULT_MODEL, DEFAULT_DIM, Embedding.__tablename__, status)
+    return versions
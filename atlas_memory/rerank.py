@@ -0,0 +1,111 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Optional, Sequence
+import numpy as np
+
+from atlas_memory.metrics import search_metrics
+
+logger = logging.getLogger(__name__)
+
+RERANK_MODEL = os.getenv("ATLAS_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# first-stage candidates scored per search; the rest keep their first-stage order
+RERANK_CANDIDATES = int(os.getenv("ATLAS_RERANK_CANDIDATES", "50"))
+# past this the search returns the first-stage ordering
+RERANK_BUDGET_MS = float(os.getenv("ATLAS_RERANK_BUDGET_MS", "150"))
+# forward passes allowed in flight; searches beyond that skip reranking instead of queueing
+RERANK_WORKERS = int(os.getenv("ATLAS_RERANK_WORKERS", "2"))
+
+
+class CrossEncoderReranker:
+    """Scores (query, text) pairs with a local sentence-transformers cross-encoder, all pairs in one batch."""
+
+    def __init__(self, model: str = RERANK_MODEL):
+        self.model_name = model
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name)
+            return self._model
+
+    def warm(self):
+        """Load the model now, so the first search doesn't spend its budget on it."""
+        self.model
+
+    def score(self, query: str, texts: Sequence[str]) -> np.ndarray:
+        pairs = [(query, t) for t in texts]
+        return np.asarray(self.model.predict(pairs, batch_size=len(pairs)), dtype=np.float32)
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=RERANK_WORKERS, thread_name_prefix="atlas-rerank")
+_slots = threading.BoundedSemaphore(RERANK_WORKERS)
+
+
+def set_reranker(reranker):
+    """Use `reranker` (anything with score(query, texts) -> scores) for search_memory(rerank=True)."""
+    global _reranker
+    with _reranker_lock:
+        _reranker = reranker
+
+
+def get_reranker():
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = CrossEncoderReranker()
+        return _reranker
+
+
+def rerank_available() -> bool:
+    """Whether a rerank worker is free right now, i.e. a pass started now wouldn't be skipped."""
+    if not _slots.acquire(blocking=False):
+        return False
+    _slots.release()
+    return True
+
+
+def rerank_scores(query: str, texts: List[str], budget_ms: float = RERANK_BUDGET_MS) -> Optional[np.ndarray]:
+    """Cross-encoder scores for `texts`, or None when they don't arrive within `budget_ms` or the pass fails.
+
+    Inference runs on a worker thread. A pass that overruns keeps its thread until it
+    finishes, so while every worker is busy, searches skip reranking rather than wait.
+    """
+    if not texts:
+        return None
+    if not _slots.acquire(blocking=False):
+        search_metrics.incr("rerank_skipped")
+        return None
+
+    def run():
+        try:
+            return reranker.score(query, texts)
+        finally:
+            _slots.release()
+
+    submitted = False
+    try:
+        reranker = get_reranker()
+        future = _executor.submit(run)
+        submitted = True
+        scores = np.asarray(future.result(timeout=budget_ms / 1000), dtype=np.float32)
+    except FutureTimeoutError:
+        search_metrics.incr("rerank_timeouts")
+        return None
+    except Exception:
+        logger.exception("Rerank pass failed, keeping the first-stage order")
+        search_metrics.incr("rerank_errors")
+        return None
+    finally:
+        # once submitted, the worker gives the slot back when the pass ends
+        if not submitted:
+            _slots.release()
+    search_metrics.incr("reranked")
+    return scores
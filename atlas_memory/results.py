@@ -0,0 +1,133 @@
+import json
+from typing import Iterable, List, Optional, Tuple
+
+RESULT_FIELDS = ("id", "text", "metadata", "score")
+# id and score are needed to rank and merge results, so every projection keeps them
+_ALWAYS = ("id", "score")
+
+
+def result_fields(fields: Optional[Iterable[str]]) -> Tuple[str, ...]:
+    if fields is None:
+        return RESULT_FIELDS
+    fields = set(fields)
+    unknown = fields - set(RESULT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown result fields {sorted(unknown)}, expected some of {RESULT_FIELDS}")
+    return tuple(f for f in RESULT_FIELDS if f in fields or f in _ALWAYS)
+
+
+def select_columns(fields: Tuple[str, ...], alias: str = "") -> str:
+    """The extra columns to SELECT after the id for `fields`, e.g. ", m.text"."""
+    prefix = f"{alias}." if alias else ""
+    columns = [prefix + c for f, c in (("text", "text"), ("metadata", "metadata_json")) if f in fields]
+    return "".join(", " + c for c in columns)
+
+
+class SearchResult(dict):
+    """One search hit: a dict of the projected fields, as search_memory used to return, with attribute access.
+
+    "archived" and "pending" are only keys when set. The metadata JSON is decoded on first use:
+    r["metadata"], iteration (so dict(r) and {**r}), items(), values(), copy(), == and json.dumps().
+    """
+
+    __slots__ = ("_decoded",)
+
+    def __init__(self, id: int, score: float, text: Optional[str] = None, metadata=None,
+                 fields: Tuple[str, ...] = RESULT_FIELDS, archived: bool = False, pending: bool = False):
+        values = {"id": id, "text": text, "metadata": metadata, "score": score}
+        super().__init__((f, values[f]) for f in fields)
+        if archived:
+            dict.__setitem__(self, "archived", True)
+        if pending:
+            dict.__setitem__(self, "pending", True)
+        self._decoded = "metadata" not in fields or not isinstance(metadata, (str, bytes))
+
+    id = property(lambda self: dict.get(self, "id"))
+    text = property(lambda self: dict.get(self, "text"))
+    archived = property(lambda self: dict.get(self, "archived", False))
+    pending = property(lambda self: dict.get(self, "pending", False))
+
+    @property
+    def score(self) -> float:
+        return dict.__getitem__(self, "score")
+
+    @score.setter
+    def score(self, value: float):
+        dict.__setitem__(self, "score", value)
+
+    @property
+    def metadata(self):
+        return self["metadata"] if "metadata" in self else None
+
+    def _decode(self):
+        if not self._decoded:
+            dict.__setitem__(self, "metadata", json.loads(dict.__getitem__(self, "metadata")))
+            self._decoded = True
+
+    def __getitem__(self, key: str):
+        if key == "metadata":
+            self._decode()
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key: str, value):
+        if key == "metadata":
+            self._decoded = True
+        dict.__setitem__(self, key, value)
+
+    def get(self, key: str, default=None):
+        return self[key] if key in self else default
+
+    def values(self):
+        self._decode()
+        return dict.values(self)
+
+    def items(self):
+        self._decode()
+        return dict.items(self)
+
+    def __iter__(self):
+        # dict(r), {**r} and update(r) only go through __getitem__ when __iter__ is overridden
+        self._decode()
+        return dict.__iter__(self)
+
+    def __eq__(self, other):
+        self._decode()
+        if isinstance(other, SearchResult):
+            other._decode()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __or__(self, other):
+        return self.to_dict() | other
+
+    def copy(self) -> dict:
+        return self.to_dict()
+
+    def to_dict(self) -> dict:
+        self._decode()
+        return dict.copy(self)
+
+    def __repr__(self) -> str:
+        return f"SearchResult({dict.__repr__(self)})"
+
+
+def merge_ranked(ranked: List[SearchResult], extra: List[SearchResult], top_k: int) -> List[SearchResult]:
+    """`extra` slotted into `ranked` by score, without reordering `ranked` itself.
+
+    `ranked` may come out of diversify or rerank, whose order isn't the score order, so sorting
+    the union by score would undo them. On a tie the ranked row stays first.
+    """
+    extra = sorted(extra, key=lambda r: r.score, reverse=True)
+    merged, i = [], 0
+    for result in ranked:
+        while i < len(extra) and extra[i].score > result.score:
+            merged.append(extra[i])
+            i += 1
+        merged.append(result)
+    merged.extend(extra[i:])
+    return merged[:top_k]
@@ -1,10 +1,18 @@
-from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, Index
+import os
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, Text, JSON, DateTime, Boolean, Float, Index, LargeBinary, MetaData, Table,
+    inspect, text
+)
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.sql import func
-from tidb_vector.sqlalchemy import VectorType
+from atlas_memory.vectors import CompactVector
 
 Base = declarative_base()
 
+# on TiDB/MySQL, create memories split into this many KEY(user_id) partitions; 0 keeps one table
+MEMORY_PARTITIONS = int(os.getenv("ATLAS_MEMORY_PARTITIONS", "0"))
+
 
 class Memory(Base):
     __tablename__ = "memories"
@@ -14,15 +22,223 @@ class Memory(Base):
     branch = Column(String(255), default="main", nullable=False, index=True)
     text = Column(Text, nullable=False)
     metadata_json = Column(JSON, nullable=True)
-    embedding = Column(VectorType(dim=384), nullable=False)
+    # new rows reference the shared vector in `embeddings`; only legacy rows keep their own
+    embedding = Column(CompactVector(dim=384), nullable=True)
+    content_hash = Column(String(64), nullable=True, index=True)
+    # how many times this memory was restated and folded in by dedup
+    occurrences = Column(Integer, default=1, server_default="1", nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # stamped in batches by searches, drives tiering
+    last_retrieved_at = Column(DateTime, nullable=True)
 
     __table_args__ = (
         Index("idx_user_branch", "user_id", "branch"),
     )
 
 
+class MemoryArchive(Base):
+    __tablename__ = "memory_archive"
+
+    # a memory's id in the branch it was archived from; branch copies keep the ids of their source
+    user_id = Column(String(255), primary_key=True)
+    branch = Column(String(255), primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    text = Column(Text, nullable=False)
+    metadata_json = Column(JSON, nullable=True)
+    content_hash = Column(String(64), nullable=False)
+    occurrences = Column(Integer, default=1, server_default="1", nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=True)
+    last_retrieved_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+    # int8 copy of `model`'s vector for the cold scan: one byte per dimension plus its scale
+    model = Column(String(128), nullable=False)
+    vector = Column(LargeBinary, nullable=False)
+    scale = Column(Float, nullable=False)
+
+
+class Embedding(Base):
+    __tablename__ = "embeddings"
+
+    model = Column(String(128), primary_key=True)
+    content_hash = Column(String(64), primary_key=True)
+    embedding = Column(CompactVector(dim=384), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class EmbeddingModel(Base):
+    __tablename__ = "embedding_models"
+
+    name = Column(String(128), primary_key=True)
+    dim = Column(Integer, nullable=False)
+    # the original model keeps `embeddings`, later ones get a table sized for their own dim
+    table_name = Column(String(64), nullable=False)
+    status = Column(String(16), nullable=False)  # backfilling, active, retired
+    # re-embedding progress: the phase being backfilled and the last key committed in it
+    phase = Column(String(16), nullable=True)
+    checkpoint = Column(String(128), nullable=True)
+    backfilled = Column(Integer, default=0, server_default="0", nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    activated_at = Column(DateTime(timezone=True), nullable=True)
+
+
+_model_tables = MetaData()
+
+
+def vectors_table(table_name: str, dim: int) -> Table:
+    """The table holding one model's vectors: `embeddings` itself, or one shaped like it for `dim`."""
+    if table_name == Embedding.__tablename__:
+        return Embedding.__table__
+    if table_name in _model_tables.tables:
+        return _model_tables.tables[table_name]
+    return Table(
+        table_name, _model_tables,
+        Column("model", String(128), primary_key=True),
+        Column("content_hash", String(64), primary_key=True),
+        Column("embedding", CompactVector(dim=dim), nullable=False),
+        Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    )
+
+
+class Passage(Base):
+    __tablename__ = "passages"
+
+    # keyed by the parent's content hash, so every row (and branch copy) with that text shares them
+    parent_hash = Column(String(64), primary_key=True)
+    position = Column(Integer, primary_key=True, autoincrement=False)
+    content_hash = Column(String(64), nullable=False)
+    start_char = Column(Integer, nullable=False)
+    end_char = Column(Integer, nullable=False)
+
+
+class SavePoint(Base):
+    __tablename__ = "save_points"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String(255), nullable=False)
+    branch = Column(String(255), nullable=False)
+    source_branch = Column(String(255), nullable=False)
+    mode = Column(String(16), default="copy", nullable=False)
+    # snapshot mode: TiDB TSO for stale reads, or the id high-water mark on local backends
+    snapshot_ts = Column(BigInteger, nullable=True)
+    max_memory_id = Column(Integer, nullable=True)
+    stale_read_until = Column(DateTime, nullable=True)
+    materialized = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # ephemeral branches: the reaper deletes the branch once this passes (UTC)
+    expires_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("idx_save_point_user_branch", "user_id", "branch"),
+        Index("idx_save_point_expires", "expires_at"),
+    )
+
+
+class BranchVersion(Base):
+    __tablename__ = "branch_versions"
+
+    # bumped by every write that adds or removes a branch's rows, so in-process caches can tell
+    user_id = Column(String(255), primary_key=True)
+    branch = Column(String(255), primary_key=True)
+    version = Column(BigInteger, default=0, server_default="0", nullable=False)
+
+
+class MemoryCompaction(Base):
+    __tablename__ = "memory_compactions"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String(255), nullable=False)
+    branch = Column(String(255), nullable=False)
+    old_id = Column(Integer, nullable=False, index=True)
+    survivor_id = Column(Integer, nullable=False, index=True)
+    similarity = Column(Float, nullable=True)
+    compacted_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ChangeEvent(Base):
+    __tablename__ = "memory_changes"
+
+    # consumers resume from a seq, so it only grows: AUTOINCREMENT on SQLite, AUTO_ID_CACHE 1 on TiDB
+    seq = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    user_id = Column(String(255), nullable=False)
+    branch = Column(String(255), nullable=False)
+    op = Column(String(32), nullable=False)
+    # the rows the change touched; NULL means reread the whole branch
+    memory_ids = Column(JSON, nullable=True)
+    detail = Column(JSON, nullable=True)
+    # UTC, stamped by the writer
+    created_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("idx_change_user_seq", "user_id", "seq"),
+        Index("idx_change_created", "created_at"),
+        {"sqlite_autoincrement": True},
+    )
+
+
+def tidb_change_log() -> Table:
+    """memory_changes with AUTO_ID_CACHE 1, so every TiDB server takes seqs from one ordered counter.
+
+    By default each TiDB server caches its own range of ids, and a later event could get a smaller seq.
+    """
+    columns = [c._copy() for c in ChangeEvent.__table__.columns]
+    indexes = [Index(i.name, *(c.name for c in i.columns)) for i in ChangeEvent.__table__.indexes]
+    return Table(ChangeEvent.__tablename__, MetaData(), *columns, *indexes, mysql_auto_id_cache="1")
+
+
+def partitioned_memories(name: str, partitions: int) -> Table:
+    """memories as a table split by KEY(user_id), for TiDB/MySQL.
+
+    Every unique key of a partitioned table has to include the partitioning column, so the
+    primary key becomes (id, user_id). Indexes keep the names memories uses.
+    """
+    columns = []
+    for column in Memory.__table__.columns:
+        column = column._copy()
+        column.index = None
+        if column.name == "user_id":
+            column.primary_key = True
+        columns.append(column)
+    indexes = [Index(i.name, *(c.name for c in i.columns)) for i in Memory.__table__.indexes]
+    return Table(
+        name, MetaData(), *columns, *indexes,
+        mysql_partition_by="KEY(user_id)", mysql_partitions=str(partitions),
+    )
+
+
 def init_db(engine):
+    if MEMORY_PARTITIONS and engine.dialect.name == "mysql":
+        partitioned_memories(Memory.__tablename__, MEMORY_PARTITIONS).create(bind=engine, checkfirst=True)
+    if _is_tidb(engine):
+        tidb_change_log().create(bind=engine, checkfirst=True)
     Base.metadata.create_all(bind=engine)
+    upgrade_tables(engine)
     print("Database tables ready.")
+
+
+def _is_tidb(engine) -> bool:
+    if engine.dialect.name != "mysql":
+        return False
+    with engine.connect() as conn:
+        return "TiDB" in (conn.execute(text("SELECT VERSION()")).scalar() or "")
+
+
+def upgrade_tables(engine):
+    """Add columns and indexes that older deployments are missing, and relax dropped NOT NULLs."""
+    inspector = inspect(engine)
+
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"]: c for c in inspector.get_columns(table.name)}
+        indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+
+        with engine.begin() as conn:
+            for column in table.columns:
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                if column.name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                elif column.nullable and not existing[column.name]["nullable"] and engine.dialect.name == "mysql":
+                    conn.execute(text(f"ALTER TABLE {table.name} MODIFY COLUMN {ddl}"))
+
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(bind=engine)
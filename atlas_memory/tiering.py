@@ -0,0 +1,304 @@
+import argparse
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import bindparam, insert, text
+
+from atlas_memory.db import get_session
+from atlas_memory.schema import Memory, MemoryArchive
+from atlas_memory.embeddings import decode_vectors, ensure_embeddings
+from atlas_memory.registry import get_model
+from atlas_memory.branching import BranchScope, materialize_dependents, vector_column
+from atlas_memory.vector_cache import bump_version
+from atlas_memory.changes import record_change
+from atlas_memory.results import RESULT_FIELDS, SearchResult, select_columns
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BATCH_SIZE = 500
+# last_retrieved_at only needs day precision, so searches stamp it at most this often
+RETRIEVAL_FLUSH_SECONDS = float(os.getenv("ATLAS_RETRIEVAL_FLUSH_SECONDS", "30"))
+RETRIEVAL_MAX_PENDING = 5000
+
+_ARCHIVE_COLUMNS = (
+    "id", "user_id", "branch", "text", "metadata_json", "content_hash", "occurrences", "created_at",
+    "last_retrieved_at",
+)
+
+
+class RetrievalTracker:
+    """Collects ids returned by searches and stamps last_retrieved_at for all of them in one UPDATE.
+
+    Flushes run on a background thread once `flush_interval` seconds have passed or
+    `max_pending` ids are waiting, so searches never wait on the write.
+    """
+
+    def __init__(self, flush_interval: float = RETRIEVAL_FLUSH_SECONDS, max_pending: int = RETRIEVAL_MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending: Dict[str, set] = {}
+        self._count = 0
+        self._last_flush = time.monotonic()
+        self._flushing = False
+
+    def record(self, user_id: str, ids: Iterable[int]):
+        with self._lock:
+            pending = self._pending.setdefault(user_id, set())
+            self._count -= len(pending)
+            pending.update(ids)
+            self._count += len(pending)
+            due = self._count >= self.max_pending or time.monotonic() - self._last_flush >= self.flush_interval
+            if not due or self._flushing or not self._pending:
+                return
+            self._flushing = True
+        threading.Thread(target=self._background_flush, name="atlas-retrievals", daemon=True).start()
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending, self._count = self._pending, {}, 0
+            self._last_flush = time.monotonic()
+        if not any(pending.values()):
+            return 0
+
+        # one UPDATE per user, so each stays on that user's partition when memories is partitioned
+        sql = text(
+            "UPDATE memories SET last_retrieved_at = :now WHERE user_id = :user_id AND id IN :ids"
+        ).bindparams(bindparam("ids", expanding=True))
+        with get_session() as db:
+            for user_id, ids in pending.items():
+                ids = sorted(ids)
+                for i in range(0, len(ids), 500):
+                    db.execute(sql, {"now": _utcnow(), "user_id": user_id, "ids": ids[i:i + 500]})
+            db.commit()
+        return sum(len(ids) for ids in pending.values())
+
+    def _background_flush(self):
+        try:
+            self.flush()
+        except Exception:
+            # best effort: a lost stamp only delays when a memory counts as idle
+            logger.exception("Failed to record memory retrievals")
+        finally:
+            with self._lock:
+                self._flushing = False
+
+
+retrievals = RetrievalTracker()
+atexit.register(lambda: retrievals.flush())
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 per row: 4x smaller than float32, and cosine ranking barely moves."""
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def archive_memories(
+    user_id: Optional[str] = None,
+    max_age_days: Optional[float] = None,
+    idle_days: Optional[float] = None,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    dry_run: bool = False
+) -> Dict:
+    """Move memories created more than `max_age_days` ago, or not retrieved for `idle_days`, to the archive.
+
+    Archived rows keep text and metadata and get an int8 vector for the cold scan. Default searches
+    no longer see them. Snapshots reading an affected branch are materialized first.
+    """
+    if max_age_days is None and idle_days is None:
+        raise ValueError("Pass max_age_days, idle_days or both")
+    retrievals.flush()
+
+    now = _utcnow()
+    conditions, params = [], {}
+    if max_age_days is not None:
+        conditions.append("m.created_at < :created_before")
+        params["created_before"] = now - timedelta(days=max_age_days)
+    if idle_days is not None:
+        # never-retrieved memories count as idle from when they were written
+        conditions.append("COALESCE(m.last_retrieved_at, m.created_at) < :idle_before")
+        params["idle_before"] = now - timedelta(days=idle_days)
+    where = f"m.content_hash IS NOT NULL AND ({' OR '.join(conditions)})"
+    if user_id is not None:
+        where += " AND m.user_id = :user_id"
+        params["user_id"] = user_id
+
+    if dry_run:
+        with get_session() as db:
+            count = db.execute(text(f"SELECT COUNT(*) FROM memories m WHERE {where}"), params).scalar()
+        return {"archived": 0, "candidates": count, "dry_run": True}
+
+    model = get_model()
+    sql = text(f"""
+        SELECT {", ".join("m." + c for c in _ARCHIVE_COLUMNS)}, {vector_column(model)} AS vector
+        FROM memories m
+        LEFT JOIN {model.table_name} e ON e.model = :model AND e.content_hash = m.content_hash
+        WHERE {where} AND m.id > :after
+        ORDER BY m.id
+        LIMIT :limit
+    """)
+    # one DELETE per user, so each stays on that user's partition when memories is partitioned
+    delete = text("DELETE FROM memories WHERE user_id = :user_id AND id IN :ids").bindparams(
+        bindparam("ids", expanding=True)
+    )
+
+    archived, after, materialized = 0, 0, set()
+    while True:
+        with get_session() as db:
+            rows = db.execute(sql, {**params, "model": model.name, "after": after, "limit": batch_size}).fetchall()
+            if not rows:
+                break
+            after = rows[-1].id
+            rows = [r for r in rows if r.vector is not None]
+            if not rows:
+                continue
+
+            for key in {(r.user_id, r.branch) for r in rows} - materialized:
+                materialize_dependents(db, *key)
+                materialized.add(key)
+
+            vectors, scales = quantize(decode_vectors([r.vector for r in rows]))
+            db.execute(insert(MemoryArchive), [
+                {
+                    **{c: getattr(r, c) for c in _ARCHIVE_COLUMNS},
+                    "metadata_json": _load_json(r.metadata_json),
+                    "created_at": _parse_time(r.created_at),
+                    "last_retrieved_at": _parse_time(r.last_retrieved_at),
+                    "model": model.name,
+                    "vector": v.tobytes(),
+                    "scale": float(s),
+                }
+                for r, v, s in zip(rows, vectors, scales)
+            ])
+            for owner in {r.user_id for r in rows}:
+                db.execute(delete, {"user_id": owner, "ids": [r.id for r in rows if r.user_id == owner]})
+            for key in {(r.user_id, r.branch) for r in rows}:
+                bump_version(db, *key)
+                record_change(db, *key, "archive", [r.id for r in rows if (r.user_id, r.branch) == key])
+            db.commit()
+            archived += len(rows)
+
+    return {"archived": archived, "model": model.name, "dry_run": False}
+
+
+def restore_memories(user_id: str, branch: str, ids: List[int]) -> List[int]:
+    """Move archived memories back into the hot table. They get new ids, which are returned."""
+    select = text(f"""
+        SELECT {", ".join(_ARCHIVE_COLUMNS)} FROM memory_archive
+        WHERE user_id = :user_id AND branch = :branch AND id IN :ids
+        ORDER BY id
+    """).bindparams(bindparam("ids", expanding=True))
+    delete = text(
+        "DELETE FROM memory_archive WHERE user_id = :user_id AND branch = :branch AND id IN :ids"
+    ).bindparams(bindparam("ids", expanding=True))
+
+    params = {"user_id": user_id, "branch": branch, "ids": ids}
+    with get_session() as db:
+        rows = db.execute(select, params).fetchall()
+        # the shared vectors are still there, unless the model changed since the rows were archived
+        ensure_embeddings(db, [r.text for r in rows])
+        memories = [
+            Memory(
+                user_id=r.user_id, branch=r.branch, text=r.text, metadata_json=_load_json(r.metadata_json),
+                content_hash=r.content_hash, occurrences=r.occurrences, created_at=_parse_time(r.created_at),
+                last_retrieved_at=_utcnow(),
+            )
+            for r in rows
+        ]
+        db.add_all(memories)
+        db.execute(delete, params)
+        db.flush()
+        bump_version(db, user_id, branch)
+        record_change(db, user_id, branch, "restore", [m.id for m in memories])
+        db.commit()
+        return [m.id for m in memories]
+
+
+def search_archive(db, user_id: str, query: str, query_vector: list, top_k: int, scope: BranchScope,
+                   mode: str, fields: Tuple[str, ...] = RESULT_FIELDS) -> List[SearchResult]:
+    """Brute-force scan of a branch's archived memories on their int8 vectors (LIKE for fulltext)."""
+    params = scope.params(user_id)
+    columns = select_columns(fields)
+    if mode == "fulltext":
+        rows = db.execute(text(f"""
+            SELECT id{columns} FROM {scope.table("memory_archive")}
+            WHERE {scope.where()} AND text LIKE :pattern
+            LIMIT :top_k
+        """), {**params, "pattern": f"%{query}%", "top_k": top_k}).fetchall()
+        return [_archived(r, 1.0, fields) for r in rows]
+
+    # rows still quantized by an older model (activate_model() re-encodes them) use the shared vector
+    rows = db.execute(text(f"""
+        SELECT a.id, a.vector, e.embedding AS shared FROM {scope.table("memory_archive", "a")}
+        LEFT JOIN {scope.table(scope.model.table_name, "e")}
+          ON a.model != :model AND e.model = :model AND e.content_hash = a.content_hash
+        WHERE {scope.where("a")} AND (a.model = :model OR e.embedding IS NOT NULL)
+    """), params).fetchall()
+    if not rows:
+        return []
+
+    # per-row scales cancel out of the cosine, so the int8 codes are used as they are
+    stale = [i for i, r in enumerate(rows) if r.shared is not None]
+    current = [i for i, r in enumerate(rows) if r.shared is None]
+    matrix = np.zeros((len(rows), len(query_vector)), dtype=np.float32)
+    if current:
+        codes = np.frombuffer(b"".join(rows[i].vector for i in current), dtype=np.int8)
+        matrix[current] = codes.reshape(len(current), -1)
+    if stale:
+        matrix[stale] = decode_vectors([rows[i].shared for i in stale])
+    query = np.asarray(query_vector, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    scores = matrix @ query / np.where(norms == 0, 1.0, norms)
+
+    top = np.argsort(-scores)[:top_k]
+    hits = {rows[i].id: float(scores[i]) for i in top}
+    if not columns:
+        return [SearchResult(i, score, fields=fields, archived=True) for i, score in hits.items()]
+    details = db.execute(text(f"""
+        SELECT id{columns} FROM {scope.table("memory_archive")}
+        WHERE {scope.where()} AND id IN :ids
+    """).bindparams(bindparam("ids", expanding=True)), {**params, "ids": list(hits)}).fetchall()
+    return sorted((_archived(r, hits[r.id], fields) for r in details), key=lambda r: r.score, reverse=True)
+
+
+def _archived(row, score: float, fields: Tuple[str, ...]) -> SearchResult:
+    mapping = row._mapping
+    return SearchResult(row.id, score, mapping.get("text"), mapping.get("metadata_json"), fields, archived=True)
+
+
+def _load_json(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def _parse_time(value) -> Optional[datetime]:
+    # raw SELECTs return strings on SQLite
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old or unused memories to the cold archive.")
+    parser.add_argument("--user", help="default: every user")
+    parser.add_argument("--max-age-days", type=float)
+    parser.add_argument("--idle-days", type=float, help="days since a memory was last returned by a search")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    report = archive_memories(args.user, args.max_age_days, args.idle_days, args.batch_size, args.dry_run)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+logger = logging.getLogger("atlas_memory.tracing")
+
+
+class Sink:
+    """Receives finished spans. `start` returns a token that is handed back to `finish`."""
+
+    def start(self, name: str, attributes: dict):
+        return None
+
+    def finish(self, token, name: str, duration_ms: float, error: Optional[BaseException]):
+        pass
+
+
+class LoggingSink(Sink):
+    def __init__(self, log: logging.Logger = logger, level: int = logging.DEBUG):
+        self.log = log
+        self.level = level
+
+    def start(self, name: str, attributes: dict):
+        return attributes
+
+    def finish(self, token, name: str, duration_ms: float, error: Optional[BaseException]):
+        if not self.log.isEnabledFor(self.level):
+            return
+        extra = " ".join(f"{k}={v}" for k, v in (token or {}).items())
+        status = f" error={type(error).__name__}" if error is not None else ""
+        self.log.log(self.level, "%s %.2fms %s%s", name, duration_ms, extra, status)
+
+
+class OpenTelemetrySink(Sink):
+    """Emits each stage as an OpenTelemetry span, nested under whatever span is current."""
+
+    def __init__(self, tracer=None):
+        if tracer is None:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                raise ImportError("OpenTelemetrySink needs the opentelemetry-api package")
+            tracer = trace.get_tracer("atlas_memory")
+        self.tracer = tracer
+
+    def start(self, name: str, attributes: dict):
+        cm = self.tracer.start_as_current_span(f"atlas_memory.{name}", attributes=attributes or None)
+        cm.__enter__()
+        return cm
+
+    def finish(self, token, name: str, duration_ms: float, error: Optional[BaseException]):
+        if error is not None:
+            token.__exit__(type(error), error, error.__traceback__)
+        else:
+            token.__exit__(None, None, None)
+
+
+_sink: Optional[Sink] = None
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("atlas_memory_timings", default=None)
+
+
+def set_sink(sink: Optional[Sink]):
+    """Install a sink for every span in the process; None turns tracing off."""
+    global _sink
+    _sink = None if type(sink) is Sink else sink
+
+
+def get_sink() -> Optional[Sink]:
+    return _sink
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("name", "attributes", "started", "token")
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.token = _sink.start(self.name, self.attributes) if _sink is not None else None
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = (time.perf_counter() - self.started) * 1000
+        collected = _timings.get()
+        if collected is not None:
+            collected[self.name] = collected.get(self.name, 0.0) + duration_ms
+        if _sink is not None:
+            _sink.finish(self.token, self.name, duration_ms, exc)
+        return False
+
+
+def span(name: str, **attributes):
+    """Time one stage. A shared no-op when there is no sink and no timings() collector."""
+    if _sink is None and _timings.get() is None:
+        return _NOOP
+    return _Span(name, attributes)
+
+
+@contextmanager
+def timings():
+    """Collect milliseconds per span name for the calls made inside the block.
+
+        with timings() as t:
+            search_memory("u1", "beach trips")
+        # t == {"search_memory": 31.2, "embed": 18.4, "checkout": 0.1, "sql": 11.9, "decode": 0.1, ...}
+
+    Stages nest, so "sql" includes any "checkout" it triggered; repeated stages add up.
+    """
+    collected: Dict[str, float] = {}
+    token = _timings.set(collected)
+    try:
+        yield collected
+    finally:
+        _timings.reset(token)
+
+
+def _sink_from_env() -> Optional[Sink]:
+    name = os.getenv("ATLAS_TRACE_SINK", "").strip().lower()
+    if name == "logging":
+        return LoggingSink(level=logging.INFO)
+    if name in ("otel", "opentelemetry"):
+        return OpenTelemetrySink()
+    return None
+
+
+set_sink(_sink_from_env())
@@ -0,0 +1,413 @@
+import argparse
+import json
+import logging
+import math
+import os
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import bindparam, insert, text
+
+from atlas_memory.db import get_session
+from atlas_memory.schema import Memory, MemoryArchive
+from atlas_memory.embeddings import (
+    content_hash, decode_vectors, embed_batch, ensure_embeddings, existing_hashes, store_embeddings
+)
+from atlas_memory.registry import ModelVersion, get_model
+from atlas_memory.branching import BranchScope, check_writable, resolve_branch, snapshot_connection, vector_column
+from atlas_memory.vector_cache import bump_version
+from atlas_memory.changes import inserted_ids, insert_floor, record_change
+from atlas_memory.tiering import quantize
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("ndjson", "npy", "parquet")
+FORMAT_NAME = "atlas-memories"
+FORMAT_VERSION = 2
+# share of the vectors an import would add to the shared table that get re-embedded and compared first (0 = off)
+IMPORT_VERIFY_FRACTION = float(os.getenv("ATLAS_IMPORT_VERIFY_FRACTION", "0"))
+VERIFY_MIN_SIMILARITY = 0.99
+
+# npy exports are a directory: row metadata as NDJSON plus one float32 matrix of vectors
+_NPY_ROWS = "memories.ndjson"
+_NPY_VECTORS = "embeddings.npy"
+
+
+def export_memories(
+    user_id: str,
+    path: str,
+    branch: Optional[str] = None,
+    format: str = "ndjson",
+    chunk_size: int = 1000
+) -> int:
+    """Stream a user's memories (one branch, or all of them) to `path` with their vectors.
+
+    Rows are read with a server-side cursor `chunk_size` at a time, so memory stays flat
+    however large the branch is. Vectors are the active model's.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{format}', expected one of {EXPORT_FORMATS}")
+
+    model = get_model()
+    with get_session() as db:
+        scope = resolve_branch(db, user_id, branch, model.name) if branch else None
+        if scope is not None and scope.stale_read:
+            with snapshot_connection() as conn:
+                return _export(conn, user_id, model, scope, path, format, chunk_size)
+        return _export(db, user_id, model, scope, path, format, chunk_size)
+
+
+def import_memories(
+    user_id: str,
+    path: str,
+    branch: Optional[str] = None,
+    chunk_size: int = 1000,
+    model: Optional[str] = None,
+    verify: float = IMPORT_VERIFY_FRACTION
+) -> int:
+    """Load an export into `user_id`, keeping each row's branch unless `branch` is given.
+
+    Vectors are shared by content across users, so a file's vector is only used for texts that
+    have none yet. With `verify`, that share of them (picked by content hash, so the same file
+    always checks the same rows) is re-embedded and compared first, and a mismatch raises
+    ValueError before its chunk is written; pass verify=1.0 for files you don't trust.
+    Archived rows go back into the archive. Rows are written one multi-row INSERT and one
+    commit per chunk, so chunks before a failed one stay imported.
+    """
+    if branch is not None:
+        check_writable(user_id, branch)
+    if os.path.isdir(path):
+        chunks = _read_npy(path, chunk_size)
+    elif path.endswith(".parquet"):
+        chunks = _read_parquet(path, chunk_size)
+    else:
+        chunks = _read_ndjson(path, chunk_size)
+
+    header = next(chunks)
+    if header.get("format") != FORMAT_NAME:
+        raise ValueError(f"{path} is not an atlasMemory export")
+    model = model or get_model().name
+    if header.get("model") != model:
+        raise ValueError(f"Export was embedded with '{header.get('model')}', not '{model}'")
+
+    imported = 0
+    with get_session() as db:
+        for records, vectors in chunks:
+            _import_chunk(db, user_id, branch, records, vectors, model, verify)
+            imported += len(records)
+    return imported
+
+
+def _export(db, user_id: str, model: ModelVersion, scope: Optional[BranchScope], path: str, format: str,
+            chunk_size: int) -> int:
+    if scope is None:
+        where, params = "m.user_id = :user_id", {"user_id": user_id, "model": model.name}
+    else:
+        where, params = scope.where("m"), scope.params(user_id)
+
+    # hot rows, then archived ones (their vectors come from the shared table, never the inline column)
+    sources = []
+    for name, vector, archived in (("memories", vector_column(model), 0), ("memory_archive", "e.embedding", 1)):
+        table = (
+            f"{scope.table(name, 'm') if scope else name + ' m'} "
+            f"LEFT JOIN {scope.table(model.table_name, 'e') if scope else model.table_name + ' e'} "
+            "ON e.model = :model AND e.content_hash = m.content_hash"
+        )
+        sources.append((table, vector, archived))
+
+    def partitions():
+        for table, vector, archived in sources:
+            sql = text(f"""
+                SELECT m.branch, m.text, m.metadata_json, m.occurrences, m.created_at, {archived} AS archived,
+                       {vector} AS vector
+                FROM {table}
+                WHERE {where}
+                ORDER BY m.id
+            """).execution_options(yield_per=chunk_size)
+            yield from db.execute(sql, params).partitions()
+
+    header = {"format": FORMAT_NAME, "version": FORMAT_VERSION, "model": model.name, "dim": model.dim,
+              "user_id": user_id}
+    if format == "npy":
+        # the matrix is preallocated on disk, so count first (before the streaming cursor opens)
+        vector_count = sum(
+            db.execute(text(f"SELECT COUNT(*) FROM {table} WHERE {where} AND {vector} IS NOT NULL"), params).scalar()
+            for table, vector, _ in sources
+        )
+        return _write_npy(partitions(), path, header, vector_count)
+    if format == "parquet":
+        return _write_parquet(partitions(), path, header)
+    return _write_ndjson(partitions(), path, header)
+
+
+def _write_ndjson(partitions, path: str, header: dict) -> int:
+    exported = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(header) + "\n")
+        for rows in partitions:
+            for r in rows:
+                # the stored vector literal is already a JSON array, splice it in unparsed
+                line = json.dumps(_record(r))
+                f.write(f'{line[:-1]}, "embedding": {r.vector or "null"}}}\n')
+            exported += len(rows)
+    return exported
+
+
+def _write_npy(partitions, path: str, header: dict, vector_count: int) -> int:
+    os.makedirs(path, exist_ok=True)
+    matrix = np.lib.format.open_memmap(
+        os.path.join(path, _NPY_VECTORS), mode="w+", dtype=np.float32, shape=(vector_count, header["dim"])
+    )
+
+    exported, filled = 0, 0
+    with open(os.path.join(path, _NPY_ROWS), "w", encoding="utf-8") as f:
+        f.write(json.dumps(header) + "\n")
+        for rows in partitions:
+            literals = [r.vector for r in rows if r.vector is not None]
+            if filled + len(literals) > vector_count:
+                raise RuntimeError("Memories were added during the export, run it again")
+            if literals:
+                matrix[filled:filled + len(literals)] = decode_vectors(literals)
+
+            for r in rows:
+                record = _record(r)
+                record["vector_row"] = filled if r.vector is not None else None
+                filled += r.vector is not None
+                f.write(json.dumps(record) + "\n")
+            exported += len(rows)
+
+    matrix.flush()
+    del matrix
+    return exported
+
+
+def _write_parquet(partitions, path: str, header: dict) -> int:
+    pa, pq = _pyarrow()
+    dim = header["dim"]
+    schema = pa.schema([
+        ("branch", pa.string()),
+        ("text", pa.string()),
+        ("metadata", pa.string()),
+        ("occurrences", pa.int32()),
+        ("created_at", pa.string()),
+        ("archived", pa.bool_()),
+        ("has_embedding", pa.bool_()),
+        ("embedding", pa.list_(pa.float32(), dim)),
+    ], metadata={"atlas": json.dumps(header)})
+
+    exported = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in partitions:
+            records = [_record(r) for r in rows]
+            vectors = np.zeros((len(rows), dim), dtype=np.float32)
+            present = np.array([r.vector is not None for r in rows])
+            if present.any():
+                vectors[present] = decode_vectors([r.vector for r in rows if r.vector is not None])
+
+            writer.write_table(pa.table({
+                "branch": [rec["branch"] for rec in records],
+                "text": [rec["text"] for rec in records],
+                "metadata": [json.dumps(rec["metadata"]) if rec["metadata"] is not None else None for rec in records],
+                "occurrences": [rec["occurrences"] for rec in records],
+                "created_at": [rec["created_at"] for rec in records],
+                "archived": [rec["archived"] for rec in records],
+                "has_embedding": present,
+                "embedding": pa.FixedSizeListArray.from_arrays(pa.array(vectors.reshape(-1)), dim),
+            }, schema=schema))
+            exported += len(rows)
+    return exported
+
+
+def _read_ndjson(path: str, chunk_size: int) -> Iterator:
+    with open(path, encoding="utf-8") as f:
+        yield json.loads(f.readline())
+        records: List[dict] = []
+        for line in f:
+            records.append(json.loads(line))
+            if len(records) == chunk_size:
+                yield records, [r.pop("embedding", None) for r in records]
+                records = []
+        if records:
+            yield records, [r.pop("embedding", None) for r in records]
+
+
+def _read_npy(path: str, chunk_size: int) -> Iterator:
+    matrix = np.load(os.path.join(path, _NPY_VECTORS), mmap_mode="r")
+    for item in _read_ndjson(os.path.join(path, _NPY_ROWS), chunk_size):
+        if isinstance(item, dict):
+            yield item
+            continue
+        records, _ = item
+        rows = [r.pop("vector_row") for r in records]
+        yield records, [np.asarray(matrix[i]) if i is not None else None for i in rows]
+
+
+def _read_parquet(path: str, chunk_size: int) -> Iterator:
+    pa, pq = _pyarrow()
+    parquet = pq.ParquetFile(path)
+    header = json.loads(parquet.schema_arrow.metadata[b"atlas"])
+    yield header
+
+    for batch in parquet.iter_batches(batch_size=chunk_size):
+        columns = batch.to_pydict()
+        vectors = batch.column("embedding").flatten().to_numpy().reshape(-1, header["dim"])
+        records = [
+            {
+                "branch": columns["branch"][i],
+                "text": columns["text"][i],
+                "metadata": json.loads(columns["metadata"][i]) if columns["metadata"][i] is not None else None,
+                "occurrences": columns["occurrences"][i],
+                "created_at": columns["created_at"][i],
+                # version 1 exports had no archived column
+                "archived": columns.get("archived", [False] * batch.num_rows)[i],
+            }
+            for i in range(batch.num_rows)
+        ]
+        yield records, [vectors[i] if columns["has_embedding"][i] else None for i in range(batch.num_rows)]
+
+
+def _import_chunk(db, user_id: str, branch: Optional[str], records: List[dict], vectors: list, model: str,
+                  verify: float):
+    if branch is None:
+        for target in {r["branch"] for r in records}:
+            check_writable(user_id, target, db)
+
+    digests = [content_hash(r["text"]) for r in records]
+    offered = {d: v for d, v in zip(digests, vectors) if v is not None}
+    # an existing vector is never replaced by one from a file
+    new = {d: v for d, v in offered.items() if d not in existing_hashes(db, list(offered), model)}
+    if new:
+        _check_vectors(new, dict(zip(digests, (r["text"] for r in records))), model, verify)
+        store_embeddings(db, new, model)
+    ensure_embeddings(db, [r["text"] for r in records], model)
+
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "user_id": user_id,
+            "branch": branch or r["branch"],
+            "text": r["text"],
+            "metadata_json": r["metadata"],
+            "content_hash": digest,
+            "occurrences": r.get("occurrences") or 1,
+            "created_at": _parse_time(r.get("created_at")) or now,
+        }
+        for r, digest in zip(records, digests)
+    ]
+    targets = sorted({row["branch"] for row in rows})
+    floors = {}
+    for target in targets:
+        # version first, so no other writer to the branch commits above the floor before we do
+        bump_version(db, user_id, target)
+        floors[target] = insert_floor(db, user_id, target)
+    hot = [row for row, r in zip(rows, records) if not r.get("archived")]
+    if hot:
+        db.execute(insert(Memory), hot)
+    archived = [row for row, r in zip(rows, records) if r.get("archived")]
+    archived_ids = _import_archived(db, archived, model) if archived else []
+
+    for target in targets:
+        ids = inserted_ids(db, user_id, target, floors[target])
+        ids += [memory_id for row, memory_id in zip(archived, archived_ids) if row["branch"] == target]
+        record_change(db, user_id, target, "import", ids)
+    db.commit()
+
+
+def _check_vectors(vectors: dict, texts: dict, model: str, fraction: float):
+    """Re-embed a `fraction` sample of `vectors` (at least one) and raise if any points elsewhere.
+
+    The sample is the lowest content hashes, so it is spread over the file and repeatable.
+    """
+    if fraction <= 0:
+        return
+    sample = sorted(vectors)[:max(1, math.ceil(len(vectors) * min(fraction, 1.0)))]
+    fresh = embed_batch([texts[d] for d in sample], model=model)
+    given = np.asarray([vectors[d] for d in sample], dtype=np.float32)
+    norms = np.linalg.norm(fresh, axis=1) * np.linalg.norm(given, axis=1)
+    similarity = np.sum(fresh * given, axis=1) / np.where(norms == 0, 1.0, norms)
+    mismatched = [texts[d] for d, s in zip(sample, similarity) if s < VERIFY_MIN_SIMILARITY]
+    if mismatched:
+        logger.warning("Exported vectors don't match model '%s': %s", model, mismatched[:5])
+        raise ValueError(
+            f"{len(mismatched)} of {len(sample)} checked vectors don't match '{model}' "
+            f"(e.g. {mismatched[0]!r}); import with verify=0 to trust them or re-export"
+        )
+
+
+def _import_archived(db, rows: List[dict], model: str) -> List[int]:
+    # insert then move, so archived rows get ids from the same sequence archive_memories() uses
+    memories = [Memory(**row) for row in rows]
+    db.add_all(memories)
+    db.flush()
+
+    version = get_model(model)
+    stored = dict(db.execute(text(
+        f"SELECT content_hash, embedding FROM {version.table_name} WHERE model = :model AND content_hash IN :digests"
+    ).bindparams(bindparam("digests", expanding=True)), {
+        "model": version.name, "digests": list({m.content_hash for m in memories})
+    }).fetchall())
+    vectors, scales = quantize(decode_vectors([stored[m.content_hash] for m in memories]))
+    db.execute(insert(MemoryArchive), [
+        {**row, "id": m.id, "model": version.name, "vector": v.tobytes(), "scale": float(s)}
+        for row, m, v, s in zip(rows, memories, vectors, scales)
+    ])
+    db.execute(
+        text("DELETE FROM memories WHERE user_id = :user_id AND id IN :ids").bindparams(bindparam("ids", expanding=True)),
+        {"user_id": rows[0]["user_id"], "ids": [m.id for m in memories]}
+    )
+    return [m.id for m in memories]
+
+
+def _record(row) -> dict:
+    metadata = row.metadata_json
+    return {
+        "branch": row.branch,
+        "text": row.text,
+        "metadata": json.loads(metadata) if isinstance(metadata, str) else metadata,
+        "occurrences": row.occurrences,
+        "created_at": row.created_at.isoformat() if isinstance(row.created_at, datetime) else row.created_at,
+        "archived": bool(row.archived),
+    }
+
+
+def _parse_time(value) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _pyarrow() -> Tuple:
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("format='parquet' needs pyarrow: pip install pyarrow")
+    return pyarrow, pyarrow.parquet
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a user's memories with their vectors.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export")
+    export.add_argument("--user", required=True)
+    export.add_argument("--branch", help="default: every branch")
+    export.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    export.add_argument("--out", required=True)
+
+    load = sub.add_parser("import")
+    load.add_argument("--user", required=True)
+    load.add_argument("--branch", help="put every row in this branch instead of its original one")
+    load.add_argument("--path", required=True)
+    load.add_argument("--verify", type=float, default=IMPORT_VERIFY_FRACTION,
+                      help="share of new vectors to re-embed and check, 1.0 for untrusted files")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        count = export_memories(args.user, args.out, args.branch, args.format)
+        print(f"Exported {count} memories to {args.out}")
+    else:
+        count = import_memories(args.user, args.path, args.branch, verify=args.verify)
+        print(f"Imported {count} memories from {args.path}")
+
+
+if __name__ == "__main__":
+    main()
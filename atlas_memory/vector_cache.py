@@ -0,0 +1,209 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import bindparam, insert, text
+
+from atlas_memory.schema import BranchVersion
+from atlas_memory.embeddings import decode_vectors
+from atlas_memory.metrics import search_metrics
+
+# 0 leaves the cache off; enable_vector_cache() turns it on at runtime
+VECTOR_CACHE_MB = float(os.getenv("ATLAS_VECTOR_CACHE_MB", "0"))
+# a branch is only loaded once it has been searched this many times, so one-off users stay in TiDB
+ADMIT_AFTER = int(os.getenv("ATLAS_VECTOR_CACHE_ADMIT", "2"))
+
+_MAX_TRACKED = 10000
+
+
+def bump_version(db, user_id: str, branch: str) -> int:
+    """Mark `branch` as changed, inside the caller's transaction. Returns its new version."""
+    params = {"user_id": user_id, "branch": branch}
+    update = text("UPDATE branch_versions SET version = version + 1 WHERE user_id = :user_id AND branch = :branch")
+    if not db.execute(update, params).rowcount:
+        stmt = insert(BranchVersion.__table__).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+        # a concurrent first write may insert the row first, then this one still has to count
+        if not db.execute(stmt, {**params, "version": 1}).rowcount:
+            db.execute(update, params)
+    return branch_version(db, user_id, branch)
+
+
+def branch_version(db, user_id: str, branch: str) -> int:
+    return db.execute(
+        text("SELECT version FROM branch_versions WHERE user_id = :user_id AND branch = :branch"),
+        {"user_id": user_id, "branch": branch}
+    ).scalar() or 0
+
+
+class CachedBranch:
+    __slots__ = ("ids", "vectors", "version")
+
+    def __init__(self, ids: np.ndarray, vectors: np.ndarray, version: int):
+        self.ids = ids
+        self.vectors = vectors
+        self.version = version
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.vectors.nbytes
+
+    def top_k(self, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        if not len(self.ids):
+            return []
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[i]), float(scores[i])) for i in top]
+
+
+class VectorCache:
+    """Whole branches as unit-length float32 matrices, so hot users' vector searches skip TiDB.
+
+    Every search still reads the branch's version (a primary-key lookup). A branch another
+    process wrote to since it was loaded gets reloaded. Writes made through this process are
+    appended in place. Least recently searched branches are evicted past `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int, admit_after: int = ADMIT_AFTER):
+        self.max_bytes = max_bytes
+        self.admit_after = admit_after
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, CachedBranch]" = OrderedDict()
+        self._searches: "OrderedDict[tuple, int]" = OrderedDict()
+        # branches too big for the whole budget, by the version that was, so they aren't reread every search
+        self._oversized: "OrderedDict[tuple, int]" = OrderedDict()
+        self._bytes = 0
+
+    def search(self, db, user_id: str, scope, query_vector: list, top_k: int) -> Optional[List[Tuple[int, float]]]:
+        """(id, score) pairs best first, or None when the branch isn't cached (yet)."""
+        key = (user_id, scope.branch, scope.model.name)
+        version = branch_version(db, user_id, scope.branch)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            elif self._oversized.get(key) == version or not self._admit(key):
+                return None
+
+        if entry is None or entry.version != version:
+            # version first: a write landing mid-load only makes the entry look stale
+            entry = self._load(db, user_id, scope, version)
+            if entry is None:
+                with self._lock:
+                    self._oversized[key] = version
+                    if len(self._oversized) > _MAX_TRACKED:
+                        self._oversized.popitem(last=False)
+                return None
+            search_metrics.incr("cache_loads")
+            self._put(key, entry)
+
+        search_metrics.incr("cached_searches")
+        return entry.top_k(_unit(np.asarray(query_vector, dtype=np.float32)), top_k)
+
+    def write_through(self, db, user_id: str, branch: str, model, version: int, ids: List[int], digests: List[str]):
+        """Append rows this process just committed, if the cached copy was current right before them."""
+        key = (user_id, branch, model.name)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return
+        if entry.version != version - 1:
+            self.discard(user_id, branch)
+            return
+
+        known = set(entry.ids.tolist())
+        new = [(i, d) for i, d in dict(zip(ids, digests)).items() if i not in known]
+        if new:
+            sql = text(
+                f"SELECT content_hash, embedding FROM {model.table_name} WHERE model = :model AND content_hash IN :digests"
+            ).bindparams(bindparam("digests", expanding=True))
+            rows = db.execute(sql, {"model": model.name, "digests": list({d for _, d in new})}).fetchall()
+            vectors = dict(zip((r.content_hash for r in rows), _unit_rows(decode_vectors([r.embedding for r in rows]))))
+            new = [(i, d) for i, d in new if d in vectors]
+            added = np.array([vectors[d] for _, d in new], dtype=np.float32).reshape(len(new), -1)
+            entry = CachedBranch(
+                np.concatenate([entry.ids, np.array([i for i, _ in new], dtype=np.int64)]),
+                np.vstack([entry.vectors, added]) if len(entry.ids) else added,
+                version,
+            )
+        else:
+            entry = CachedBranch(entry.ids, entry.vectors, version)
+        self._put(key, entry)
+
+    def discard(self, user_id: str, branch: Optional[str] = None):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id and (branch is None or k[1] == branch)]:
+                self._bytes -= self._entries.pop(key).nbytes
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"branches": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def _admit(self, key: tuple) -> bool:
+        count = self._searches.pop(key, 0) + 1
+        if count >= self.admit_after:
+            return True
+        self._searches[key] = count
+        if len(self._searches) > _MAX_TRACKED:
+            self._searches.popitem(last=False)
+        return False
+
+    def _load(self, db, user_id: str, scope, version: int) -> Optional[CachedBranch]:
+        rows = db.execute(text(f"""
+            SELECT m.id, {scope.vector_column} AS vector
+            FROM {scope.vector_table()}
+            WHERE {scope.where("m")}
+            ORDER BY m.id
+        """), scope.params(user_id)).fetchall()
+        rows = [r for r in rows if r.vector is not None]
+        entry = CachedBranch(
+            np.array([r.id for r in rows], dtype=np.int64),
+            _unit_rows(decode_vectors([r.vector for r in rows])) if rows else np.zeros((0, 0), dtype=np.float32),
+            version,
+        )
+        return entry if entry.nbytes <= self.max_bytes else None
+
+    def _put(self, key: tuple, entry: CachedBranch):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+
+_cache: Optional[VectorCache] = None
+
+
+def enable_vector_cache(max_mb: float = VECTOR_CACHE_MB or 256, admit_after: int = ADMIT_AFTER) -> VectorCache:
+    global _cache
+    _cache = VectorCache(int(max_mb * 1024 * 1024), admit_after)
+    return _cache
+
+
+def disable_vector_cache():
+    global _cache
+    _cache = None
+
+
+def get_vector_cache() -> Optional[VectorCache]:
+    return _cache
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.ascontiguousarray(matrix / np.where(norms == 0, 1.0, norms), dtype=np.float32)
+
+
+if VECTOR_CACHE_MB:
+    enable_vector_cache(VECTOR_CACHE_MB)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# benchmarks/compare.py - diff two benchmark result files
+#
+#   python -m benchmarks.compare results/before.json results/after.json --fail-over 15
+
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark runs.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--fail-over", type=float, default=None,
+                        help="exit 1 if any p95 regresses by more than this many percent")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"{'operation':<24}" + "".join(f"{m:>20}" for m in METRICS))
+    for name, before in baseline["operations"].items():
+        after = candidate["operations"].get(name)
+        if after is None:
+            continue
+        cells = [f"{after[m]:>9.2f} ({_percent(before[m], after[m]):+6.1f}%)" for m in METRICS]
+        print(f"{name:<24}" + "".join(f"{c:>20}" for c in cells))
+
+    regressions = find_regressions(baseline, candidate, args.fail_over)
+    if regressions:
+        print(f"\np95 regressed more than {args.fail_over}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+def find_regressions(baseline: dict, candidate: dict, fail_over: Optional[float]) -> List[str]:
+    """Operations in both runs whose p95 grew by more than `fail_over` percent."""
+    if fail_over is None:
+        return []
+    return [
+        name for name, before in baseline["operations"].items()
+        if name in candidate["operations"]
+        and _percent(before["p95_ms"], candidate["operations"][name]["p95_ms"]) > fail_over
+    ]
+
+
+def _percent(before: float, after: float) -> float:
+    return (after - before) / before * 100 if before else 0.0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Seeded synthetic corpus of users, branches and memories.
+
+Texts are built from templates so they repeat the way agent memories do, and every
+distinct text gets a synthetic unit vector (a topic centroid plus smaller template and
+qualifier offsets) so seeding 1M rows doesn't have to run the embedding model.
+"""
+import random
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+TEMPLATES = [
+    "User prefers", "User dislikes", "User mentioned", "User asked about", "User is planning",
+    "User booked", "User cancelled", "User wants to avoid", "User recommended", "User complained about",
+    "User is curious about", "User usually picks",
+]
+SUBJECTS = [
+    "window seats", "aisle seats", "beach destinations", "mountain cabins", "boutique hotels",
+    "large hotel chains", "red-eye flights", "direct flights", "train travel", "road trips",
+    "vegetarian food", "spicy food", "street food", "fine dining", "coffee shops",
+    "museums", "hiking trails", "ski resorts", "city breaks", "cruises",
+    "travel insurance", "airport lounges", "rental cars", "public transport", "guided tours",
+    "budget hostels", "luxury resorts", "camping", "national parks", "wine tasting",
+    "late checkout", "early check-in", "pet-friendly rooms", "kid-friendly activities", "quiet rooms",
+    "ocean views", "gym access", "spa treatments", "local markets", "nightlife",
+    "cooking classes", "photography spots", "historic sites", "theme parks", "snorkeling",
+    "scuba diving", "sailing", "cycling tours", "hot springs", "desert tours",
+    "northern lights", "safari trips", "island hopping", "festivals", "concerts",
+    "sports events", "shopping districts", "bookstores", "art galleries", "botanical gardens",
+]
+QUALIFIERS = [
+    "for summer trips", "for winter holidays", "on weekends", "for business travel", "with family",
+    "when travelling solo", "on a tight budget", "for special occasions", "in Europe", "in Asia",
+    "in South America", "near the coast", "in big cities", "in small towns", "during the off-season",
+    "for long trips", "for short stays", "with friends", "for the honeymoon", "next spring",
+]
+
+DIM = 384
+
+
+def corpus_rows(
+    rows: int,
+    seed: int = 42,
+    rows_per_user: int = 100,
+    branches_per_user: int = 3,
+    main_share: float = 0.8
+) -> Iterator[Tuple[str, str, str]]:
+    """Yield (user_id, branch, text) tuples; the same seed always yields the same corpus."""
+    rng = random.Random(seed)
+    users = max(1, rows // rows_per_user)
+
+    for n in range(rows):
+        user = f"bench-user-{n % users}"
+        if rng.random() < main_share:
+            branch = "main"
+        else:
+            branch = f"branch-{rng.randrange(branches_per_user)}"
+        text = f"{rng.choice(TEMPLATES)} {rng.choice(SUBJECTS)} {rng.choice(QUALIFIERS)}"
+        yield user, branch, text
+
+
+def synthetic_vectors(texts: List[str], seed: int = 42, dim: int = DIM) -> Dict[str, List[float]]:
+    """Deterministic unit vectors for distinct texts; similar wording lands close together."""
+    rng = np.random.default_rng(seed)
+    centroids = {
+        word: rng.standard_normal(dim).astype(np.float32)
+        for word in TEMPLATES + SUBJECTS + QUALIFIERS
+    }
+
+    vectors = {}
+    for text in texts:
+        template = next(t for t in TEMPLATES if text.startswith(t))
+        qualifier = next(q for q in QUALIFIERS if text.endswith(q))
+        subject = text[len(template) + 1:len(text) - len(qualifier) - 1]
+        v = centroids[subject] + 0.4 * centroids[template] + 0.25 * centroids[qualifier]
+        vectors[text] = (v / np.linalg.norm(v)).tolist()
+    return vectors
+
+
+def query_texts(count: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    return [f"{rng.choice(SUBJECTS)} {rng.choice(QUALIFIERS)}" for _ in range(count)]
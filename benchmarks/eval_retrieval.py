@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# benchmarks/eval_retrieval.py - recall@k, MRR and latency per search configuration
+#
+#   python -m benchmarks.eval_retrieval --backend local --scale 10k --out results/eval.json
+#   python -m benchmarks.eval_retrieval --configs configs.json --csv results/curve.csv
+#
+# Ground truth is exact brute-force cosine over each user's branch vectors (NumPy), so a
+# configuration that returns the true nearest neighbours scores recall 1.0. Each config is a
+# dict of search_memory keyword arguments, e.g. {"name": "hybrid", "mode": "hybrid"}.
+# The corpus is embedded with the same model as the queries; a corpus seeded with synthetic
+# vectors (benchmarks.run) is refused, since real queries can't be scored against it.
+
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+import numpy as np
+
+from benchmarks.corpus import SCALES, query_texts
+from benchmarks.run import BENCH_USER_PREFIX, SYNTHETIC_HASH_PREFIX, cleanup, seed_corpus
+
+DEFAULT_CONFIGS = [
+    {"name": "vector", "mode": "vector"},
+    {"name": "hybrid", "mode": "hybrid"},
+    {"name": "fulltext", "mode": "fulltext"},
+]
+
+# similarities within this of the k-th best count as ties, so duplicate texts don't cost recall
+TIE_EPSILON = 1e-5
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure retrieval quality against exact ground truth.")
+    parser.add_argument("--backend", choices=["local", "tidb"], default="local")
+    parser.add_argument("--scale", choices=list(SCALES), default="1k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=20, help="queries per user")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--configs", help="JSON file with a list of configurations")
+    parser.add_argument("--local-db")
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--keep", action="store_true")
+    parser.add_argument("--out", default="eval-results.json")
+    parser.add_argument("--csv", help="also write the latency-vs-recall curve as CSV")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.backend == "local":
+        path = args.local_db or os.path.join(tempfile.mkdtemp(prefix="atlas-eval-"), "eval.db")
+        os.environ["ATLAS_DB_URL"] = f"sqlite:///{path}"
+
+    import atlas_memory as am
+    from atlas_memory.memory import branch_vectors
+
+    am.init_db(am.engine)
+    rows = SCALES[args.scale]
+    if not args.skip_seed:
+        seed_corpus(rows, args.seed, real_vectors=True)
+
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs) as f:
+            configs = json.load(f)
+
+    rng = random.Random(args.seed)
+    all_users = [f"{BENCH_USER_PREFIX}{n}" for n in range(max(1, rows // 100))]
+    users = rng.sample(all_users, min(args.users, len(all_users)))
+    queries = query_texts(args.queries, args.seed)
+
+    try:
+        if has_synthetic_vectors(users):
+            sys.exit("The corpus was seeded with synthetic vectors; rerun without --skip-seed to embed it with the model")
+        truth = ground_truth(am.embed, branch_vectors, users, queries)
+        curve = [evaluate(am.search_memory, config, users, queries, truth, args.k) for config in configs]
+    finally:
+        if not args.keep:
+            cleanup(am)
+
+    results = {
+        "meta": {"backend": args.backend, "scale": args.scale, "seed": args.seed, "k": args.k,
+                 "users": len(users), "queries_per_user": len(queries)},
+        "curve": curve,
+    }
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    if args.csv:
+        write_csv(args.csv, curve)
+
+    print(f"{'config':<24} {'recall@k':>9} {'mrr':>7} {'p50 ms':>9} {'p95 ms':>9}")
+    for point in curve:
+        print(f"{point['name']:<24} {point['recall_at_k']:>9.3f} {point['mrr']:>7.3f} "
+              f"{point['p50_ms']:>9.2f} {point['p95_ms']:>9.2f}")
+
+
+def has_synthetic_vectors(users: List[str]) -> bool:
+    """Whether the seeded rows of `users` point at synthetic vectors rather than the model's."""
+    from sqlalchemy import bindparam, text
+    from atlas_memory.db import get_session
+    from atlas_memory.embeddings import content_hash
+
+    sql = text("SELECT text, content_hash FROM memories WHERE user_id IN :users LIMIT 1").bindparams(
+        bindparam("users", expanding=True)
+    )
+    with get_session() as db:
+        row = db.execute(sql, {"users": users}).first()
+    return row is not None and row.content_hash == content_hash(SYNTHETIC_HASH_PREFIX + row.text)
+
+
+def ground_truth(embed, branch_vectors, users: List[str], queries: List[str]) -> Dict:
+    """Exact cosine similarity of every query against every memory in each user's main branch."""
+    query_matrix = _normalize(np.array([embed(q) for q in queries], dtype=np.float32))
+
+    truth = {}
+    for user in users:
+        ids, vectors = branch_vectors(user, "main")
+        if not ids:
+            continue
+        sims = query_matrix @ _normalize(vectors).T
+        truth[user] = (np.array(ids), sims)
+    return truth
+
+
+def evaluate(search, config: Dict, users: List[str], queries: List[str], truth: Dict, k: int) -> Dict:
+    kwargs = {key: value for key, value in config.items() if key != "name"}
+    kwargs.setdefault("top_k", k)
+
+    latencies, recalls, reciprocal_ranks = [], [], []
+    for user in users:
+        if user not in truth:
+            continue
+        ids, sims = truth[user]
+        for qi, query in enumerate(queries):
+            started = time.perf_counter()
+            results = search(user, query, branch="main", **kwargs)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+            returned = [r["id"] for r in results][:k]
+            recalls.append(recall_at_k(returned, ids, sims[qi], k))
+            reciprocal_ranks.append(reciprocal_rank(returned, ids, sims[qi]))
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    return {
+        "name": config.get("name", json.dumps(kwargs, sort_keys=True)),
+        "config": kwargs,
+        "queries": len(latencies),
+        "recall_at_k": float(np.mean(recalls)) if recalls else 0.0,
+        "mrr": float(np.mean(reciprocal_ranks)) if reciprocal_ranks else 0.0,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+    }
+
+
+def recall_at_k(returned: List[int], ids: np.ndarray, sims: np.ndarray, k: int) -> float:
+    k = min(k, len(ids))
+    if k == 0:
+        return 1.0
+    kth_best = np.partition(sims, -k)[-k]
+    relevant = set(ids[sims >= kth_best - TIE_EPSILON].tolist())
+    return min(k, len(relevant.intersection(returned))) / k
+
+
+def reciprocal_rank(returned: List[int], ids: np.ndarray, sims: np.ndarray) -> float:
+    best = set(ids[sims >= sims.max() - TIE_EPSILON].tolist())
+    for rank, memory_id in enumerate(returned, 1):
+        if memory_id in best:
+            return 1.0 / rank
+    return 0.0
+
+
+def write_csv(path: str, curve: List[Dict]):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "recall_at_k", "mrr", "p50_ms", "p95_ms", "p99_ms"])
+        for point in sorted(curve, key=lambda p: p["p50_ms"]):
+            writer.writerow([point["name"], point["recall_at_k"], point["mrr"],
+                             point["p50_ms"], point["p95_ms"], point["p99_ms"]])
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+if __name__ == "__main__":
+    main()
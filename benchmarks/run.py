@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# benchmarks/run.py - latency and throughput of the core operations, written to JSON
+#
+#   python -m benchmarks.run --backend local --scale 10k --out results/local-10k.json
+#   python -m benchmarks.run --backend tidb --scale 100k --out results/tidb-100k.json
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+import numpy as np
+
+from benchmarks.corpus import SCALES, TEMPLATES, SUBJECTS, QUALIFIERS, corpus_rows, synthetic_vectors, query_texts
+
+BENCH_USER_PREFIX = "bench-user-"
+# synthetic vectors are stored under hashes of namespaced text, so a real add_memory of the
+# same sentence never finds (and reuses) a made-up vector
+SYNTHETIC_HASH_PREFIX = "atlas-bench-synthetic:"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark atlasMemory operations on a synthetic corpus.")
+    parser.add_argument("--backend", choices=["local", "tidb"], default="local")
+    parser.add_argument("--scale", choices=list(SCALES), default="1k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--local-db", help="SQLite file for --backend local (default: a temp file)")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse a corpus seeded by a previous run")
+    parser.add_argument("--keep", action="store_true", help="don't delete the bench users afterwards")
+    parser.add_argument("--out", default="benchmark-results.json")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.backend == "local":
+        path = args.local_db or os.path.join(tempfile.mkdtemp(prefix="atlas-bench-"), "bench.db")
+        os.environ["ATLAS_DB_URL"] = f"sqlite:///{path}"
+
+    # imported late: the engine is created from the environment at import time
+    import atlas_memory as am
+
+    am.init_db(am.engine)
+    rows = SCALES[args.scale]
+    if not args.skip_seed:
+        started = time.perf_counter()
+        seed_corpus(rows, args.seed)
+        print(f"Seeded {rows} memories in {time.perf_counter() - started:.1f}s")
+
+    try:
+        operations = run_operations(am, rows, args)
+    finally:
+        if not args.keep:
+            cleanup(am)
+
+    results = {
+        "meta": {
+            "backend": args.backend,
+            "scale": args.scale,
+            "rows": rows,
+            "seed": args.seed,
+            "iterations": args.iterations,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "operations": operations,
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print_table(operations)
+    print(f"\nWrote {args.out}")
+
+
+def seed_corpus(rows: int, seed: int, chunk_size: int = 5000, real_vectors: bool = False):
+    from sqlalchemy import insert
+    from atlas_memory.db import get_session
+    from atlas_memory.embeddings import content_hash, embed_batch, store_embeddings
+    from atlas_memory.schema import Memory
+
+    texts = _corpus_texts()
+    if real_vectors:
+        vectors = dict(zip(texts, embed_batch(texts)))
+        hashes = {text: content_hash(text) for text in texts}
+    else:
+        vectors = synthetic_vectors(texts, seed)
+        hashes = {text: content_hash(SYNTHETIC_HASH_PREFIX + text) for text in texts}
+
+    with get_session() as db:
+        items = list(vectors.items())
+        for i in range(0, len(items), chunk_size):
+            store_embeddings(db, {hashes[text]: v for text, v in items[i:i + chunk_size]})
+            db.commit()
+
+        batch = []
+        for user_id, branch, text in corpus_rows(rows, seed):
+            batch.append({"user_id": user_id, "branch": branch, "text": text, "content_hash": hashes[text]})
+            if len(batch) == chunk_size:
+                db.execute(insert(Memory), batch)
+                db.commit()
+                batch = []
+        if batch:
+            db.execute(insert(Memory), batch)
+            db.commit()
+
+
+def _corpus_texts() -> List[str]:
+    return [f"{t} {s} {q}" for t in TEMPLATES for s in SUBJECTS for q in QUALIFIERS]
+
+
+def run_operations(am, rows: int, args) -> Dict[str, Dict]:
+    rng = random.Random(args.seed)
+    users = [f"{BENCH_USER_PREFIX}{n}" for n in range(max(1, rows // 100))]
+    queries = query_texts(args.iterations + args.warmup, args.seed)
+
+    def user(i):
+        return users[rng.randrange(len(users))]
+
+    created = {"copy": [], "snapshot": []}
+
+    def save_point(mode):
+        def op(i):
+            u = user(i)
+            created[mode].append((u, am.save_point(u, f"bench-{mode}", "main", mode=mode)))
+        return op
+
+    def delete_branch(i):
+        u, branch = created["copy"].pop()
+        am.delete_branch(u, branch)
+
+    operations = {
+        "add_memory": lambda i: am.add_memory(user(i), f"Bench note {i}: {queries[i]}", branch="main"),
+        "search_memory_vector": lambda i: am.search_memory(user(i), queries[i], branch="main", mode="vector"),
+        "search_memory_fulltext": lambda i: am.search_memory(user(i), queries[i], branch="main", mode="fulltext"),
+        "search_memory_hybrid": lambda i: am.search_memory(user(i), queries[i], branch="main", mode="hybrid"),
+        "save_point_copy": save_point("copy"),
+        "save_point_snapshot": save_point("snapshot"),
+        "search_memory_snapshot": lambda i: _search_snapshot(am, created["snapshot"], queries, i),
+        "delete_branch": delete_branch,
+        "list_branches": lambda i: am.list_branches(user(i)),
+    }
+
+    results = {}
+    for name, fn in operations.items():
+        results[name] = measure(fn, args.iterations, args.warmup)
+        print(f"  {name:<24} p50 {results[name]['p50_ms']:>8.2f} ms")
+    return results
+
+
+def _search_snapshot(am, snapshots, queries, i):
+    user_id, branch = snapshots[i % len(snapshots)]
+    return am.search_memory(user_id, queries[i], branch=branch, mode="vector")
+
+
+def measure(fn: Callable[[int], object], iterations: int, warmup: int) -> Dict:
+    for i in range(warmup):
+        fn(i)
+
+    samples: List[float] = []
+    started = time.perf_counter()
+    for i in range(warmup, warmup + iterations):
+        t = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - t) * 1000)
+    elapsed = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        "iterations": iterations,
+        "mean_ms": float(np.mean(samples)),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(np.max(samples)),
+        "throughput_ops": iterations / elapsed if elapsed else 0.0,
+    }
+
+
+def cleanup(am, chunk_size: int = 10000):
+    """Delete everything the bench users wrote, and the vectors and passages nothing else references."""
+    from sqlalchemy import bindparam, text
+    from atlas_memory.embeddings import content_hash
+    from atlas_memory.registry import model_versions
+    params = {"prefix": f"{BENCH_USER_PREFIX}%", "limit": chunk_size}
+
+    with am.get_session() as db:
+        hashes = set(db.execute(text("""
+            SELECT DISTINCT content_hash FROM memories WHERE user_id LIKE :prefix AND content_hash IS NOT NULL
+            UNION
+            SELECT DISTINCT content_hash FROM memory_archive WHERE user_id LIKE :prefix
+        """), params).scalars())
+        # seed_corpus stores a vector for every corpus text, used or not
+        hashes.update(content_hash(prefix + t) for t in _corpus_texts() for prefix in ("", SYNTHETIC_HASH_PREFIX))
+        users = db.execute(text("""
+            SELECT DISTINCT user_id FROM memory_archive WHERE user_id LIKE :prefix
+            UNION
+            SELECT DISTINCT user_id FROM branch_versions WHERE user_id LIKE :prefix
+        """), params).scalars().all()
+
+        # chunked so TiDB never sees one huge delete transaction
+        for table, key in (("memories", "id"), ("save_points", "id"), ("memory_changes", "seq"),
+                           ("memory_compactions", "id")):
+            delete = text(f"DELETE FROM {table} WHERE {key} IN :ids").bindparams(bindparam("ids", expanding=True))
+            while True:
+                ids = db.execute(
+                    text(f"SELECT {key} FROM {table} WHERE user_id LIKE :prefix LIMIT :limit"), params
+                ).scalars().all()
+                if not ids:
+                    break
+                db.execute(delete, {"ids": ids})
+                db.commit()
+        for user_id in users:
+            for table in ("memory_archive", "branch_versions"):
+                db.execute(text(f"DELETE FROM {table} WHERE user_id = :user_id"), {"user_id": user_id})
+            db.commit()
+
+        # vectors and passages are shared by content, so only drop the ones no remaining row uses
+        hashes = list(hashes)
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            orphans = set(chunk) - _in_use(db, "memories", chunk) - _in_use(db, "memory_archive", chunk) - set(
+                _select_in(db, "SELECT content_hash FROM passages WHERE content_hash IN :hashes", chunk)
+            )
+            if not orphans:
+                continue
+            passage_hashes = _select_in(db, "SELECT content_hash FROM passages WHERE parent_hash IN :hashes", orphans)
+            _select_in(db, "DELETE FROM passages WHERE parent_hash IN :hashes", orphans, fetch=False)
+            passage_hashes = set(passage_hashes) - set(
+                _select_in(db, "SELECT content_hash FROM passages WHERE content_hash IN :hashes", passage_hashes)
+            ) - _in_use(db, "memories", passage_hashes)
+            for version in model_versions().values():
+                _select_in(
+                    db, f"DELETE FROM {version.table_name} WHERE model = :model AND content_hash IN :hashes",
+                    orphans | passage_hashes, fetch=False, model=version.name
+                )
+            db.commit()
+
+
+def _in_use(db, table: str, hashes) -> set:
+    return set(_select_in(db, f"SELECT content_hash FROM {table} WHERE content_hash IN :hashes", hashes))
+
+
+def _select_in(db, sql: str, hashes, fetch: bool = True, **params):
+    from sqlalchemy import bindparam, text
+    if not hashes:
+        return []
+    result = db.execute(text(sql).bindparams(bindparam("hashes", expanding=True)), {"hashes": list(hashes), **params})
+    return result.scalars().all() if fetch else result.rowcount
+
+
+def print_table(operations: Dict[str, Dict]):
+    print(f"\n{'operation':<24} {'p50':>9} {'p95':>9} {'p99':>9} {'ops/s':>9}")
+    for name, r in operations.items():
+        print(f"{name:<24} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['throughput_ops']:>9.1f}")
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# benchmarks/vector_encoding.py - bytes on the wire and CPU per query vector, per encoding
+#
+#   python -m benchmarks.vector_encoding --queries 2000 --out results/vector-encoding.json
+#   python -m benchmarks.vector_encoding --real-vectors
+
+import argparse
+import json
+import time
+from typing import Callable, Dict, List
+import numpy as np
+from tidb_vector.utils import encode_vector as tidb_encode_vector
+
+from atlas_memory.vectors import encode_vector
+from benchmarks.corpus import DIM, query_texts
+
+ENCODINGS: Dict[str, Callable[[np.ndarray], str]] = {
+    # what search_memory used to send: the float64 list embed() built, through str()
+    "str_list": lambda v: str(v.tolist()),
+    # what VectorType binds for an ndarray
+    "tidb_vector": tidb_encode_vector,
+    "float32_text": encode_vector,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare query vector encodings.")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--real-vectors", action="store_true", help="embed the queries with the model")
+    parser.add_argument("--out", default=None)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.real_vectors:
+        from atlas_memory.embeddings import embed_batch
+        vectors = list(embed_batch(query_texts(args.queries, args.seed)))
+    else:
+        # unit vectors, like sentence-transformers output
+        matrix = np.random.default_rng(args.seed).standard_normal((args.queries, DIM)).astype(np.float32)
+        vectors = list(matrix / np.linalg.norm(matrix, axis=1, keepdims=True))
+
+    report = {"queries": len(vectors), "dim": len(vectors[0]) if vectors else DIM, "encodings": {}}
+    print(f"{'encoding':<16}{'bytes/query':>14}{'us/query':>12}{'exact':>8}")
+    for name, encode in ENCODINGS.items():
+        result = measure(encode, vectors)
+        report["encodings"][name] = result
+        print(f"{name:<16}{result['bytes']:>14.0f}{result['us']:>12.1f}{str(result['exact']):>8}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def measure(encode: Callable[[np.ndarray], str], vectors: List[np.ndarray]) -> Dict:
+    # process time, so the number is the CPU this process spends, not wall clock
+    start = time.process_time()
+    encoded = [encode(v) for v in vectors]
+    elapsed = time.process_time() - start
+
+    # TiDB stores float32, so "exact" means the same float32 comes back out
+    exact = all(
+        np.array_equal(np.array(s[1:-1].split(","), dtype=np.float32), v) for s, v in zip(encoded, vectors)
+    )
+    return {
+        "bytes": sum(len(s) for s in encoded) / len(encoded),
+        "us": elapsed / len(encoded) * 1e6,
+        "exact": exact,
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,11 @@
 
 from atlas_memory.db import engine
 from atlas_memory.schema import init_db
+from atlas_memory.embeddings import migrate_inline_embeddings
 
 if __name__ == "__main__":
     init_db(engine)
+    # older tables stored a vector per row, move those to the shared embeddings table
+    migrated = migrate_inline_embeddings()
+    if migrated:
+        print(f"Moved {migrated} inline embeddings to the shared embeddings table.")
@@ -14,6 +14,8 @@ from atlas_memory import (
     init_db,
     engine,
     get_session,
+    profile,
+    format_queries,
 )
 from atlas_memory.schema import Memory
 
@@ -157,6 +159,7 @@ def init_database():
 
 init_database()
 
+
 # Session state initialization
 if "user_id" not in st.session_state:
     st.session_state.user_id = f"demo-{uuid.uuid4().hex[:8]}"
@@ -168,6 +171,8 @@ if "memories_added" not in st.session_state:
     st.session_state.memories_added = False
 if "experiment_branch" not in st.session_state:
     st.session_state.experiment_branch = None
+if "branch_sql" not in st.session_state:
+    st.session_state.branch_sql = None
 
 user_id = st.session_state.user_id
 current_branch = st.session_state.current_branch
@@ -221,7 +226,8 @@ with col1:
                 "source": source,
                 "tags": [t.strip() for t in tags.split(",") if t.strip()]
             }
-            memory_id = add_memory(user_id, memory_text, metadata, current_branch)
+            with profile() as statements:
+                memory_id = add_memory(user_id, memory_text, metadata, current_branch)
             st.success(f"Memory added (ID: {memory_id})")
             st.session_state.memories_added = True
             if st.session_state.step == 1:
@@ -229,8 +235,7 @@ with col1:
 
             # Show SQL
             with st.expander("View SQL"):
-                st.code(f"""INSERT INTO memories (user_id, text, metadata_json, embedding, branch)
-VALUES ('{user_id}', '{memory_text[:30]}...', '{metadata}', <384-dim vector>, '{current_branch}')""", language="sql")
+                st.code(format_queries(statements), language="sql")
         else:
             st.error("Enter some text first")
 
@@ -270,7 +275,8 @@ with col2:
 
     if st.button("Search", type="primary", use_container_width=True):
         if query.strip():
-            results = search_memory(user_id, query, top_k=5, branch=current_branch, mode=mode)
+            with profile() as statements:
+                results = search_memory(user_id, query, top_k=5, branch=current_branch, mode=mode)
 
             if st.session_state.step == 2:
                 st.session_state.step = 3
@@ -292,28 +298,7 @@ with col2:
 
             # Show SQL
             with st.expander("View SQL"):
-                if mode == "vector":
-                    sql = f"""SELECT id, text, metadata_json,
-       vec_cosine_distance(embedding, <query_vector>) as distance
-FROM memories
-WHERE user_id='{user_id}' AND branch='{current_branch}'
-ORDER BY distance ASC
-LIMIT 5"""
-                elif mode == "fulltext":
-                    sql = f"""SELECT id, text, metadata_json
-FROM memories
-WHERE user_id='{user_id}' AND branch='{current_branch}'
-  AND text LIKE '%{query}%'
-LIMIT 5"""
-                else:
-                    sql = f"""-- Step 1: Vector search
-SELECT id, text, vec_cosine_distance(embedding, <query_vector>) as distance
-FROM memories WHERE user_id='{user_id}' AND branch='{current_branch}'
-ORDER BY distance LIMIT 10
-
--- Step 2: Boost results that also match fulltext
--- Re-rank by boosted score"""
-                st.code(sql, language="sql")
+                st.code(format_queries(statements), language="sql")
         else:
             st.error("Enter a search query")
 
@@ -325,7 +310,9 @@ col3, col4, col5 = st.columns(3)
 
 with col3:
     if st.button("Create Experiment Branch", use_container_width=True, disabled=current_branch != "main"):
-        new_branch = save_point(user_id, "experiment", "main")
+        with profile() as statements:
+            new_branch = save_point(user_id, "experiment", "main")
+        st.session_state.branch_sql = format_queries(statements)
         st.session_state.experiment_branch = new_branch
         st.session_state.current_branch = new_branch
         st.session_state.step = 4
@@ -359,13 +346,9 @@ with col5:
             st.rerun()
 
 # Show SQL for branching
-if st.session_state.experiment_branch:
+if st.session_state.experiment_branch and st.session_state.branch_sql:
     with st.expander("View Branching SQL"):
-        st.code(f"""-- Copy all memories from main to new branch
-INSERT INTO memories (user_id, text, metadata_json, embedding, branch)
-SELECT user_id, text, metadata_json, embedding, '{st.session_state.experiment_branch}'
-FROM memories
-WHERE user_id='{user_id}' AND branch='main'""", language="sql")
+        st.code(st.session_state.branch_sql, language="sql")
 
 # Current memories
 st.divider()
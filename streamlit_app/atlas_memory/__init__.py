@@ -5,6 +5,7 @@ from atlas_memory.branching import save_point, load_point, delete_branch, list_b
 from atlas_memory.embeddings import embed
 from atlas_memory.db import get_session, engine
 from atlas_memory.schema import Memory, init_db
+from atlas_memory.profiling import profile, format_queries
 
 
 class MemoryClient:
@@ -52,4 +53,6 @@ __all__ = [
     "engine",
     "Memory",
     "init_db",
+    "profile",
+    "format_queries",
 ]
@@ -47,3 +47,10 @@ def get_session():
         yield db
     finally:
         db.close()
+
+
+@contextmanager
+def get_autocommit_connection():
+    # stale reads (AS OF TIMESTAMP) can't run inside an explicit transaction
+    with engine.connect() as conn:
+        yield conn.execution_options(isolation_level="AUTOCOMMIT")
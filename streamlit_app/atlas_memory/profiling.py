@@ -0,0 +1,153 @@
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+
+from atlas_memory.db import engine, get_autocommit_connection
+
+_queries: ContextVar[Optional[List[Dict]]] = ContextVar("atlas_memory_queries", default=None)
+
+_SELECT = re.compile(r"^\s*(\(\s*)*(SELECT|WITH)\b", re.IGNORECASE)
+_WRITE = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+_SQLITE_INDEX = re.compile(r"USING (?:COVERING )?INDEX (\w+)|USING (INTEGER PRIMARY KEY|PRIMARY KEY)")
+_TIDB_INDEX = re.compile(r"(?:index|annIndex):\s*(?:\w+\()?\s*(\w+)")
+_TIDB_TIME = re.compile(r"time:\s*([\d.]+)(ns|µs|us|ms|s)\b")
+_TIME_UNITS = {"ns": 1e-6, "µs": 1e-3, "us": 1e-3, "ms": 1.0, "s": 1000.0}
+
+# vectors are thousands of characters, abbreviate anything this long when displaying
+_MAX_PARAM_CHARS = 80
+
+
+@contextmanager
+def profile(explain: bool = False):
+    """Capture every statement executed inside the block, with its bound parameters.
+
+        with profile(explain=True) as queries:
+            search_memory("u1", "beach trips")
+        queries[0]["sql"], queries[0]["params"], queries[0]["plan"], queries[0]["indexes"]
+
+    With explain=True each captured SELECT is re-run under EXPLAIN ANALYZE (EXPLAIN QUERY PLAN
+    on SQLite) after the block, adding plan, indexes, rows_scanned and execution_ms. Writes
+    such as save_point's INSERT ... SELECT get a plain EXPLAIN, which plans without running
+    them, so they have no rows_scanned or execution_ms and are marked "analyzed": False.
+    """
+    captured: List[Dict] = []
+    token = _queries.set(captured)
+    try:
+        yield captured
+    finally:
+        _queries.reset(token)
+    if explain:
+        explain_queries(captured)
+
+
+def explain_queries(queries: List[Dict]):
+    explained = [
+        (q, bool(_SELECT.match(q["sql"]))) for q in queries
+        if not q["executemany"] and (_SELECT.match(q["sql"]) or _WRITE.match(q["sql"]))
+    ]
+    if not explained:
+        return
+
+    sqlite = engine.dialect.name == "sqlite"
+    # autocommit, because stale reads (AS OF TIMESTAMP) can't run in a transaction
+    with get_autocommit_connection() as conn:
+        for q, analyze in explained:
+            # EXPLAIN ANALYZE runs the statement, which a write must not do twice
+            prefix = "EXPLAIN QUERY PLAN " if sqlite else ("EXPLAIN ANALYZE " if analyze else "EXPLAIN ")
+            try:
+                rows = conn.exec_driver_sql(prefix + q["sql"], q["params"] or None).fetchall()
+            except DBAPIError as e:
+                q["plan_error"] = str(e.orig or e)
+                continue
+            q.update(summarize_plan([dict(r._mapping) for r in rows]), analyzed=analyze)
+
+
+def summarize_plan(rows: List[Dict]) -> Dict:
+    indexes, rows_scanned, execution_ms = [], None, None
+
+    for row in rows:
+        values = {str(k).lower(): v for k, v in row.items()}
+        if "detail" in values:
+            # SQLite: (id, parent, notused, detail)
+            match = _SQLITE_INDEX.search(str(values["detail"]))
+            name = match and (match.group(1) or "PRIMARY")
+            if name and name not in indexes:
+                indexes.append(name)
+            continue
+
+        # TiDB: id, estRows, actRows, task, access object, execution info, operator info, ...
+        operator = str(values.get("id", ""))
+        access = str(values.get("access object", ""))
+        for name in _TIDB_INDEX.findall(access):
+            if name not in indexes:
+                indexes.append(name)
+        if "Scan" in operator and values.get("actrows") not in (None, ""):
+            rows_scanned = (rows_scanned or 0) + int(float(values["actrows"]))
+        if execution_ms is None:
+            match = _TIDB_TIME.search(str(values.get("execution info", "")))
+            if match:
+                execution_ms = float(match.group(1)) * _TIME_UNITS[match.group(2)]
+
+    return {"plan": rows, "indexes": indexes, "rows_scanned": rows_scanned, "execution_ms": execution_ms}
+
+
+def format_queries(queries: List[Dict]) -> str:
+    """The captured statements as one SQL script, parameters and plans as comments."""
+    blocks = []
+    for q in queries:
+        lines = [f"-- {q['duration_ms']:.2f} ms" + (f", {q['rowcount']} rows" if q["rowcount"] >= 0 else "")]
+        lines.append(q["sql"].strip().rstrip(";") + ";")
+        if q["params"] and q["executemany"]:
+            lines.append(f"-- params ({len(q['params'])} rows), first: {_display_params(q['params'][0])}")
+        elif q["params"]:
+            lines.append(f"-- params: {_display_params(q['params'])}")
+        if "plan" in q:
+            lines.append(
+                f"-- plan{'' if q.get('analyzed', True) else ' (not run)'}: indexes={', '.join(q['indexes']) or 'none'}"
+                f" rows_scanned={q['rows_scanned'] if q['rows_scanned'] is not None else 'n/a'}"
+                f" execution_ms={q['execution_ms'] if q['execution_ms'] is not None else 'n/a'}"
+            )
+            lines.extend("--   " + " | ".join(str(v) for v in row.values()) for row in q["plan"])
+        elif "plan_error" in q:
+            lines.append(f"-- plan unavailable: {q['plan_error']}")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def _display_params(params):
+    if isinstance(params, dict):
+        return {k: _short(v) for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        return type(params)(_display_params(p) if isinstance(p, (dict, list, tuple)) else _short(p) for p in params)
+    return _short(params)
+
+
+def _short(value):
+    if isinstance(value, (str, bytes)) and len(value) > _MAX_PARAM_CHARS:
+        return f"{value[:_MAX_PARAM_CHARS // 2]!s}... ({len(value)} chars)"
+    return value
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _queries.get() is not None:
+        conn.info["atlas_profile_started"] = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    captured = _queries.get()
+    if captured is None:
+        return
+    started = conn.info.pop("atlas_profile_started", None)
+    captured.append({
+        "sql": statement,
+        "params": parameters,
+        "executemany": executemany,
+        "duration_ms": (time.perf_counter() - started) * 1000 if started is not None else 0.0,
+        "rowcount": cursor.rowcount,
+    })
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from benchmarks.compare import find_regressions
+from benchmarks.eval_retrieval import recall_at_k, reciprocal_rank
+
+
+IDS = np.array([10, 11, 12, 13])
+SIMS = np.array([0.9, 0.2, 0.7, 0.5])
+
+
+class TestRetrievalScores:
+    """Tests for the recall@k and MRR helpers of eval_retrieval."""
+
+    def test_recall_at_k(self):
+        """Recall counts how many of the true top k came back, in any order."""
+        assert recall_at_k([12, 10], IDS, SIMS, 2) == 1.0
+        assert recall_at_k([10, 13], IDS, SIMS, 2) == 0.5
+        assert recall_at_k([11, 13], IDS, SIMS, 2) == 0.0
+        assert recall_at_k([10, 12, 13, 11], IDS, SIMS, 10) == 1.0
+
+    def test_recall_counts_ties(self):
+        """Either of two equally similar rows satisfies the k-th slot."""
+        sims = np.array([0.9, 0.5, 0.5, 0.1])
+        assert recall_at_k([10, 11], IDS, sims, 2) == recall_at_k([10, 12], IDS, sims, 2) == 1.0
+
+    def test_reciprocal_rank(self):
+        """The reciprocal rank is 1 / the position of the best row, or 0 when it is missing."""
+        assert reciprocal_rank([10, 12], IDS, SIMS) == 1.0
+        assert reciprocal_rank([12, 13, 10], IDS, SIMS) == pytest.approx(1 / 3)
+        assert reciprocal_rank([12, 13], IDS, SIMS) == 0.0
+
+
+class TestCompare:
+    """Tests for the p95 regression threshold of benchmarks.compare."""
+
+    @staticmethod
+    def _run(**p95):
+        return {"operations": {name: {"p50_ms": 1.0, "p95_ms": v, "p99_ms": v} for name, v in p95.items()}}
+
+    def test_flags_only_p95_over_threshold(self):
+        """A p95 that grows by exactly the threshold passes; anything more fails."""
+        baseline = self._run(add=10.0, search=10.0, delete=10.0)
+        candidate = self._run(add=11.5, search=11.6, delete=5.0)
+        assert find_regressions(baseline, candidate, 15) == ["search"]
+
+    def test_no_threshold_or_missing_operation(self):
+        """Without --fail-over nothing fails, and operations missing from a run are skipped."""
+        assert find_regressions(self._run(add=1.0), self._run(add=100.0), None) == []
+        assert find_regressions(self._run(add=1.0, merge=1.0), self._run(add=1.0), 0) == []
+        assert find_regressions(self._run(add=0.0), self._run(add=5.0), 0) == []
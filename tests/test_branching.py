@@ -6,6 +6,7 @@ from atlas_memory import (
     load_point,
     delete_branch,
     list_branches,
+    materialize_snapshot,
     init_db,
     engine
 )
@@ -122,3 +123,86 @@ class TestListBranches:
         assert isinstance(branches, list)
         assert "main" in branches
         assert "branch-a" in branches
+
+
+class TestSnapshotSavePoint:
+    """Tests for save_point in snapshot mode."""
+
+    def test_snapshot_sees_memories_before_not_after(self):
+        """A snapshot should read the source branch as it was when taken."""
+        user_id = "test-snapshot-user"
+        add_memory(user_id, "Before snapshot memory", branch="main")
+
+        snapshot = save_point(user_id, "snap", source_branch="main", mode="snapshot")
+        add_memory(user_id, "After snapshot memory", branch="main")
+
+        results = search_memory(user_id, "snapshot memory", top_k=50, branch=snapshot)
+        texts = [r["text"] for r in results]
+        assert "Before snapshot memory" in texts
+        assert "After snapshot memory" not in texts
+
+    def test_snapshot_is_read_only(self):
+        """Writes to a snapshot branch should be rejected."""
+        user_id = "test-snapshot-readonly-user"
+        add_memory(user_id, "Some memory", branch="main")
+        snapshot = save_point(user_id, "snap", source_branch="main", mode="snapshot")
+
+        with pytest.raises(ValueError, match="read-only"):
+            add_memory(user_id, "Should not be written", branch=snapshot)
+
+    def test_at_sign_in_plain_branch_is_writable(self):
+        """Only snapshot save points are read-only, not every name with the mark in it."""
+        user_id = "test-snapshot-name-user"
+        add_memory(user_id, "Work memory", branch="alice@work")
+
+        results = search_memory(user_id, "work", branch="alice@work")
+        assert [r["text"] for r in results] == ["Work memory"]
+
+    def test_materialized_snapshot_is_writable(self):
+        """Once a snapshot has its own rows, it takes writes."""
+        user_id = "test-snapshot-materialized-write-user"
+        add_memory(user_id, "Before", branch="main")
+        snapshot = save_point(user_id, "snap", source_branch="main", mode="snapshot")
+        materialize_snapshot(user_id, snapshot)
+
+        add_memory(user_id, "After", branch=snapshot)
+
+        texts = {r["text"] for r in search_memory(user_id, "Before After", top_k=10, branch=snapshot)}
+        assert texts == {"Before", "After"}
+
+    def test_snapshot_ignores_in_place_updates(self):
+        """A dedup count on the source shouldn't change what an earlier snapshot reads."""
+        user_id = "test-snapshot-update-user"
+        add_memory(user_id, "User drinks oat milk", {"source": "chat"}, branch="main")
+        snapshot = save_point(user_id, "snap", source_branch="main", mode="snapshot")
+        add_memory(user_id, "User drinks oat milk", {"source": "email"}, branch="main", dedup="merge")
+
+        [before] = search_memory(user_id, "oat milk", branch=snapshot, mode="fulltext")
+        [after] = search_memory(user_id, "oat milk", branch="main", mode="fulltext")
+        assert before["metadata"] == {"source": "chat"}
+        assert after["metadata"] == {"source": "email"}
+
+    def test_snapshot_survives_source_deletion(self):
+        """Deleting the source branch should not empty its snapshots."""
+        user_id = "test-snapshot-delete-user"
+        add_memory(user_id, "Experiment memory", branch="experiment")
+        snapshot = save_point(user_id, "snap", source_branch="experiment", mode="snapshot")
+
+        delete_branch(user_id, "experiment")
+
+        results = search_memory(user_id, "experiment", branch=snapshot)
+        assert "Experiment memory" in [r["text"] for r in results]
+
+    def test_snapshot_listed_and_deleted(self):
+        """Snapshots show up in list_branches until deleted."""
+        user_id = "test-snapshot-list-user"
+        add_memory(user_id, "Main memory", branch="main")
+        snapshot = save_point(user_id, "snap", source_branch="main", mode="snapshot")
+
+        assert snapshot in list_branches(user_id)
+        delete_branch(user_id, snapshot)
+        assert snapshot not in list_branches(user_id)
+
+    def test_unknown_mode_rejected(self):
+        with pytest.raises(ValueError, match="Unknown save point mode"):
+            save_point("any-user", "tag", mode="bogus")
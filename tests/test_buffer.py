@@ -0,0 +1,134 @@
+import gc
+import json
+import threading
+import weakref
+import pytest
+from atlas_memory import MemoryClient, SearchResult, WriteBuffer, search_memory, init_db, engine
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+class TestWriteBehind:
+    """Tests for the write-behind MemoryClient mode."""
+
+    def test_add_returns_future_with_id(self):
+        """add() should return immediately with a Future that resolves to the row id."""
+        client = MemoryClient("test-buffer-user", write_behind=True, flush_interval=10)
+        future = client.add("User collects postcards")
+        assert not future.done()
+
+        assert client.flush(timeout=30)
+        assert future.result() > 0
+        client.close()
+
+    def test_batches_by_size(self):
+        """Reaching flush_size should write without waiting for the interval."""
+        client = MemoryClient("test-buffer-user", write_behind=True, flush_size=3, flush_interval=60)
+        futures = client.add_many([f"Buffered note {i}" for i in range(3)])
+
+        ids = [f.result(timeout=30) for f in futures]
+        assert len(set(ids)) == 3
+        client.close()
+
+    def test_read_your_writes(self):
+        """search() should return writes that haven't reached the database yet."""
+        client = MemoryClient("test-buffer-ryw", write_behind=True, flush_interval=60)
+        client.add("User is allergic to peanuts")
+
+        assert search_memory("test-buffer-ryw", "peanuts", mode="fulltext") == []
+        results = client.search("peanuts", mode="fulltext")
+        assert results[0]["text"] == "User is allergic to peanuts"
+        assert results[0]["pending"] is True
+        assert isinstance(results[0], SearchResult) and results[0].pending and results[0].score == 1.0
+
+        client.flush()
+        results = client.search("peanuts", mode="fulltext")
+        assert len(results) == 1
+        assert "pending" not in results[0]
+        client.close()
+
+    def test_save_point_flushes_first(self):
+        """A save point should include writes that were still queued."""
+        client = MemoryClient("test-buffer-save", write_behind=True, flush_interval=60)
+        client.add("User prefers trains")
+        branch = client.save_point("buffered")
+
+        assert search_memory("test-buffer-save", "trains", branch=branch, mode="fulltext")
+        client.close()
+
+    def test_journal_replays_uncommitted_writes(self, tmp_path):
+        """Writes journaled but never marked done should be written by the next buffer."""
+        journal = tmp_path / "writes.journal"
+        record = {"op": "add", "seq": 7, "user_id": "test-buffer-journal", "branch": "main",
+                  "text": "User flies business class", "metadata": {"source": "journal"}}
+        journal.write_text(json.dumps(record) + "\n" + '{"op": "add", "seq"')
+
+        buffer = WriteBuffer(durability="journal", journal_path=str(journal))
+        assert buffer.flush(timeout=30)
+        buffer.close()
+
+        results = search_memory("test-buffer-journal", "business class", mode="fulltext")
+        assert [r["text"] for r in results] == ["User flies business class"]
+        assert journal.read_text() == ""
+
+    def test_failed_batch_is_not_replayed(self, tmp_path, monkeypatch):
+        """A failed batch raises on its futures and leaves the journal, so a retry can't add it twice."""
+        import atlas_memory.buffer as buffer_module
+
+        def broken(*args, **kwargs):
+            raise RuntimeError("database is down")
+
+        journal = tmp_path / "failed.journal"
+        monkeypatch.setattr(buffer_module, "add_memories", broken)
+        buffer = WriteBuffer(durability="journal", journal_path=str(journal))
+        future = buffer.add("test-buffer-failed", "User sails a catamaran")
+        with pytest.raises(RuntimeError):
+            future.result(timeout=30)
+        buffer.close()
+        assert journal.read_text() == ""
+
+        monkeypatch.undo()
+        buffer = WriteBuffer(durability="journal", journal_path=str(journal))
+        assert buffer.pending("test-buffer-failed", "main") == []
+        buffer.close()
+
+    def test_close_with_timeout_leaves_journal_to_writer(self, tmp_path, monkeypatch):
+        """close() returning early must not close the journal under a batch that is still writing."""
+        import atlas_memory.buffer as buffer_module
+
+        release = threading.Event()
+        real = buffer_module.add_memories
+
+        def slow(*args, **kwargs):
+            release.wait(30)
+            return real(*args, **kwargs)
+
+        journal = tmp_path / "slow.journal"
+        monkeypatch.setattr(buffer_module, "add_memories", slow)
+        buffer = WriteBuffer(durability="journal", journal_path=str(journal), flush_interval=0)
+        future = buffer.add("test-buffer-slow", "User rows on the Tagus")
+        buffer.close(timeout=0.05)
+        release.set()
+
+        assert future.result(timeout=30) > 0
+        buffer._thread.join(30)
+        assert journal.read_text() == ""
+
+    def test_client_is_collected(self):
+        """A write-behind client shouldn't be kept alive until exit just to close it then."""
+        client = MemoryClient("test-buffer-gc", write_behind=True)
+        buffer, ref = client._buffer, weakref.ref(client)
+        del client
+        gc.collect()
+        assert ref() is None
+        buffer._thread.join(5)
+        assert not buffer._thread.is_alive()
+
+    def test_journal_requires_path(self):
+        """Durable modes need somewhere to write."""
+        with pytest.raises(ValueError):
+            WriteBuffer(durability="fsync")
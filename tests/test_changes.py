@@ -0,0 +1,185 @@
+from datetime import timedelta
+import pytest
+from sqlalchemy import insert
+from fastapi.testclient import TestClient
+from atlas_memory import (
+    add_memories,
+    search_memory,
+    ingest,
+    export_memories,
+    import_memories,
+    save_point,
+    delete_branch,
+    merge_branch,
+    read_changes,
+    follow_changes,
+    get_session,
+    init_db,
+    engine
+)
+from atlas_memory.changes import record_change, prune_changes, _utcnow
+from atlas_memory.schema import ChangeEvent
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+def _checkpoint() -> int:
+    with get_session() as db:
+        return db.query(ChangeEvent.seq).order_by(ChangeEvent.seq.desc()).limit(1).scalar() or 0
+
+
+def _ops(changes) -> list:
+    return [(c["op"], c["branch"]) for c in changes]
+
+
+class TestChangeFeed:
+    """Tests for the memory_changes outbox."""
+
+    def test_writes_record_events_in_order(self):
+        """add, save_point, merge and delete each leave an event, with growing seqs."""
+        user = "test-changes-user"
+        start = _checkpoint()
+        ids = add_memories(user, ["User likes figs", "User grows tomatoes"])
+        branch = save_point(user, "garden")
+        add_memories(user, ["User built a greenhouse"], branch=branch)
+        merge_branch(user, branch, "main")
+        delete_branch(user, branch)
+
+        page = read_changes(start, user_id=user)
+        assert _ops(page["changes"]) == [
+            ("add", "main"), ("save_point", branch), ("add", branch), ("merge", "main"), ("delete_branch", branch)
+        ]
+        assert page["changes"][0]["memory_ids"] == ids
+        assert page["changes"][1]["detail"] == {"source_branch": "main", "mode": "copy"}
+        assert page["changes"][3]["detail"] == {"source": branch, "added": 1}
+        [greenhouse] = [r["id"] for r in search_memory(user, "greenhouse", branch="main", mode="fulltext")]
+        assert page["changes"][3]["memory_ids"] == [greenhouse]
+        seqs = [c["seq"] for c in page["changes"]]
+        assert seqs == sorted(seqs) and page["checkpoint"] >= seqs[-1]
+        assert read_changes(page["checkpoint"])["changes"] == []
+
+    def test_user_filter_moves_checkpoint(self):
+        """Other users' events are skipped but still advance the checkpoint."""
+        start = _checkpoint()
+        add_memories("test-changes-other", ["User likes rain"])
+        page = read_changes(start, user_id="test-changes-nobody")
+        assert page["changes"] == []
+        assert page["checkpoint"] == _checkpoint()
+
+    def test_waits_at_young_gap(self):
+        """A missing seq holds the feed back until the event after it is `settle` seconds old."""
+        user = "test-changes-gap"
+        start = _checkpoint()
+        with get_session() as db:
+            # start + 1 belongs to a write that hasn't committed yet
+            db.execute(insert(ChangeEvent.__table__), {
+                "seq": start + 2, "user_id": user, "branch": "main", "op": "add", "memory_ids": [2],
+                "created_at": _utcnow(),
+            })
+            db.commit()
+
+        assert read_changes(start, user_id=user, settle=60) == {"changes": [], "checkpoint": start}
+        assert [c["memory_ids"] for c in read_changes(start, user_id=user, settle=0)["changes"]] == [[2]]
+
+        with get_session() as db:
+            db.execute(insert(ChangeEvent.__table__), {
+                "seq": start + 1, "user_id": user, "branch": "main", "op": "add", "memory_ids": [1],
+                "created_at": _utcnow(),
+            })
+            db.commit()
+        page = read_changes(start, user_id=user, settle=60)
+        assert [c["memory_ids"] for c in page["changes"]] == [[1], [2]]
+
+    def test_follow_and_prune(self):
+        user = "test-changes-follow"
+        start = _checkpoint()
+        add_memories(user, ["User reads sci-fi"])
+        add_memories(user, ["User reads poetry"])
+
+        feed = follow_changes(start, user_id=user, poll_interval=0.01)
+        assert [next(feed)["op"], next(feed)["op"]] == ["add", "add"]
+
+        # retention drops the oldest events, so age everything so far
+        end = _checkpoint()
+        with get_session() as db:
+            db.query(ChangeEvent).filter(ChangeEvent.seq <= end).update({"created_at": _utcnow() - timedelta(days=30)})
+            db.commit()
+        assert prune_changes(older_than_days=7) >= 2
+        add_memories(user, ["User reads essays"])
+        assert [c["seq"] for c in read_changes(start, user_id=user, settle=0)["changes"]] == [_checkpoint()]
+
+    def test_stamped_at_commit(self):
+        """An event is written and dated by the commit, not by record_change."""
+        user = "test-changes-commit"
+        start = _checkpoint()
+        with get_session() as db:
+            record_change(db, user, "main", "add", [1])
+            assert _checkpoint() == start
+            recorded = _utcnow()
+            db.commit()
+        changes = read_changes(start, user_id=user, settle=0)["changes"]
+        assert len(changes) == 1 and changes[0]["created_at"] >= recorded.isoformat()
+
+    def test_rollback_drops_event(self):
+        user = "test-changes-rollback"
+        start = _checkpoint()
+        with get_session() as db:
+            record_change(db, user, "main", "add", [1])
+            db.rollback()
+            db.commit()
+        assert read_changes(start, user_id=user, settle=0)["changes"] == []
+
+    def test_bulk_writes_list_their_ids(self, tmp_path):
+        """ingest and import name the rows they inserted, so mirrors don't have to reread the branch."""
+        user = "test-changes-bulk"
+        start = _checkpoint()
+        ingest(user, [f"User collects stamp {i}" for i in range(5)], batch_size=2, insert_workers=2)
+        path = str(tmp_path / "bulk.ndjson")
+        export_memories(user, path)
+        import_memories(user, path, branch="copy")
+
+        changes = read_changes(start, user_id=user, settle=0)["changes"]
+        added = sorted(i for c in changes if c["op"] == "add" for i in c["memory_ids"])
+        imported = [i for c in changes if c["op"] == "import" for i in c["memory_ids"]]
+        main = search_memory(user, "stamp", top_k=10, branch="main", mode="fulltext")
+        copy = search_memory(user, "stamp", top_k=10, branch="copy", mode="fulltext")
+        assert added == sorted(r["id"] for r in main)
+        assert sorted(imported) == sorted(r["id"] for r in copy)
+
+    def test_dedup_hits_are_not_adds(self):
+        """Only inserted rows are adds; merged rows are updates, skipped ones leave no event."""
+        user = "test-changes-dedup"
+        [first] = add_memories(user, ["User keeps bees"])
+        start = _checkpoint()
+        add_memories(user, ["User keeps bees"], dedup="skip")
+        assert read_changes(start, user_id=user, settle=0)["changes"] == []
+
+        ids = add_memories(user, ["User keeps bees", "User sells honey"], dedup="merge")
+        changes = read_changes(start, user_id=user, settle=0)["changes"]
+        assert [(c["op"], c["memory_ids"]) for c in changes] == [("add", [ids[1]]), ("update", [first])]
+        assert changes[1]["detail"] == {"dedup": "merge"}
+
+    def test_unknown_op(self):
+        with get_session() as db, pytest.raises(ValueError):
+            record_change(db, "test-changes-user", "main", "rename")
+
+
+class TestChangeEndpoints:
+    """Tests for the long-poll endpoint of the web UI."""
+
+    def test_long_poll(self):
+        from ui.app import app
+
+        user = "test-changes-http"
+        start = _checkpoint()
+        add_memories(user, ["User likes the sea"])
+        client = TestClient(app)
+        body = client.get("/api/changes", params={"after": start, "user_id": user, "wait": 0}).json()
+        assert _ops(body["changes"]) == [("add", "main")]
+
+        empty = client.get("/api/changes", params={"after": body["checkpoint"], "wait": 0}).json()
+        assert empty == {"changes": [], "checkpoint": body["checkpoint"]}
@@ -0,0 +1,95 @@
+import pytest
+from sqlalchemy import text
+from atlas_memory import add_memories, search_memory, init_db, engine, get_session
+from atlas_memory import compaction
+from atlas_memory.compaction import compact_branch
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+class TestCompactBranch:
+    """Tests for compact_branch."""
+
+    def test_dry_run_reports_without_writing(self):
+        """A dry run should report projected savings and leave the branch alone."""
+        user_id = "test-compact-dry-user"
+        branch = "compact-dry"
+        add_memories(user_id, ["Prefers trains", "Prefers trains", "Speaks French"], branch=branch)
+
+        report = compact_branch(user_id, branch, dry_run=True)
+
+        assert report["rows_before"] == 3
+        assert report["rows_removed"] == 1
+        assert report["rows_after"] == 2
+        assert report["bytes_saved"] > 0
+        assert len(search_memory(user_id, "trains", top_k=10, branch=branch, mode="vector")) == 3
+
+    def test_compaction_merges_and_audits(self):
+        """Redundant memories collapse into one survivor with merged metadata and an audit trail."""
+        user_id = "test-compact-user"
+        branch = "compact-apply"
+        ids = add_memories(
+            user_id,
+            ["Allergic to shellfish", "Allergic to shellfish", "Plays guitar"],
+            [{"tags": ["health"]}, {"tags": ["diet"]}, None],
+            branch=branch
+        )
+
+        report = compact_branch(user_id, branch)
+        assert report["rows_removed"] == 1
+
+        with get_session() as db:
+            survivor = db.execute(
+                text("SELECT occurrences FROM memories WHERE id = :id"), {"id": ids[0]}
+            ).scalar()
+            audit = db.execute(
+                text("SELECT old_id, survivor_id FROM memory_compactions WHERE old_id = :id"), {"id": ids[1]}
+            ).fetchall()
+
+        assert survivor == 2
+        assert [(r.old_id, r.survivor_id) for r in audit] == [(ids[1], ids[0])]
+        results = search_memory(user_id, "shellfish", top_k=10, branch=branch, mode="vector")
+        assert len(results) == 2
+
+    def test_scans_in_batches(self):
+        """Duplicates that land in different scan batches are still clustered together."""
+        user_id = "test-compact-batch-user"
+        branch = "compact-batch"
+        add_memories(user_id, ["Owns a cat", "Runs marathons", "Likes jazz", "Owns a cat"], branch=branch)
+
+        report = compact_branch(user_id, branch, batch_size=2)
+
+        assert report["rows_before"] == 4
+        assert report["rows_removed"] == 1
+
+    def test_writes_after_the_scan_are_not_lost(self, monkeypatch):
+        """Counts bumped and rows deleted between the scan and the apply are honoured."""
+        user_id = "test-compact-race-user"
+        branch = "compact-race"
+        ids = add_memories(
+            user_id, ["Drinks green tea", "Drinks green tea", "Drinks green tea", "Hates mornings"], branch=branch
+        )
+        scan = compaction._scan
+
+        def racing_scan(*args):
+            scanned = scan(*args)
+            with get_session() as db:
+                db.execute(text("UPDATE memories SET occurrences = 5 WHERE id = :id"), {"id": ids[1]})
+                db.execute(text("DELETE FROM memories WHERE id = :id"), {"id": ids[2]})
+                db.commit()
+            return scanned
+
+        monkeypatch.setattr(compaction, "_scan", racing_scan)
+        report = compact_branch(user_id, branch)
+
+        with get_session() as db:
+            survivor = db.execute(
+                text("SELECT occurrences FROM memories WHERE id = :id"), {"id": ids[0]}
+            ).scalar()
+        assert survivor == 6
+        assert report["rows_removed"] == 1
+        assert report["rows_after"] == 3
@@ -0,0 +1,27 @@
+import pytest
+from atlas_memory import search_memory, warm_pool, pool_stats, init_db, engine
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+class TestPool:
+    """Tests for pool warmup and pool metrics."""
+
+    def test_warm_pool_opens_connections(self):
+        """warm_pool should open the requested number of connections."""
+        assert warm_pool(2) == 2
+        assert pool_stats()["connections_opened"] >= 2
+
+    def test_checkouts_are_counted(self):
+        """Every session checkout should be recorded with its wait time."""
+        before = pool_stats()
+        search_memory("test-pool-user", "anything", branch="main")
+        after = pool_stats()
+
+        assert after["checkouts"] > before["checkouts"]
+        assert after["checkout_wait_seconds"] >= before["checkout_wait_seconds"]
+        assert after["checked_out"] == 0
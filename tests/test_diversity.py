@@ -0,0 +1,85 @@
+import time
+import numpy as np
+import pytest
+from atlas_memory import MemoryClient, add_memories, search_memory, init_db, engine
+from atlas_memory.diversity import mmr
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+class TestMMR:
+    """Tests for the Maximal Marginal Relevance selection."""
+
+    def test_skips_near_duplicates(self):
+        """The second pick is the distinct row, not the copy of the first."""
+        vectors = np.array([[1.0, 0.0], [0.99, 0.01], [0.0, 1.0]], dtype=np.float32)
+        relevance = np.array([0.9, 0.89, 0.6], dtype=np.float32)
+
+        assert mmr(relevance, vectors, 2, lambda_=1.0) == [0, 1]
+        assert mmr(relevance, vectors, 2, lambda_=0.5) == [0, 2]
+        assert mmr(relevance, vectors, 5, lambda_=0.5) == [0, 2, 1]
+        assert mmr(relevance[:0], vectors[:0], 3) == []
+
+    def test_few_hundred_candidates_in_milliseconds(self):
+        rng = np.random.default_rng(1)
+        vectors = rng.standard_normal((300, 384)).astype(np.float32)
+        relevance = rng.random(300).astype(np.float32)
+
+        started = time.perf_counter()
+        picks = mmr(relevance, vectors, 20)
+        assert (time.perf_counter() - started) < 0.05
+        assert len(set(picks)) == 20
+
+
+class TestDiversifiedSearch:
+    """Tests for search_memory(diversify=...)."""
+
+    def test_spreads_results(self):
+        user = "test-diversify-user"
+        add_memories(user, [
+            "User loves hiking in the Alps",
+            "User loves hiking in the Alps every summer",
+            "User loves hiking in the Alps with friends",
+            "User went hiking in Patagonia last winter",
+        ])
+
+        plain = search_memory(user, "hiking in the Alps", top_k=2, mode="vector")
+        diverse = search_memory(user, "hiking in the Alps", top_k=2, mode="vector", diversify=0.3)
+        assert all("Alps" in r["text"] for r in plain)
+        assert diverse[0]["id"] == plain[0]["id"]
+        assert "Patagonia" in diverse[1]["text"]
+
+    def test_lambda_one_keeps_order(self):
+        user = "test-diversify-user"
+        plain = search_memory(user, "hiking", top_k=3, mode="hybrid")
+        same = search_memory(user, "hiking", top_k=3, mode="hybrid", diversify=1.0)
+        assert [r["id"] for r in same] == [r["id"] for r in plain]
+
+    def test_fall_through_keeps_mmr_order(self):
+        """Scanning the archive shouldn't re-sort the picks back into score order."""
+        user = "test-diversify-user"
+        diverse = search_memory(user, "hiking in the Alps", top_k=3, mode="vector", diversify=0.3)
+        assert "Patagonia" in diverse[1]["text"] and diverse[1]["score"] < diverse[2]["score"]
+
+        # no hot score reaches 1.1, so the archive is always searched
+        scanned = search_memory(user, "hiking in the Alps", top_k=3, mode="vector", diversify=0.3, fall_through=1.1)
+        assert [r["id"] for r in scanned] == [r["id"] for r in diverse]
+
+    def test_pending_writes_keep_mmr_order(self):
+        user = "test-diversify-user"
+        diverse = search_memory(user, "hiking in the Alps", top_k=4, mode="vector", diversify=0.3)
+        client = MemoryClient(user, write_behind=True, flush_interval=60)
+        client.add("User bought new hiking boots")
+
+        results = client.search("hiking in the Alps", top_k=5, mode="vector", diversify=0.3)
+        assert [r["id"] for r in results if not r.pending] == [r["id"] for r in diverse]
+        assert sum(r.pending for r in results) == 1
+        client.close()
+
+    def test_bad_lambda(self):
+        with pytest.raises(ValueError):
+            search_memory("test-diversify-user", "hiking", diversify=1.5)
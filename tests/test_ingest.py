@@ -0,0 +1,47 @@
+import json
+import pytest
+from atlas_memory import ingest, save_point, search_memory, init_db, engine
+from atlas_memory.ingest import read_records
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+class TestIngest:
+    """Tests for the pipelined bulk ingest."""
+
+    def test_ingests_every_record(self):
+        """All records should land once, across several batches and workers."""
+        records = [f"Chat message number {i}" for i in range(250)] + ["Chat message number 0"]
+        report = ingest("test-ingest-user", records, batch_size=32, embed_workers=2, insert_workers=3)
+
+        assert report["rows"] == 251
+        assert report["embedded"] <= 250
+        for stage in ("read", "embed", "insert"):
+            assert report["stages"][stage]["rows"] == 251
+        assert len(search_memory("test-ingest-user", "number 249", top_k=5, mode="fulltext")) == 1
+
+    def test_reads_chat_history(self, tmp_path):
+        """JSONL chat exports should keep their extra fields as metadata."""
+        path = tmp_path / "history.jsonl"
+        path.write_text("\n".join(json.dumps(r) for r in [
+            {"role": "user", "content": "I want to visit Lisbon"},
+            {"text": "User prefers trains", "metadata": {"source": "chat"}},
+        ]))
+
+        records = list(read_records(str(path)))
+        assert records == [("I want to visit Lisbon", {"role": "user"}), ("User prefers trains", {"source": "chat"})]
+
+    def test_bad_record_stops_pipeline(self):
+        """A failure in any stage should surface to the caller."""
+        with pytest.raises(ValueError):
+            ingest("test-ingest-bad", ["fine", {"role": "user"}], batch_size=1)
+
+    def test_rejects_snapshot_branch(self):
+        """Snapshots are read-only."""
+        snapshot = save_point("test-ingest-user", "tag", mode="snapshot")
+        with pytest.raises(ValueError, match="read-only"):
+            ingest("test-ingest-user", ["x"], branch=snapshot)
@@ -1,5 +1,9 @@
+import json
 import pytest
-from atlas_memory import add_memory, search_memory, init_db, engine
+from sqlalchemy import text
+from atlas_memory import add_memory, add_memories, search_memory, init_db, engine, get_session, profile
+from atlas_memory.embeddings import content_hash
+from atlas_memory.results import SearchResult
 
 
 @pytest.fixture(scope="module", autouse=True)
@@ -101,3 +105,162 @@ class TestSearchMemory:
         for mode in ["vector", "fulltext", "hybrid"]:
             results = search_memory(user_id, "search", top_k=1, branch=branch, mode=mode)
             assert isinstance(results, list)
+
+
+class TestSharedEmbeddings:
+    """Tests for content-addressed embedding storage."""
+
+    def test_repeated_text_shares_one_vector(self):
+        """The same text in different branches should be embedded and stored once."""
+        content = "User prefers window seats on long flights"
+        first = add_memory("test-dedup-user", content, branch="dedup-a")
+        second = add_memory("test-dedup-user-2", content, branch="dedup-b")
+        assert first != second
+
+        with get_session() as db:
+            stored = db.execute(
+                text("SELECT COUNT(*) FROM embeddings WHERE content_hash = :h"),
+                {"h": content_hash(content)}
+            ).scalar()
+            rows = db.execute(
+                text("SELECT content_hash, embedding FROM memories WHERE id IN (:a, :b)"),
+                {"a": first, "b": second}
+            ).fetchall()
+
+        assert stored == 1
+        assert all(r.content_hash == content_hash(content) and r.embedding is None for r in rows)
+
+    def test_search_uses_shared_vector(self):
+        """Rows that reference a shared vector should still be found by vector search."""
+        add_memory("test-dedup-search-user", "Allergic to peanuts", branch="dedup-search")
+
+        results = search_memory("test-dedup-search-user", "Allergic to peanuts", branch="dedup-search", mode="vector")
+        assert results[0]["text"] == "Allergic to peanuts"
+        assert results[0]["score"] > 0.99
+
+
+class TestDedup:
+    """Tests for near-duplicate suppression on write."""
+
+    def test_skip_returns_existing_id(self):
+        """A restated memory should not create a second row under dedup='skip'."""
+        user_id = "test-dedup-skip-user"
+        branch = "dedup-skip"
+        first = add_memory(user_id, "User prefers aisle seats", branch=branch, dedup="skip")
+        second = add_memory(user_id, "User prefers aisle seats", branch=branch, dedup="skip")
+
+        assert second == first
+        results = search_memory(user_id, "aisle seats", top_k=10, branch=branch, mode="vector")
+        assert len(results) == 1
+
+    def test_skip_inserts_when_duplicate_vanishes(self, monkeypatch):
+        """If the near-duplicate is gone by the follow-up lookup, the memory is inserted anyway."""
+        import atlas_memory.memory as memory
+
+        user_id = "test-dedup-skip-race-user"
+        branch = "dedup-skip-race"
+        first = add_memory(user_id, "User prefers window seats", branch=branch, dedup="skip")
+        monkeypatch.setattr(memory, "_nearest_memory", lambda db, scope, params: None)
+        second = add_memory(user_id, "User prefers window seats", branch=branch, dedup="skip")
+
+        assert second != first
+
+    def test_count_bumps_occurrences(self):
+        """dedup='count' should bump the counter on the existing row."""
+        user_id = "test-dedup-count-user"
+        branch = "dedup-count"
+        first = add_memory(user_id, "Vegetarian diet", branch=branch, dedup="count")
+        add_memory(user_id, "Vegetarian diet", branch=branch, dedup="count")
+
+        with get_session() as db:
+            occurrences = db.execute(text("SELECT occurrences FROM memories WHERE id = :id"), {"id": first}).scalar()
+        assert occurrences == 2
+
+    def test_merge_combines_metadata(self):
+        """dedup='merge' should fold the new metadata into the existing row."""
+        user_id = "test-dedup-merge-user"
+        branch = "dedup-merge"
+        first = add_memory(user_id, "Loves hiking", {"tags": ["outdoors"]}, branch=branch, dedup="merge")
+        add_memory(user_id, "Loves hiking", {"tags": ["sport"], "source": "chat"}, branch=branch, dedup="merge")
+
+        results = search_memory(user_id, "Loves hiking", top_k=10, branch=branch, mode="vector")
+        assert [r["id"] for r in results] == [first]
+        metadata = results[0]["metadata"]
+        metadata = json.loads(metadata) if isinstance(metadata, str) else metadata
+        assert metadata == {"tags": ["outdoors", "sport"], "source": "chat"}
+
+    def test_distinct_memories_still_inserted(self):
+        """Memories below the similarity threshold should be inserted normally."""
+        user_id = "test-dedup-distinct-user"
+        branch = "dedup-distinct"
+        ids = add_memories(user_id, ["Owns a cat", "Works as a nurse"], branch=branch, dedup="skip")
+        assert len(set(ids)) == 2
+
+    def test_unknown_policy_rejected(self):
+        with pytest.raises(ValueError, match="Unknown dedup policy"):
+            add_memory("any-user", "text", dedup="bogus")
+
+
+class TestSearchResults:
+    """Tests for SearchResult and the fields= projection."""
+
+    def test_results_read_like_dicts(self):
+        """SearchResult keeps dict-style access and decodes metadata on first read."""
+        user_id = "test-results-user"
+        add_memory(user_id, "User likes sailing", {"source": "chat"})
+
+        result = search_memory(user_id, "sailing", mode="vector")[0]
+        assert isinstance(result, SearchResult)
+        assert set(result) == {"id", "text", "metadata", "score"}
+        assert result["text"] == result.text == "User likes sailing"
+        assert result["metadata"] == {"source": "chat"}
+        assert result.get("archived") is None and "archived" not in result
+        assert result.to_dict() == dict(result)
+        assert not hasattr(result, "__dict__")
+
+    def test_copies_see_decoded_metadata(self):
+        """dict(r), {**r}, copy() and == should never expose the stored JSON string."""
+        user_id = "test-results-copy-user"
+        add_memory(user_id, "User likes cycling", {"source": "chat"})
+
+        for copy in (dict, lambda r: {**r}, lambda r: r.copy(), lambda r: r | {}):
+            result = search_memory(user_id, "cycling", mode="vector")[0]
+            assert copy(result)["metadata"] == {"source": "chat"}
+
+        first = search_memory(user_id, "cycling", mode="vector")[0]
+        second = search_memory(user_id, "cycling", mode="vector")[0]
+        assert first == second
+        assert first == {
+            "id": first.id, "text": "User likes cycling", "metadata": {"source": "chat"}, "score": first.score
+        }
+        assert not first != second
+
+    def test_results_serialize_to_json(self):
+        """Results are dicts, so json.dumps works on them, with metadata decoded."""
+        user_id = "test-results-json-user"
+        add_memory(user_id, "User likes rowing", {"source": "chat"})
+
+        results = search_memory(user_id, "rowing", mode="vector")
+        payload = json.loads(json.dumps(results))
+        assert payload == [{"id": results[0].id, "text": "User likes rowing", "metadata": {"source": "chat"},
+                            "score": results[0].score}]
+
+    @pytest.mark.parametrize("mode", ["vector", "fulltext", "hybrid"])
+    def test_projection_skips_columns(self, mode):
+        """fields=["id"] should keep text and metadata out of the SQL and the result."""
+        user_id = "test-results-projection"
+        add_memories(user_id, ["User likes sailing", "User owns a kayak"])
+
+        with profile() as queries:
+            results = search_memory(user_id, "sailing", mode=mode, fields=["id"])
+        assert results and all(set(r) == {"id", "score"} for r in results)
+        with pytest.raises(KeyError):
+            results[0]["text"]
+        assert not any("metadata_json" in q["sql"] for q in queries)
+
+        full = search_memory(user_id, "sailing", mode=mode)
+        assert [(r["id"], r["score"]) for r in results] == [(r["id"], r["score"]) for r in full]
+
+    def test_unknown_field_rejected(self):
+        with pytest.raises(ValueError):
+            search_memory("test-results-user", "sailing", fields=["embedding"])
@@ -0,0 +1,115 @@
+import pytest
+from atlas_memory import (
+    add_memory,
+    add_memories,
+    search_memory,
+    save_point,
+    delete_branch,
+    diff_branches,
+    merge_branch,
+    profile,
+    init_db,
+    engine
+)
+from atlas_memory.tiering import archive_memories
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+def _texts(rows) -> set:
+    return {r["text"] for r in rows}
+
+
+class TestDiffBranches:
+    """Tests for diff_branches."""
+
+    def test_added_and_removed(self):
+        """Rows match by content, so copies with new ids aren't reported."""
+        user = "test-diff-user"
+        add_memories(user, ["User likes jazz", "User lives in Oslo"])
+        branch = save_point(user, "trip")
+        add_memory(user, "User is planning a trip to Kyoto", branch=branch)
+        add_memory(user, "User lives in Oslo", branch="main")
+
+        diff = diff_branches(user, "main", branch)
+        assert _texts(diff["added"]) == {"User is planning a trip to Kyoto"}
+        assert diff["removed"] == []
+
+        back = diff_branches(user, branch, "main")
+        assert _texts(back["removed"]) == {"User is planning a trip to Kyoto"}
+        assert set(diff["added"][0]) == {"id", "text", "metadata", "content_hash"}
+
+    def test_snapshot_and_limit(self):
+        """A snapshot diffs against the rows it was taken with."""
+        user = "test-diff-snapshot"
+        add_memories(user, ["User owns a kayak", "User paddles on Sundays"])
+        snap = save_point(user, "before", mode="snapshot")
+        add_memories(user, ["User bought a tent", "User camps in May"])
+
+        diff = diff_branches(user, snap, "main")
+        assert _texts(diff["added"]) == {"User bought a tent", "User camps in May"}
+        assert len(diff_branches(user, snap, "main", limit=1)["added"]) == 1
+
+    def test_archived_counts_as_present(self):
+        user = "test-diff-archived"
+        add_memory(user, "User used to play chess")
+        archive_memories(user, idle_days=0)
+        add_memory(user, "User used to play chess", branch="hot")
+
+        assert diff_branches(user, "hot", "main")["removed"] == []
+        assert diff_branches(user, "main", "hot")["added"] == []
+
+
+class TestMergeBranch:
+    """Tests for merge_branch."""
+
+    def test_union_merge(self):
+        """Accepted changes land on main once, and a second merge is a no-op."""
+        user = "test-merge-union"
+        add_memories(user, ["User likes tea", "User works remotely"])
+        branch = save_point(user, "life")
+        add_memories(user, ["User moved to Lisbon", "User adopted a dog"], branch=branch)
+        add_memory(user, "User started running", branch="main")
+
+        report = merge_branch(user, branch, "main")
+        assert report["added"] == 2 and report["removed"] == 0
+        assert diff_branches(user, "main", branch)["added"] == []
+        assert "User started running" in _texts(diff_branches(user, branch, "main")["added"])
+        assert "User moved to Lisbon" in _texts(search_memory(user, "Lisbon", mode="fulltext"))
+
+        assert merge_branch(user, branch, "main")["added"] == 0
+
+    def test_mirror_merge(self):
+        """mirror also drops what the source no longer has."""
+        user = "test-merge-mirror"
+        add_memories(user, ["User eats meat", "User cycles to work"])
+        branch = save_point(user, "vegetarian")
+        delete_branch(user, branch)
+        add_memories(user, ["User is vegetarian", "User cycles to work"], branch=branch)
+
+        report = merge_branch(user, branch, "main", strategy="mirror", batch_size=1)
+        assert report == {"source": branch, "target": "main", "strategy": "mirror", "added": 1, "removed": 1}
+        assert diff_branches(user, "main", branch) == {"added": [], "removed": []}
+
+    def test_chunks_scale_with_diff(self):
+        """Each chunk is one INSERT ... SELECT; unchanged rows are never read into Python."""
+        user = "test-merge-chunks"
+        add_memories(user, [f"User fact number {i}" for i in range(10)])
+        branch = save_point(user, "chunks")
+        add_memory(user, "User learned to juggle", branch=branch)
+
+        with profile() as queries:
+            report = merge_branch(user, branch, "main", batch_size=4)
+        inserts = [q for q in queries if q["sql"].lstrip().upper().startswith("INSERT INTO MEMORIES")]
+        assert report["added"] == 1
+        assert len(inserts) == 3
+
+    def test_bad_arguments(self):
+        with pytest.raises(ValueError):
+            merge_branch("test-merge-bad", "a", "main", strategy="theirs")
+        with pytest.raises(ValueError):
+            merge_branch("test-merge-bad", "main", "main")
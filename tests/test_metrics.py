@@ -0,0 +1,88 @@
+import pytest
+from atlas_memory import (
+    add_memories, search_memory, embedding_stats, search_stats, search_latency_stats, buffer_stats, init_db, engine
+)
+from atlas_memory.buffer import WriteBuffer
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+class TestLibraryMetrics:
+    """Tests for the embedding and search counters."""
+
+    def test_embedding_cache_hits_and_misses(self):
+        """Texts already in the embeddings table should count as hits, new ones as misses."""
+        before = embedding_stats()
+        add_memories("test-metrics-user", ["Metrics text one", "Metrics text one", "Metrics text two"])
+        add_memories("test-metrics-user", ["Metrics text one"])
+        after = embedding_stats()
+
+        assert after["cache_misses"] - before["cache_misses"] <= 2
+        assert after["cache_hits"] - before["cache_hits"] >= 1
+        assert after["largest_batch"] >= 1
+
+    def test_search_counts_rows(self):
+        """Hybrid search should fetch more candidate rows than it returns."""
+        add_memories("test-metrics-user", [f"Metrics note {i}" for i in range(6)])
+        before = search_stats()
+        results = search_memory("test-metrics-user", "metrics note", top_k=2, mode="hybrid")
+        after = search_stats()
+
+        assert after["searches"] == before["searches"] + 1
+        assert after["results_returned"] - before["results_returned"] == len(results) == 2
+        assert after["rows_returned_by_sql"] - before["rows_returned_by_sql"] == 4
+
+    def test_search_latency_histogram(self):
+        """Every search lands in exactly one latency bucket."""
+        before = search_latency_stats()
+        search_memory("test-metrics-user", "metrics note", top_k=2, mode="vector")
+        after = search_latency_stats()
+
+        assert after["count"] == before["count"] + 1
+        assert after["sum"] > before["sum"]
+        assert after["buckets"][-1] == (float("inf"), after["count"])
+        assert [c for _, c in after["buckets"]] == sorted(c for _, c in after["buckets"])
+
+    def test_write_buffer_stats(self):
+        """Flushed writes leave the queue gauge and show up in the flush counters."""
+        before = buffer_stats()
+        buffer = WriteBuffer(flush_size=100, flush_interval=10)
+        buffer.add("test-metrics-user", "Buffered metrics one")
+        buffer.add("test-metrics-user", "Buffered metrics two")
+        assert buffer_stats()["queued"] - before["queued"] == 2
+
+        assert buffer.flush(timeout=10)
+        buffer.close()
+        after = buffer_stats()
+
+        assert after["queued"] == before["queued"]
+        assert after["batches_flushed"] - before["batches_flushed"] == 1
+        assert after["memories_flushed"] - before["memories_flushed"] == 2
+        assert after["flush_seconds"] > before["flush_seconds"]
+
+
+class TestMetricsEndpoint:
+    """Tests for the /metrics scrape of the web UI."""
+
+    def test_local_scrape(self):
+        """A scrape should expose route latency, in-flight requests and library stats."""
+        pytest.importorskip("httpx")
+        from fastapi.testclient import TestClient
+        from ui.app import app
+
+        client = TestClient(app)
+        client.post("/api/search", json={"user_id": "test-metrics-user", "query": "metrics"})
+        body = client.get("/metrics").text
+
+        assert 'atlas_http_request_duration_seconds_count{method="POST",route="/api/search"}' in body
+        assert "atlas_http_requests_in_flight" in body
+        assert "atlas_pool_checkouts_total" in body
+        assert "atlas_embedding_cache_hit_ratio" in body
+        assert "atlas_search_rows_returned_by_sql_total" in body
+        assert 'atlas_search_duration_seconds_bucket{le="+Inf"}' in body
+        assert "atlas_buffer_queued" in body
+        assert "atlas_buffer_flush_seconds_total" in body
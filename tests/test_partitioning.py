@@ -0,0 +1,83 @@
+import re
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects import mysql
+from sqlalchemy.schema import CreateTable
+from atlas_memory import (
+    add_memories, search_memory, migrate_memories, check_pruning, archive_memories, profile, get_session,
+    init_db, engine
+)
+from atlas_memory.compaction import compact_branch
+from atlas_memory.schema import Memory, partitioned_memories
+from atlas_memory.partitioning import is_partitioned, plan_partitions
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+class TestPartitionedSchema:
+    """Tests for the KEY(user_id)-partitioned layout of memories."""
+
+    def test_ddl_partitions_by_user(self):
+        """The primary key has to include user_id, and the index names match memories."""
+        table = partitioned_memories("memories_partitioned", 16)
+        ddl = str(CreateTable(table).compile(dialect=mysql.dialect()))
+
+        assert "PRIMARY KEY (id, user_id)" in ddl
+        assert "PARTITION BY KEY(user_id) PARTITIONS 16" in ddl
+        assert "AUTO_INCREMENT" in ddl
+        assert {i.name for i in table.indexes} == {i.name for i in Memory.__table__.indexes}
+        assert [c.name for c in table.columns] == [c.name for c in Memory.__table__.columns]
+
+    def test_plan_partitions_tidb(self):
+        """TiDB plans name the partitions in the access object."""
+        pruned = [
+            {"id": "IndexLookUp_10", "access object": ""},
+            {"id": "IndexRangeScan_8", "access object": "table:m, partition:p7, index:idx_user_branch(user_id, branch)"},
+        ]
+        assert plan_partitions(pruned) == (["p7"], True)
+
+        full = [{"id": "TableFullScan_5", "access object": "table:memories, partition:all"}]
+        assert plan_partitions(full) == (["all"], False)
+
+    def test_plan_partitions_mysql(self):
+        """MySQL plans list them in the partitions column."""
+        assert plan_partitions([{"table": "m", "partitions": "p3"}, {"table": "e", "partitions": None}]) == (["p3"], True)
+        assert plan_partitions([{"table": "m", "partitions": "p0,p1,p2"}]) == (["p0", "p1", "p2"], False)
+
+    def test_needs_tidb_or_mysql(self):
+        """Other backends keep one table and refuse to migrate."""
+        if engine.dialect.name == "mysql":
+            pytest.skip("runs against TiDB")
+        assert not is_partitioned()
+        with pytest.raises(ValueError):
+            migrate_memories()
+        with pytest.raises(ValueError):
+            check_pruning("test-partition-user")
+
+    def test_dedup_updates_scoped_to_user(self):
+        """Merging into an existing memory still works with the user_id filter on the UPDATE."""
+        user = "test-partition-user"
+        first = add_memories(user, ["User lives in Lisbon"])[0]
+        again = add_memories(user, ["User lives in Lisbon"], dedup="count")[0]
+        assert again == first
+        assert len(search_memory(user, "Lisbon", mode="fulltext")) == 1
+
+    def test_archive_and_compaction_writes_scoped_to_user(self):
+        """Every UPDATE and DELETE on memories should filter on user_id so it can be pruned to one partition."""
+        user = "test-partition-writes-user"
+        add_memories(user, ["User likes tea", "User likes tea!", "User owns a kayak"])
+        with profile() as queries:
+            compact_branch(user, threshold=0.9)
+            with get_session() as db:
+                db.execute(text("UPDATE memories SET created_at = '2000-01-01 00:00:00' WHERE user_id = :user_id"),
+                           {"user_id": user})
+                db.commit()
+            archive_memories(max_age_days=365)
+
+        writes = [q["sql"] for q in queries if re.match(r"\s*(UPDATE|DELETE FROM) memories\b", q["sql"])]
+        assert any(w.lstrip().startswith("DELETE") for w in writes)
+        assert all("user_id" in w for w in writes)
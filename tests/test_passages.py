@@ -0,0 +1,90 @@
+import pytest
+from atlas_memory import add_memory, add_memories, search_memory, save_point, ingest, init_db, engine
+from atlas_memory.metrics import embedding_stats
+from atlas_memory.passages import split_passages
+
+FILLER = " ".join(f"filler{i}." if i % 25 == 24 else f"filler{i}" for i in range(400))
+LONG_MEMORY = f"{FILLER} The user is allergic to shellfish."
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+@pytest.fixture(scope="module")
+def chunked_user():
+    user = "test-passages-user"
+    add_memories(user, [LONG_MEMORY, "User orders shellfish platters at restaurants"], chunk=True)
+    return user
+
+
+class TestSplitPassages:
+    """Tests for splitting long texts."""
+
+    def test_short_text_is_not_split(self):
+        """Texts that fit in one passage keep their single vector."""
+        assert split_passages("User likes hiking") == []
+
+    def test_passages_overlap_and_cover_text(self):
+        """Every word should land in a passage, windows overlap and stay under the limit."""
+        spans = split_passages(LONG_MEMORY, max_words=100, overlap=20)
+
+        assert len(spans) > 4
+        assert spans[0][0] == 0 and spans[-1][1] == len(LONG_MEMORY)
+        for (_, prev_end), (start, end) in zip(spans, spans[1:]):
+            assert start < prev_end
+            assert len(LONG_MEMORY[start:end].split()) <= 100
+
+    def test_prefers_sentence_boundaries(self):
+        """Passages should end on a sentence when one is in reach."""
+        spans = split_passages(LONG_MEMORY, max_words=100, overlap=20)
+        assert all(LONG_MEMORY[end - 1] == "." for _, end in spans)
+
+
+class TestPassageSearch:
+    """Tests for chunked memories and pooled ranking."""
+
+    def test_passages_embedded_in_one_batch(self):
+        """A long memory and all its passages should reach the model together."""
+        before = embedding_stats()
+        add_memory("test-passages-batch", LONG_MEMORY + " Also likes kayaking.", chunk=True)
+        after = embedding_stats()
+
+        assert after["batches"] == before["batches"] + 1
+        assert after["texts_embedded"] - before["texts_embedded"] > 2
+
+    def test_max_pooling_finds_the_tail(self, chunked_user):
+        """A fact at the end of a long memory should rank it first with pooling."""
+        query = "allergic to shellfish"
+        unpooled = search_memory(chunked_user, query, top_k=2, mode="vector")
+        pooled = search_memory(chunked_user, query, top_k=2, mode="vector", pooling="max")
+
+        assert pooled[0]["text"] == LONG_MEMORY
+        long_unpooled = next(r for r in unpooled if r["text"] == LONG_MEMORY)
+        assert pooled[0]["score"] > long_unpooled["score"]
+
+    def test_sum_pooling_adds_passage_scores(self, chunked_user):
+        """Summed scores can't be lower than the best passage alone."""
+        best = search_memory(chunked_user, "filler3 shellfish", top_k=1, mode="vector", pooling="max")[0]
+        summed = search_memory(chunked_user, "filler3 shellfish", top_k=2, mode="vector", pooling="sum")
+        summed = next(r for r in summed if r["id"] == best["id"])
+
+        assert summed["score"] >= best["score"]
+
+    def test_copied_branch_shares_passages(self, chunked_user):
+        """A save point copy should rank by the same passages without re-splitting."""
+        branch = save_point(chunked_user, "passages", "main")
+        results = search_memory(chunked_user, "allergic to shellfish", top_k=1, branch=branch, pooling="max")
+        assert results[0]["text"] == LONG_MEMORY
+
+    def test_ingest_splits_long_records(self):
+        """Bulk ingest with chunk=True should make the same passages."""
+        ingest("test-passages-ingest", [LONG_MEMORY, "User likes sushi"], batch_size=1, chunk=True)
+        results = search_memory("test-passages-ingest", "allergic to shellfish", top_k=1, pooling="max")
+        assert results[0]["text"] == LONG_MEMORY
+
+    def test_rejects_unknown_pooling(self, chunked_user):
+        with pytest.raises(ValueError):
+            search_memory(chunked_user, "shellfish", pooling="mean")
@@ -0,0 +1,56 @@
+import pytest
+from atlas_memory import add_memory, search_memory, save_point, profile, format_queries, init_db, engine
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+class TestProfile:
+    """Tests for query capture and plans."""
+
+    def test_captures_executed_sql_with_params(self):
+        """profile() should record the statements search_memory actually ran."""
+        add_memory("test-profile-user", "User likes night trains", branch="main")
+
+        with profile() as queries:
+            search_memory("test-profile-user", "night trains", branch="main", mode="vector")
+
+        search = [q for q in queries if "vec_cosine_distance" in q["sql"]]
+        assert len(search) == 1
+        params = search[0]["params"]
+        values = params.values() if isinstance(params, dict) else params
+        assert "test-profile-user" in values
+        assert "plan" not in search[0]
+
+    def test_nothing_captured_outside_block(self):
+        """Statements after the block should not be appended."""
+        with profile() as queries:
+            pass
+        search_memory("test-profile-user", "night trains", branch="main")
+        assert queries == []
+
+    def test_explain_adds_plans(self):
+        """explain=True should attach a plan to every captured SELECT."""
+        with profile(explain=True) as queries:
+            search_memory("test-profile-user", "night trains", branch="main", mode="hybrid")
+
+        selects = [q for q in queries if q["sql"].lstrip().upper().startswith("SELECT")]
+        assert selects
+        for q in selects:
+            assert q["plan"]
+            assert isinstance(q["indexes"], list)
+
+    def test_save_point_is_profiled(self):
+        """Writes are captured too, and rendered as one script with user input only in params."""
+        with profile(explain=True) as queries:
+            save_point("test-profile-user", "prof'; DROP TABLE memories; --", "main")
+
+        script = format_queries(queries)
+        assert "INSERT INTO memories" in script
+        [copy] = [q for q in queries if q["sql"].lstrip().upper().startswith("INSERT INTO MEMORIES")]
+        assert copy["plan"] and copy["analyzed"] is False
+        assert "-- plan (not run)" in script
+        assert "DROP TABLE" not in script.split("-- params")[0]
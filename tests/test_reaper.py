@@ -0,0 +1,136 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import text
+from atlas_memory import (
+    add_memories,
+    search_memory,
+    save_point,
+    list_branches,
+    archive_memories,
+    reap_branches,
+    BranchReaper,
+    get_session,
+    init_db,
+    engine,
+)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+def _expire(user_id: str, branch: str):
+    with get_session() as db:
+        db.execute(
+            text("UPDATE save_points SET expires_at = :at WHERE user_id = :user_id AND branch = :branch"),
+            {"at": datetime.utcnow() - timedelta(seconds=1), "user_id": user_id, "branch": branch}
+        )
+        db.commit()
+
+
+class TestReaper:
+    """Tests for ephemeral branches and the reaper that deletes them."""
+
+    def test_expired_branch_is_reaped_in_chunks(self):
+        """Every row of an expired branch goes, a few per transaction, and main is untouched."""
+        user = "test-reaper-chunks"
+        add_memories(user, [f"User fact number {i}" for i in range(7)])
+        branch = save_point(user, "scratch", ttl=3600)
+        _expire(user, branch)
+
+        report = reap_branches(batch_size=3, rows_per_second=None)
+        assert {"user_id": user, "branch": branch} in report["branches"]
+        assert report["memories_deleted"] >= 7
+        assert branch not in list_branches(user)
+        assert len(search_memory(user, "fact", top_k=10, mode="fulltext")) == 7
+
+    def test_unexpired_branch_survives(self):
+        """Branches without a TTL, or with time left, are never reaped."""
+        user = "test-reaper-alive"
+        add_memories(user, ["User likes kites"])
+        ephemeral = save_point(user, "later", ttl=3600)
+        permanent = save_point(user, "keep")
+
+        reap_branches(rows_per_second=None)
+        assert {ephemeral, permanent} <= set(list_branches(user))
+
+    def test_reaps_archived_rows_and_keeps_snapshots(self):
+        """Archived rows go too, and snapshots of the branch keep their data."""
+        user = "test-reaper-snapshot"
+        add_memories(user, ["User rows a boat", "User sails"])
+        branch = save_point(user, "tmp", ttl=3600)
+        with get_session() as db:
+            db.execute(
+                text("UPDATE memories SET created_at = :at WHERE user_id = :user_id AND branch = :branch "
+                     "AND text = 'User sails'"),
+                {"at": datetime.utcnow() - timedelta(days=400), "user_id": user, "branch": branch}
+            )
+            db.commit()
+        archive_memories(user, max_age_days=365)
+        snap = save_point(user, "look", source_branch=branch, mode="snapshot")
+        _expire(user, branch)
+
+        report = reap_branches(rows_per_second=None)
+        assert report["archived_deleted"] >= 1
+        assert branch not in list_branches(user)
+        assert [r["text"] for r in search_memory(user, "boat", branch=snap, mode="fulltext")] == ["User rows a boat"]
+
+    def test_rate_limit_paces_deletes(self):
+        """rows_per_second should spread a reap out over time."""
+        user = "test-reaper-pace"
+        add_memories(user, [f"User note {i}" for i in range(10)])
+        branch = save_point(user, "slow", ttl=3600)
+        _expire(user, branch)
+
+        report = reap_branches(batch_size=5, rows_per_second=50)
+        assert report["seconds"] >= 0.15
+
+    def test_background_reaper(self):
+        """The reaper thread should reap on its own and report what it did."""
+        user = "test-reaper-thread"
+        add_memories(user, ["User bakes bread"])
+        branch = save_point(user, "bg", ttl=3600)
+        _expire(user, branch)
+
+        reaper = BranchReaper(interval=0.05, rows_per_second=None).start()
+        try:
+            for _ in range(100):
+                if branch not in list_branches(user):
+                    break
+                time.sleep(0.05)
+        finally:
+            reaper.stop(timeout=5)
+        assert branch not in list_branches(user)
+
+    def test_background_reaper_materializes_expiring_snapshots(self):
+        """Snapshots close to the GC safe point get copied by the running reaper, not just at startup."""
+        user = "test-reaper-gc"
+        add_memories(user, ["User plays the cello"])
+        snap = save_point(user, "gc", mode="snapshot")
+        with get_session() as db:
+            db.execute(
+                text("UPDATE save_points SET stale_read_until = :at WHERE user_id = :user_id AND branch = :branch"),
+                {"at": datetime.utcnow() + timedelta(seconds=1), "user_id": user, "branch": snap}
+            )
+            db.commit()
+
+        select = text("SELECT materialized FROM save_points WHERE user_id = :user_id AND branch = :branch")
+        reaper = BranchReaper(interval=0.05, rows_per_second=None).start()
+        try:
+            for _ in range(100):
+                with get_session() as db:
+                    if db.execute(select, {"user_id": user, "branch": snap}).scalar():
+                        break
+                time.sleep(0.05)
+        finally:
+            reaper.stop(timeout=5)
+        with get_session() as db:
+            assert db.execute(select, {"user_id": user, "branch": snap}).scalar()
+        assert [r["text"] for r in search_memory(user, "cello", branch=snap, mode="fulltext")] == ["User plays the cello"]
+
+    def test_ttl_must_be_positive(self):
+        with pytest.raises(ValueError):
+            save_point("test-reaper-alive", "bad", ttl=0)
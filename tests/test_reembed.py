@@ -0,0 +1,107 @@
+import time
+import pytest
+from sqlalchemy import text
+from atlas_memory import (
+    add_memory,
+    add_memories,
+    search_memory,
+    reembed,
+    activate_model,
+    active_model,
+    archive_memories,
+    coverage,
+    init_db,
+    engine,
+    get_session,
+)
+from atlas_memory.embeddings import MODEL_NAME, existing_hashes, content_hash
+
+NEW_MODEL = "test-reembed-model"
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+@pytest.fixture(scope="module")
+def migrated():
+    """Re-embed everything with another model and switch back to the original afterwards."""
+    add_memories("test-reembed-user", [f"User fact number {i}" for i in range(12)] + ["User sails on weekends"])
+    yield NEW_MODEL
+    activate_model(MODEL_NAME)
+    assert active_model().name == MODEL_NAME
+
+
+class TestReembed:
+    """Tests for the re-embedding pipeline and model cutover."""
+
+    def test_backfill_resumes_from_checkpoint(self, migrated):
+        """A run stopped after some batches should leave a checkpoint the next run continues from."""
+        first = reembed(migrated, batch_size=4, max_batches=2)
+        assert first["scanned"] == 8
+        assert not first["complete"]
+        assert active_model().name == MODEL_NAME
+
+        rest = reembed(migrated, batch_size=4)
+        assert rest["complete"]
+        phases = ("memories", "archive", "passages")
+        assert all(rest[phase]["covered"] == rest[phase]["total"] for phase in phases)
+        # a text shared between phases is embedded once
+        assert first["embedded"] + rest["embedded"] <= sum(rest[phase]["total"] for phase in phases)
+
+    def test_writes_during_backfill_cover_both_models(self, migrated):
+        """New memories should be embedded for the model being backfilled too."""
+        reembed(migrated, max_batches=0)
+        add_memory("test-reembed-user", "User rents a bike in Porto")
+
+        digest = content_hash("User rents a bike in Porto")
+        with get_session() as db:
+            assert digest in existing_hashes(db, [digest], MODEL_NAME)
+            assert digest in existing_hashes(db, [digest], migrated)
+
+    def test_activate_switches_search(self, migrated):
+        """Once coverage is complete, searches should read the new model's vectors."""
+        activate_model(migrated)
+        assert active_model().name == migrated
+        assert coverage(MODEL_NAME)["complete"]
+
+        results = search_memory("test-reembed-user", "User sails on weekends", top_k=1, mode="vector")
+        assert results[0]["text"] == "User sails on weekends"
+        assert results[0]["score"] > 0.99
+
+    def test_throttles_to_rows_per_second(self, migrated):
+        """The backfill should not run faster than rows_per_second."""
+        started = time.perf_counter()
+        report = reembed(MODEL_NAME, batch_size=5, max_batches=2, rows_per_second=50)
+        assert report["scanned"] == 10
+        assert time.perf_counter() - started >= 0.2
+
+    def test_unknown_model_is_rejected(self):
+        with pytest.raises(ValueError):
+            activate_model("never-registered-model")
+
+    def test_archived_rows_follow_the_switch(self, migrated):
+        """Archived memories should stay findable by fall-through search across a model switch."""
+        user = "test-reembed-archive-user"
+        add_memory(user, "User keeps a boat in Lisbon")
+        with get_session() as db:
+            db.execute(text("UPDATE memories SET created_at = '2000-01-01 00:00:00' WHERE user_id = :user_id"),
+                       {"user_id": user})
+            db.commit()
+        assert active_model().name == migrated
+        archive_memories(user, max_age_days=365)
+
+        activate_model(MODEL_NAME)
+        select = text("SELECT model FROM memory_archive WHERE user_id = :user_id")
+        with get_session() as db:
+            assert db.execute(select, {"user_id": user}).scalars().all() == [MODEL_NAME]
+            # a row the re-encode hasn't reached yet is scored on its shared vector
+            db.execute(text("UPDATE memory_archive SET model = :model WHERE user_id = :user_id"),
+                       {"model": migrated, "user_id": user})
+            db.commit()
+
+        results = search_memory(user, "User keeps a boat in Lisbon", mode="vector", fall_through=0.5)
+        assert [(r["text"], r["archived"]) for r in results] == [("User keeps a boat in Lisbon", True)]
+        assert results[0]["score"] > 0.99
@@ -0,0 +1,124 @@
+import threading
+import pytest
+from atlas_memory import MemoryClient, add_memories, search_memory, search_stats, set_reranker, init_db, engine
+from atlas_memory.rerank import RERANK_WORKERS, CrossEncoderReranker, rerank_available, rerank_scores
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def memories():
+    add_memories("test-rerank-user", [
+        "User drinks coffee every morning",
+        "User prefers green tea over coffee in the afternoon",
+        "User has a morning swim routine",
+    ])
+
+
+@pytest.fixture(autouse=True)
+def reranker():
+    yield
+    set_reranker(None)
+
+
+class KeywordReranker:
+    """Ranks texts containing `word` first."""
+
+    def __init__(self, word: str, delay: float = 0.0):
+        self.word = word
+        self.delay = delay
+        self.calls = []
+
+    def score(self, query, texts):
+        self.calls.append(list(texts))
+        if self.delay:
+            threading.Event().wait(self.delay)
+        return [1.0 if self.word in t else 0.0 for t in texts]
+
+
+class FailingReranker:
+    def score(self, query, texts):
+        raise RuntimeError("model crashed")
+
+
+class TestRerank:
+    """Tests for the cross-encoder rerank stage."""
+
+    def test_reorders_candidates(self):
+        """Every candidate is scored in one call, and the reranker's order wins."""
+        fake = KeywordReranker("swim")
+        set_reranker(fake)
+        results = search_memory("test-rerank-user", "coffee morning", top_k=2, mode="vector", rerank=True)
+
+        assert "swim" in results[0]["text"]
+        assert len(fake.calls) == 1 and len(fake.calls[0]) == 3
+
+    def test_fall_through_keeps_reranked_order(self):
+        """Scanning the archive shouldn't re-sort the reranked rows by their first-stage scores."""
+        set_reranker(KeywordReranker("swim"))
+        reranked = search_memory("test-rerank-user", "coffee morning", top_k=3, mode="vector", rerank=True)
+        assert "swim" in reranked[0]["text"] and reranked[0]["score"] < max(r["score"] for r in reranked)
+
+        scanned = search_memory("test-rerank-user", "coffee morning", top_k=3, mode="vector", rerank=True,
+                                fall_through=1.1)
+        assert [r["id"] for r in scanned] == [r["id"] for r in reranked]
+
+    def test_pending_writes_keep_reranked_order(self):
+        set_reranker(KeywordReranker("swim"))
+        reranked = search_memory("test-rerank-user", "coffee morning", top_k=3, mode="vector", rerank=True)
+        client = MemoryClient("test-rerank-user", write_behind=True, flush_interval=60)
+        client.add("User grinds coffee beans by hand")
+
+        results = client.search("coffee morning", top_k=4, mode="vector", rerank=True)
+        assert [r["id"] for r in results if not r.pending] == [r["id"] for r in reranked]
+        client.close()
+
+    def test_works_without_text_in_projection(self):
+        set_reranker(KeywordReranker("tea"))
+        results = search_memory("test-rerank-user", "coffee", top_k=1, mode="hybrid", rerank=True, fields=["id"])
+        plain = search_memory("test-rerank-user", "green tea", top_k=1, mode="fulltext")
+        assert results[0]["id"] == plain[0]["id"]
+        assert "text" not in results[0]
+
+    def test_budget_falls_back_to_first_stage(self):
+        """A reranker slower than the budget leaves the first-stage order and bumps the timeout counter."""
+        set_reranker(KeywordReranker("swim", delay=0.5))
+        plain = search_memory("test-rerank-user", "coffee", top_k=3, mode="vector")
+        before = search_stats()["rerank_timeouts"]
+
+        results = search_memory("test-rerank-user", "coffee", top_k=3, mode="vector", rerank=True, rerank_budget_ms=20)
+        assert [r["id"] for r in results] == [r["id"] for r in plain]
+        assert search_stats()["rerank_timeouts"] == before + 1
+
+    def test_errors_fall_back_to_first_stage(self):
+        """A reranker that raises leaves the first-stage order and gives its worker slot back."""
+        set_reranker(FailingReranker())
+        plain = search_memory("test-rerank-user", "coffee", top_k=3, mode="vector")
+        before = search_stats()["rerank_errors"]
+
+        for _ in range(RERANK_WORKERS + 1):
+            results = search_memory("test-rerank-user", "coffee", top_k=3, mode="vector", rerank=True)
+            assert [r["id"] for r in results] == [r["id"] for r in plain]
+        assert search_stats()["rerank_errors"] == before + RERANK_WORKERS + 1
+        assert rerank_available()
+
+    def test_failing_setup_releases_slot(self, monkeypatch):
+        import atlas_memory.rerank as rerank
+
+        def broken():
+            raise ImportError("no sentence-transformers")
+
+        monkeypatch.setattr(rerank, "get_reranker", broken)
+        for _ in range(RERANK_WORKERS + 1):
+            assert rerank_scores("coffee", ["User drinks coffee"], 1000) is None
+        assert rerank_available()
+
+    def test_cross_encoder_batches_pairs(self):
+        """The default reranker scores (query, text) pairs with sentence-transformers' CrossEncoder."""
+        set_reranker(CrossEncoderReranker("test-cross-encoder"))
+        scores = rerank_scores("morning coffee", ["User drinks coffee every morning", "User likes jazz"], 5000)
+        assert scores[0] > scores[1]
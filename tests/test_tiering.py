@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import text
+from atlas_memory import (
+    add_memories,
+    search_memory,
+    save_point,
+    delete_branch,
+    list_branches,
+    archive_memories,
+    restore_memories,
+    get_session,
+    init_db,
+    engine,
+)
+from atlas_memory.tiering import RetrievalTracker, retrievals
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+def _age(user_id: str, days: int):
+    with get_session() as db:
+        db.execute(
+            text("UPDATE memories SET created_at = :at WHERE user_id = :user_id"),
+            {"at": datetime.utcnow() - timedelta(days=days), "user_id": user_id}
+        )
+        db.commit()
+
+
+class TestTiering:
+    """Tests for archiving old memories and searching the cold tier."""
+
+    def test_archived_memories_leave_default_search(self):
+        """Archived rows should only come back through fall_through, flagged as archived."""
+        user = "test-tiering-age"
+        add_memories(user, ["User visited Iceland in 2019", "User likes geysers"])
+        _age(user, 400)
+
+        report = archive_memories(user, max_age_days=365)
+        assert report["archived"] == 2
+        assert search_memory(user, "Iceland", mode="vector") == []
+
+        results = search_memory(user, "User visited Iceland in 2019", top_k=1, mode="vector", fall_through=0.5)
+        assert results[0]["text"] == "User visited Iceland in 2019"
+        assert results[0]["archived"] is True
+        assert results[0]["score"] > 0.98
+        assert search_memory(user, "geysers", mode="fulltext", fall_through=0.5)[0]["archived"] is True
+
+    def test_idle_policy_keeps_retrieved_memories(self):
+        """Memories returned by recent searches should stay hot."""
+        user = "test-tiering-idle"
+        add_memories(user, ["User drinks oat milk", "User once owned a parrot"])
+        _age(user, 30)
+        search_memory(user, "oat milk", mode="fulltext")
+        retrievals.flush()
+
+        assert archive_memories(user, idle_days=7)["archived"] == 1
+        assert [r["text"] for r in search_memory(user, "User", mode="fulltext")] == ["User drinks oat milk"]
+
+    def test_fall_through_skipped_when_hot_results_are_good(self):
+        """A strong hot hit should not trigger the cold scan."""
+        user = "test-tiering-hot"
+        add_memories(user, ["User plays chess"])
+        results = search_memory(user, "User plays chess", top_k=5, mode="vector", fall_through=0.5)
+        assert all("archived" not in r for r in results)
+
+    def test_branches_keep_archived_rows(self):
+        """Copies should carry archived rows, and deleting the branch should drop them."""
+        user = "test-tiering-branch"
+        add_memories(user, ["User speaks Portuguese"])
+        _age(user, 400)
+        archive_memories(user, max_age_days=365)
+
+        branch = save_point(user, "cold", "main")
+        assert branch in list_branches(user)
+        assert search_memory(user, "Portuguese", branch=branch, mode="fulltext", fall_through=1.0)
+
+        delete_branch(user, branch)
+        assert search_memory(user, "Portuguese", branch=branch, mode="fulltext", fall_through=1.0) == []
+
+    def test_restore_moves_rows_back(self):
+        """Restored memories should be searchable in the hot table again."""
+        user = "test-tiering-restore"
+        add_memories(user, ["User grows tomatoes"])
+        _age(user, 400)
+        archive_memories(user, max_age_days=365)
+        archived_id = search_memory(user, "tomatoes", mode="fulltext", fall_through=1.0)[0]["id"]
+
+        new_ids = restore_memories(user, "main", [archived_id])
+        assert search_memory(user, "tomatoes", mode="fulltext")[0]["id"] == new_ids[0]
+        assert search_memory(user, "tomatoes", mode="fulltext", fall_through=1.0)[0]["id"] == new_ids[0]
+
+    def test_tracker_batches_updates(self):
+        """Retrievals should wait for a flush and go out together."""
+        tracker = RetrievalTracker(flush_interval=3600)
+        tracker.record("test-tiering-tracker", [1, 2, 3])
+        tracker.record("test-tiering-tracker", [3, 4])
+        tracker.record("test-tiering-other", [1])
+        assert tracker.flush() == 5
+        assert tracker.flush() == 0
+
+    def test_requires_a_policy(self):
+        with pytest.raises(ValueError):
+            archive_memories("test-tiering-age")
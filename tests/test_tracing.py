@@ -0,0 +1,77 @@
+import pytest
+from atlas_memory import add_memory, search_memory, save_point, delete_branch, init_db, engine
+from atlas_memory.tracing import Sink, get_sink, set_sink, span, timings
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+class RecordingSink(Sink):
+    def __init__(self):
+        self.spans = []
+
+    def start(self, name, attributes):
+        return dict(attributes)
+
+    def finish(self, token, name, duration_ms, error):
+        self.spans.append((name, token, duration_ms, error))
+
+
+@pytest.fixture
+def sink():
+    previous = get_sink()
+    recording = RecordingSink()
+    set_sink(recording)
+    yield recording
+    set_sink(previous)
+
+
+class TestTracing:
+    """Tests for per-stage spans and the timings collector."""
+
+    def test_search_reports_each_stage(self):
+        """timings() should break a hybrid search into its stages."""
+        add_memory("test-trace-user", "User likes quiet hotels", branch="main")
+
+        with timings() as t:
+            search_memory("test-trace-user", "quiet hotels", branch="main", mode="hybrid")
+
+        for stage in ("search_memory", "embed", "checkout", "sql", "decode", "rerank"):
+            assert stage in t
+        assert t["search_memory"] >= t["embed"]
+
+    def test_timings_are_scoped_to_the_block(self):
+        """Calls outside the block should not be collected."""
+        with timings() as t:
+            pass
+        search_memory("test-trace-user", "quiet hotels", branch="main")
+        assert t == {}
+
+    def test_disabled_span_is_shared_noop(self):
+        """With no sink and no collector, span() should not allocate a timer."""
+        assert get_sink() is None
+        assert span("a") is span("b")
+
+    def test_sink_receives_operation_spans(self, sink):
+        """Writes, save points and deletes should all reach the installed sink."""
+        add_memory("test-trace-user", "User books aisle seats", branch="main")
+        branch = save_point("test-trace-user", "trace", "main")
+        delete_branch("test-trace-user", branch)
+
+        names = [s[0] for s in sink.spans]
+        for op in ("add_memory", "save_point", "delete_branch", "commit"):
+            assert op in names
+
+        add_span = next(s for s in sink.spans if s[0] == "add_memory")
+        assert add_span[1] == {"rows": 1, "dedup": None}
+
+    def test_errors_are_passed_to_sink(self, sink):
+        """A failing stage should still be finished, with its exception."""
+        with pytest.raises(ValueError):
+            with span("boom"):
+                raise ValueError("fail")
+
+        assert isinstance(sink.spans[-1][3], ValueError)
@@ -0,0 +1,135 @@
+import json
+import numpy as np
+import pytest
+from sqlalchemy import text
+from atlas_memory import (
+    add_memories,
+    search_memory,
+    save_point,
+    export_memories,
+    import_memories,
+    archive_memories,
+    get_session,
+    init_db,
+    engine,
+)
+from atlas_memory import embeddings
+from atlas_memory.embeddings import content_hash, decode_vectors, embed, existing_hashes
+from atlas_memory.metrics import embedding_stats
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+@pytest.fixture(scope="module")
+def source_user():
+    user = "test-transfer-src"
+    add_memories(user, ["User likes sailing", "User avoids cruises", "Budget is $4000"],
+                 [{"tags": ["sea"]}, None, {"source": "chat"}])
+    save_point(user, "trip", "main")
+    return user
+
+
+class TestTransfer:
+    """Tests for export_memories / import_memories."""
+
+    @pytest.mark.parametrize("format,name", [("ndjson", "dump.ndjson"), ("npy", "dump"), ("parquet", "dump.parquet")])
+    def test_round_trip(self, source_user, tmp_path, format, name):
+        """Every format should restore text, metadata, branches and vectors without re-embedding."""
+        if format == "parquet":
+            pytest.importorskip("pyarrow")
+        path = str(tmp_path / name)
+        assert export_memories(source_user, path, format=format, chunk_size=2) == 6
+
+        target = f"test-transfer-{format}"
+        before = embedding_stats()["texts_embedded"]
+        assert import_memories(target, path, chunk_size=2) == 6
+        assert embedding_stats()["texts_embedded"] == before
+
+        results = search_memory(target, "User likes sailing", top_k=1, mode="vector")
+        assert results[0]["text"] == "User likes sailing"
+        assert results[0]["score"] > 0.99
+        assert len(search_memory(target, "sailing", branch="main", mode="fulltext")) == 1
+
+    def test_single_branch_into_new_branch(self, source_user, tmp_path):
+        """Exporting one branch and importing with branch= should land every row there."""
+        path = str(tmp_path / "main.ndjson")
+        assert export_memories(source_user, path, branch="main") == 3
+        import_memories("test-transfer-branch", path, branch="restored")
+
+        assert len(search_memory("test-transfer-branch", "User", branch="restored", mode="fulltext")) == 2
+        assert search_memory("test-transfer-branch", "User", branch="main", mode="fulltext") == []
+
+    def test_rejects_other_model(self, source_user, tmp_path):
+        """Vectors from another model can't be reused."""
+        path = str(tmp_path / "dump.ndjson")
+        export_memories(source_user, path)
+        with pytest.raises(ValueError):
+            import_memories("test-transfer-model", path, model="other-model")
+
+    def test_archived_rows_stay_archived(self, tmp_path):
+        """Rows exported from the archive should be imported into the archive, not the hot table."""
+        source = "test-transfer-archived-src"
+        add_memories(source, ["Old note about ferries", "Fresh note about trains"])
+        with get_session() as db:
+            db.execute(text(
+                "UPDATE memories SET created_at = '2000-01-01 00:00:00' WHERE user_id = :user_id AND text LIKE 'Old%'"
+            ), {"user_id": source})
+            db.commit()
+        archive_memories(source, max_age_days=365)
+
+        path = str(tmp_path / "archived.ndjson")
+        assert export_memories(source, path) == 2
+        import_memories("test-transfer-archived", path)
+
+        hot = search_memory("test-transfer-archived", "note", top_k=10, mode="fulltext")
+        assert [r["text"] for r in hot] == ["Fresh note about trains"]
+        archived = search_memory("test-transfer-archived", "ferries", mode="fulltext", fall_through=1.0)
+        assert [(r["text"], r["archived"]) for r in archived] == [("Old note about ferries", True)]
+
+    def test_file_vectors_never_replace_existing_ones(self, source_user, tmp_path):
+        """A crafted export can't overwrite a vector that is already stored, and nothing is re-embedded."""
+        bogus = np.random.default_rng(0).standard_normal(384).round(4).tolist()
+        path = _crafted(tmp_path, ["User likes sailing"], bogus)
+
+        before = embedding_stats()["texts_embedded"]
+        import_memories("test-transfer-crafted", path)
+        assert embedding_stats()["texts_embedded"] == before
+
+        with get_session() as db:
+            stored = db.execute(text("SELECT embedding FROM embeddings WHERE content_hash = :h"),
+                                {"h": content_hash("User likes sailing")}).scalar()
+        assert np.allclose(decode_vectors([stored])[0], embed("User likes sailing"), atol=1e-5)
+
+    def test_verify_rejects_mismatched_vectors(self, tmp_path):
+        """With verify, a new vector that doesn't match the model fails the import instead of being stored."""
+        bogus = np.random.default_rng(1).standard_normal(384).round(4).tolist()
+        path = _crafted(tmp_path, ["Crafted text nobody wrote before"], bogus)
+
+        with pytest.raises(ValueError, match="don't match"):
+            import_memories("test-transfer-verify", path, verify=1.0)
+        with get_session() as db:
+            assert not existing_hashes(db, [content_hash("Crafted text nobody wrote before")],
+                                       embeddings.get_model().name)
+        assert search_memory("test-transfer-verify", "Crafted", mode="fulltext") == []
+
+    def test_rejects_unmaterialized_snapshot(self, source_user, tmp_path):
+        path = str(tmp_path / "main.ndjson")
+        export_memories(source_user, path, branch="main")
+        snapshot = save_point("test-transfer-snap", "snap", mode="snapshot")
+        with pytest.raises(ValueError, match="read-only"):
+            import_memories("test-transfer-snap", path, branch=snapshot)
+
+
+def _crafted(tmp_path, lines, vector) -> str:
+    header = {"format": "atlas-memories", "version": 2, "model": embeddings.get_model().name, "dim": 384}
+    path = tmp_path / "crafted.ndjson"
+    with open(path, "w") as f:
+        f.write(json.dumps(header) + "\n")
+        for line in lines:
+            record = {"branch": "main", "text": line, "metadata": None, "occurrences": 1, "embedding": vector}
+            f.write(json.dumps(record) + "\n")
+    return str(path)
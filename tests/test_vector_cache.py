@@ -0,0 +1,121 @@
+import pytest
+from sqlalchemy import text
+from atlas_memory import (
+    add_memory,
+    add_memories,
+    search_memory,
+    delete_branch,
+    enable_vector_cache,
+    disable_vector_cache,
+    search_stats,
+    get_session,
+    init_db,
+    engine,
+)
+from atlas_memory.vector_cache import bump_version, get_vector_cache
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+@pytest.fixture(autouse=True)
+def cache():
+    yield enable_vector_cache(max_mb=16, admit_after=2)
+    disable_vector_cache()
+
+
+def _served_from_cache(fn) -> bool:
+    before = search_stats()["cached_searches"]
+    fn()
+    return search_stats()["cached_searches"] > before
+
+
+class TestVectorCache:
+    """Tests for the in-process vector cache and its invalidation."""
+
+    def test_hot_branch_served_locally(self, cache):
+        """After admission, vector searches come from the cache with the same ranking as TiDB."""
+        user = "test-cache-hot"
+        add_memories(user, ["User loves hiking in the Alps", "User drinks espresso", "User owns a cat"])
+
+        uncached = search_memory(user, "hiking Alps", top_k=3, mode="vector")
+        cached = []
+        assert _served_from_cache(lambda: cached.extend(search_memory(user, "hiking Alps", top_k=3, mode="vector")))
+        assert [r["id"] for r in cached] == [r["id"] for r in uncached]
+        for a, b in zip(cached, uncached):
+            assert a["score"] == pytest.approx(b["score"], abs=1e-5)
+            assert a["text"] == b["text"]
+        assert cache.stats()["branches"] == 1
+
+    def test_writes_go_through(self, cache):
+        """add_memory appends to the cached matrix without a reload."""
+        user = "test-cache-write"
+        add_memory(user, "User plays the violin")
+        search_memory(user, "violin", mode="vector")
+        search_memory(user, "violin", mode="vector")
+
+        loads = search_stats()["cache_loads"]
+        new_id = add_memory(user, "User collects vinyl records")
+        results = search_memory(user, "User collects vinyl records", top_k=1, mode="vector")
+        assert results[0]["id"] == new_id
+        assert search_stats()["cache_loads"] == loads
+
+    def test_other_process_write_invalidates(self, cache):
+        """A write this process didn't see bumps the version, and the next search reloads."""
+        user = "test-cache-remote"
+        first = add_memory(user, "User speaks Japanese")
+        search_memory(user, "Japanese", mode="vector")
+        search_memory(user, "Japanese", mode="vector")
+
+        with get_session() as db:
+            db.execute(text("DELETE FROM memories WHERE id = :id"), {"id": first})
+            bump_version(db, user, "main")
+            db.commit()
+
+        loads = search_stats()["cache_loads"]
+        assert search_memory(user, "Japanese", mode="vector") == []
+        assert search_stats()["cache_loads"] == loads + 1
+
+    def test_delete_branch_discards(self, cache):
+        user = "test-cache-delete"
+        add_memory(user, "User is on a branch", branch="tmp")
+        search_memory(user, "branch", branch="tmp", mode="vector")
+        search_memory(user, "branch", branch="tmp", mode="vector")
+        assert cache.stats()["branches"] == 1
+
+        delete_branch(user, "tmp")
+        assert cache.stats()["branches"] == 0
+        assert search_memory(user, "branch", branch="tmp", mode="vector") == []
+
+    def test_lru_eviction_by_bytes(self):
+        """Past the byte budget, the least recently searched branch goes first."""
+        user = "test-cache-lru"
+        for branch in ("a", "b"):
+            add_memories(user, [f"User fact {i} on {branch}" for i in range(4)], branch=branch)
+        # room for one four-row branch of 384-dim float32 vectors, not two
+        cache = enable_vector_cache(max_mb=4 * (384 * 4 + 8) * 1.5 / (1024 * 1024), admit_after=1)
+
+        search_memory(user, "fact", branch="a", mode="vector")
+        search_memory(user, "fact", branch="b", mode="vector")
+        assert cache.stats()["branches"] == 1
+        assert cache.stats()["bytes"] <= cache.max_bytes
+
+        loads = search_stats()["cache_loads"]
+        search_memory(user, "fact", branch="b", mode="vector")
+        assert search_stats()["cache_loads"] == loads
+        search_memory(user, "fact", branch="a", mode="vector")
+        assert search_stats()["cache_loads"] == loads + 1
+
+    def test_oversized_branch_stays_in_tidb(self):
+        """A branch bigger than the whole budget is never cached."""
+        user = "test-cache-big"
+        add_memories(user, ["User likes tea", "User likes coffee"])
+        cache = enable_vector_cache(max_mb=0.001, admit_after=1)
+
+        assert not _served_from_cache(lambda: search_memory(user, "tea", mode="vector"))
+        assert search_memory(user, "User likes tea", top_k=1, mode="vector")[0]["text"] == "User likes tea"
+        assert cache.stats()["branches"] == 0
+        assert get_vector_cache() is cache
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from atlas_memory import add_memory, search_memory, get_session, init_db, engine
+from atlas_memory.embeddings import embed, embed_batch, store_embeddings
+from atlas_memory.schema import Embedding
+from atlas_memory.vectors import encode_vector, decode_vectors
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    """Ensure database tables exist before tests."""
+    init_db(engine)
+
+
+class TestVectorEncoding:
+    """Tests for the float32 text encoding of query and stored vectors."""
+
+    def test_round_trips_float32(self):
+        """Every float32 comes back bit for bit, in far fewer bytes than str() of a float64 list."""
+        vector = np.random.default_rng(3).standard_normal(384).astype(np.float32)
+        encoded = encode_vector(vector)
+
+        assert encoded.startswith("[") and encoded.endswith("]")
+        assert np.array_equal(decode_vectors([encoded])[0], vector)
+        assert len(encoded) < len(str(vector.tolist())) * 0.7
+
+    def test_accepts_lists_and_checks_dim(self):
+        assert encode_vector([0.5, -1.0, 0.0]) == "[0.5,-1,0]"
+        with pytest.raises(ValueError):
+            encode_vector([0.5, -1.0], dim=3)
+
+    def test_embed_returns_float32_arrays(self):
+        """No Python float lists between the model and the wire."""
+        vector = embed("User likes sailing")
+        batch = embed_batch(["User likes sailing", "User owns a boat"])
+        assert isinstance(vector, np.ndarray) and vector.dtype == np.float32
+        assert batch.shape == (2, len(vector)) and batch.dtype == np.float32
+
+    def test_stored_embedding_matches(self):
+        """Inserts go through the same encoding, so the stored vector is the float32 that was embedded."""
+        vector = embed("User keeps bees")
+        with get_session() as db:
+            store_embeddings(db, {"test-vectors-digest": vector})
+            db.commit()
+            stored = db.query(Embedding.embedding).filter(Embedding.content_hash == "test-vectors-digest").scalar()
+        assert np.array_equal(np.asarray(stored, dtype=np.float32), vector)
+
+    def test_search_with_array_or_list(self):
+        """A precomputed query vector may still be passed as a list."""
+        user = "test-vectors-user"
+        memory_id = add_memory(user, "User keeps bees in the garden")
+        vector = embed("bees garden")
+
+        from_array = search_memory(user, "bees garden", mode="vector", query_vector=vector)
+        from_list = search_memory(user, "bees garden", mode="vector", query_vector=vector.tolist())
+        assert from_array[0]["id"] == from_list[0]["id"] == memory_id
+        assert from_array[0]["score"] == pytest.approx(from_list[0]["score"])
@@ -1,34 +1,150 @@
+import asyncio
+import json
 import sys
+import time
 from pathlib import Path
 from typing import Optional, List
 from datetime import datetime
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
 
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from atlas_memory import (
     add_memory,
+    add_memories,
+    ingest,
     search_memory,
     save_point,
     load_point,
     delete_branch,
     list_branches,
+    diff_branches,
+    merge_branch,
+    BranchReaper,
+    read_changes,
     init_db,
     engine,
     get_session,
+    warm_pool,
+    pool_stats,
+    embedding_stats,
+    search_stats,
+    search_latency_stats,
+    buffer_stats,
+    timings,
+    profile,
+    format_queries,
 )
-from atlas_memory.schema import Memory
+from atlas_memory.schema import Memory, MemoryArchive, SavePoint
+from atlas_memory.changes import record_change
+from atlas_memory.vector_cache import bump_version, get_vector_cache
 
 app = FastAPI(title="atlasMemory Demo")
 
+# own registry so tests can import the app more than once
+registry = CollectorRegistry()
+REQUEST_LATENCY = Histogram(
+    "atlas_http_request_duration_seconds", "Request latency by route",
+    ["method", "route"], registry=registry,
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter("atlas_http_requests", "Requests by route and status", ["method", "route", "status"], registry=registry)
+IN_FLIGHT = Gauge("atlas_http_requests_in_flight", "Requests being served", ["method"], registry=registry)
+
+
+class LibraryCollector:
+    """Reads the library's own counters at scrape time, so requests pay nothing for them."""
+
+    def collect(self):
+        pool = pool_stats()
+        for name in ("checkouts", "checkout_timeouts", "connections_opened", "connections_closed",
+                     "connections_invalidated"):
+            yield CounterMetricFamily(f"atlas_pool_{name}", f"Pool {name.replace('_', ' ')}", value=pool[name])
+        yield CounterMetricFamily("atlas_pool_checkout_wait_seconds", "Time spent waiting for a connection",
+                                  value=pool["checkout_wait_seconds"])
+        yield GaugeMetricFamily("atlas_pool_checkout_wait_max_seconds", "Longest checkout wait",
+                                value=pool["checkout_wait_max_seconds"])
+        for name in ("pool_size", "checked_out", "checked_in", "overflow"):
+            if name in pool:
+                yield GaugeMetricFamily(f"atlas_pool_{name}", f"Pool {name.replace('_', ' ')}", value=pool[name])
+
+        embeddings = embedding_stats()
+        for name in ("queries_embedded", "batches", "texts_embedded", "cache_hits", "cache_misses"):
+            yield CounterMetricFamily(f"atlas_embedding_{name}", f"Embedding {name.replace('_', ' ')}",
+                                      value=embeddings[name])
+        yield GaugeMetricFamily("atlas_embedding_largest_batch", "Largest batch sent to the model",
+                                value=embeddings["largest_batch"])
+        lookups = embeddings["cache_hits"] + embeddings["cache_misses"]
+        yield GaugeMetricFamily("atlas_embedding_cache_hit_ratio", "Share of texts whose vector was already stored",
+                                value=embeddings["cache_hits"] / lookups if lookups else 0.0)
+
+        searches = search_stats()
+        for name in ("searches", "rows_returned_by_sql", "results_returned", "cached_searches", "cache_loads",
+                     "reranked", "rerank_timeouts", "rerank_skipped", "rerank_errors"):
+            yield CounterMetricFamily(f"atlas_search_{name}", f"Search {name.replace('_', ' ')}", value=searches[name])
+        latency = search_latency_stats()
+        yield HistogramMetricFamily(
+            "atlas_search_duration_seconds", "search_memory latency, embedding included",
+            buckets=[("+Inf" if bound == float("inf") else str(bound), count) for bound, count in latency["buckets"]],
+            sum_value=latency["sum"],
+        )
+
+        buffered = buffer_stats()
+        yield GaugeMetricFamily("atlas_buffer_queued", "Write-behind writes not committed yet", value=buffered["queued"])
+        for name in ("batches_flushed", "memories_flushed", "batches_failed", "memories_failed", "flush_seconds"):
+            yield CounterMetricFamily(f"atlas_buffer_{name}", f"Write-behind {name.replace('_', ' ')}",
+                                      value=buffered[name])
+
+
+registry.register(LibraryCollector())
+
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    IN_FLIGHT.labels(request.method).inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        IN_FLIGHT.labels(request.method).dec()
+        # the route template, not the raw path, keeps label cardinality bounded
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        REQUEST_LATENCY.labels(request.method, path).observe(time.perf_counter() - start)
+        REQUESTS.labels(request.method, path, str(status)).inc()
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+reaper = BranchReaper()
+# how often the change feed endpoints look for new events
+CHANGE_POLL_SECONDS = 0.5
+
+
 @app.on_event("startup")
 def startup():
     init_db(engine)
+    warm_pool()
+    # the reaper's first pass also materializes expiring snapshots
+    reaper.start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    reaper.stop(timeout=5)
 
 
 class AddMemoryRequest(BaseModel):
@@ -37,6 +153,8 @@ class AddMemoryRequest(BaseModel):
     source: str = "chat"
     tags: str = ""
     branch: str = "main"
+    dedup: Optional[str] = None  # skip, merge, count
+    chunk: bool = False  # split long texts into passages
 
 
 class SearchRequest(BaseModel):
@@ -45,12 +163,43 @@ class SearchRequest(BaseModel):
     mode: str = "hybrid"  # vector, fulltext, hybrid
     top_k: int = 5
     branch: str = "main"
+    pooling: Optional[str] = None  # max, sum: rank long memories by their passages
+    fields: Optional[List[str]] = None  # id, text, metadata, score
+    fall_through: Optional[float] = None  # also scan archived memories if the best hot score is below this
+    diversify: Optional[float] = None  # MMR lambda: 1.0 relevance only, lower spreads near-duplicates out
+    rerank: bool = False  # reorder candidates with the cross-encoder
+    rerank_budget_ms: Optional[float] = None  # fall back to first-stage order past this (default ATLAS_RERANK_BUDGET_MS)
+    explain: bool = False  # run EXPLAIN ANALYZE on the captured queries
+
+
+class IngestItem(BaseModel):
+    text: str
+    metadata: Optional[dict] = None
+
+
+class IngestRequest(BaseModel):
+    user_id: str = "demo-user"
+    branch: str = "main"
+    items: List[IngestItem]
+    batch_size: int = 256
+    embed_workers: int = 2
+    insert_workers: int = 4
 
 
 class SavePointRequest(BaseModel):
     user_id: str = "demo-user"
     tag: str
     source_branch: str = "main"
+    mode: str = "copy"  # copy, snapshot
+    ttl: Optional[float] = None  # seconds until the reaper deletes the branch
+    explain: bool = False
+
+
+class MergeRequest(BaseModel):
+    user_id: str = "demo-user"
+    source_branch: str
+    target_branch: str = "main"
+    strategy: str = "union"  # union, mirror
 
 
 class DeleteBranchRequest(BaseModel):
@@ -81,28 +230,43 @@ def api_add_memory(req: AddMemoryRequest):
         "tags": [t.strip() for t in req.tags.split(",") if t.strip()]
     }
 
-    memory_id = add_memory(
-        user_id=req.user_id,
-        content=req.text,
-        metadata=metadata,
-        branch=req.branch
-    )
-
-    # SQL that was executed
-    sql_used = f"""INSERT INTO memories (user_id, text, metadata_json, embedding, branch)
-VALUES ('{req.user_id}', '{req.text[:50]}...', '{metadata}', <384-dim vector>, '{req.branch}')"""
+    with profile() as queries:
+        memory_id = add_memory(
+            user_id=req.user_id,
+            content=req.text,
+            metadata=metadata,
+            branch=req.branch,
+            dedup=req.dedup,
+            chunk=req.chunk
+        )
 
     return {
         "id": memory_id,
         "message": "Memory added",
         "branch": req.branch,
-        "sql_used": sql_used
+        "sql_used": format_queries(queries)
     }
 
 
+@app.post("/api/ingest")
+def api_ingest(req: IngestRequest):
+    try:
+        report = ingest(
+            req.user_id,
+            ((item.text, item.metadata) for item in req.items),
+            req.branch,
+            batch_size=req.batch_size,
+            embed_workers=req.embed_workers,
+            insert_workers=req.insert_workers,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"branch": req.branch, **report}
+
+
 @app.get("/api/memories")
 def api_list_memories(user_id: str = "demo-user", branch: str = "main"):
-    with get_session() as db:
+    with profile() as queries, get_session() as db:
         memories = db.query(Memory).filter(
             Memory.user_id == user_id,
             Memory.branch == branch
@@ -119,105 +283,173 @@ def api_list_memories(user_id: str = "demo-user", branch: str = "main"):
                 }
                 for m in memories
             ],
-            "sql_used": f"SELECT * FROM memories WHERE user_id='{user_id}' AND branch='{branch}' ORDER BY created_at DESC"
+            "sql_used": format_queries(queries)
         }
 
 
 @app.post("/api/search")
 def api_search(req: SearchRequest):
-    results = search_memory(
-        user_id=req.user_id,
-        query=req.query,
-        top_k=req.top_k,
-        branch=req.branch,
-        mode=req.mode
-    )
-
-    # Generate SQL explanation based on mode
-    if req.mode == "vector":
-        sql_used = f"""SELECT id, text, metadata_json,
-       vec_cosine_distance(embedding, <query_vector>) as distance
-FROM memories
-WHERE user_id='{req.user_id}' AND branch='{req.branch}'
-ORDER BY distance ASC
-LIMIT {req.top_k}"""
-    elif req.mode == "fulltext":
-        sql_used = f"""SELECT id, text, metadata_json
-FROM memories
-WHERE user_id='{req.user_id}' AND branch='{req.branch}'
-  AND text LIKE '%{req.query}%'
-LIMIT {req.top_k}"""
-    else:  # hybrid
-        sql_used = f"""-- Step 1: Vector search
-SELECT id, text, vec_cosine_distance(embedding, <query_vector>) as distance
-FROM memories WHERE user_id='{req.user_id}' AND branch='{req.branch}'
-ORDER BY distance LIMIT {req.top_k * 2}
-
--- Step 2: Boost results that also match fulltext
--- Re-rank by boosted score"""
+    with timings() as stage_ms, profile(explain=req.explain) as queries:
+        results = search_memory(
+            user_id=req.user_id,
+            query=req.query,
+            top_k=req.top_k,
+            branch=req.branch,
+            mode=req.mode,
+            pooling=req.pooling,
+            fall_through=req.fall_through,
+            fields=req.fields,
+            diversify=req.diversify,
+            rerank=req.rerank,
+            rerank_budget_ms=req.rerank_budget_ms
+        )
 
     return {
-        "results": results,
+        "results": [r.to_dict() for r in results],
         "mode": req.mode,
         "branch": req.branch,
-        "sql_used": sql_used
+        "sql_used": format_queries(queries),
+        "plans": _plans(queries) if req.explain else None,
+        "timings_ms": {k: round(v, 2) for k, v in stage_ms.items()},
     }
 
 
 @app.get("/api/branches")
 def api_list_branches(user_id: str = "demo-user"):
-    branches = list_branches(user_id)
+    with profile() as queries:
+        branches = list_branches(user_id)
     # Always include 'main' even if empty
     if "main" not in branches:
         branches = ["main"] + branches
 
     return {
         "branches": branches,
-        "sql_used": f"SELECT DISTINCT branch FROM memories WHERE user_id='{user_id}' ORDER BY branch"
+        "sql_used": format_queries(queries)
     }
 
 
 @app.post("/api/branches/save")
 def api_save_point(req: SavePointRequest):
-    new_branch = save_point(
-        user_id=req.user_id,
-        tag=req.tag,
-        source_branch=req.source_branch
-    )
+    with profile(explain=req.explain) as queries:
+        new_branch = save_point(
+            user_id=req.user_id,
+            tag=req.tag,
+            source_branch=req.source_branch,
+            mode=req.mode,
+            ttl=req.ttl
+        )
 
     return {
         "new_branch": new_branch,
         "source_branch": req.source_branch,
         "message": f"Created branch '{new_branch}' from '{req.source_branch}'",
-        "sql_used": f"""-- Copy all memories from source branch to new branch
-INSERT INTO memories (user_id, text, metadata_json, embedding, branch)
-SELECT user_id, text, metadata_json, embedding, '{new_branch}'
-FROM memories
-WHERE user_id='{req.user_id}' AND branch='{req.source_branch}'"""
+        "sql_used": format_queries(queries),
+        "plans": _plans(queries) if req.explain else None,
     }
 
 
+@app.get("/api/branches/diff")
+def api_diff_branches(a: str, b: str, user_id: str = "demo-user", limit: Optional[int] = 100):
+    with profile() as queries:
+        diff = diff_branches(user_id, a, b, limit)
+
+    return {**diff, "a": a, "b": b, "sql_used": format_queries(queries)}
+
+
+@app.post("/api/branches/merge")
+def api_merge_branch(req: MergeRequest):
+    try:
+        with profile() as queries:
+            report = merge_branch(req.user_id, req.source_branch, req.target_branch, req.strategy)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        **report,
+        "message": f"Merged '{req.source_branch}' into '{req.target_branch}': "
+                   f"{report['added']} added, {report['removed']} removed",
+        "sql_used": format_queries(queries),
+    }
+
+
+@app.get("/api/changes")
+async def api_changes(after: int = 0, user_id: Optional[str] = None, wait: float = 25.0, limit: int = 500):
+    """Long-poll: changes after `after`, waiting up to `wait` seconds for the first one."""
+    deadline = time.monotonic() + min(wait, 60.0)
+    while True:
+        page = await run_in_threadpool(read_changes, after, limit, user_id)
+        if page["changes"] or time.monotonic() >= deadline:
+            return page
+        # the checkpoint can move past other users' events even when none of ours arrived
+        after = page["checkpoint"]
+        await asyncio.sleep(CHANGE_POLL_SECONDS)
+
+
+@app.get("/api/changes/stream")
+async def api_change_stream(request: Request, after: int = 0, user_id: Optional[str] = None):
+    """Server-sent events, one per change with its seq as the id, so reconnects resume via Last-Event-ID."""
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        after = int(last_event_id)
+
+    async def events():
+        nonlocal after
+        idle = 0.0
+        while not await request.is_disconnected():
+            page = await run_in_threadpool(read_changes, after, 500, user_id)
+            for change in page["changes"]:
+                yield f"id: {change['seq']}\nevent: {change['op']}\ndata: {json.dumps(change)}\n\n"
+            after = page["checkpoint"]
+            if page["changes"]:
+                idle = 0.0
+                continue
+            idle += CHANGE_POLL_SECONDS
+            if idle >= 15:
+                # comment line, keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            await asyncio.sleep(CHANGE_POLL_SECONDS)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 @app.delete("/api/branches/{branch}")
 def api_delete_branch(branch: str, user_id: str = "demo-user"):
     if branch == "main":
         raise HTTPException(status_code=400, detail="Cannot delete main branch")
 
-    deleted = delete_branch(user_id, branch)
+    with profile() as queries:
+        deleted = delete_branch(user_id, branch)
 
     return {
         "deleted_count": deleted,
         "branch": branch,
         "message": f"Deleted {deleted} memories from branch '{branch}'",
-        "sql_used": f"DELETE FROM memories WHERE user_id='{user_id}' AND branch='{branch}'"
+        "sql_used": format_queries(queries)
     }
 
 
+def _plans(queries) -> list:
+    return [
+        {k: q.get(k) for k in ("sql", "indexes", "rows_scanned", "execution_ms", "plan", "plan_error")}
+        for q in queries if "plan" in q or "plan_error" in q
+    ]
+
+
 SEED_MEMORIES = [
     {"text": "User loves beach destinations with warm weather", "source": "user", "tags": "preference, travel"},
     {"text": "User prefers boutique hotels over large chains", "source": "user", "tags": "preference, hotel"},
     {"text": "Budget is around $3000 for a week-long trip", "source": "chat", "tags": "budget, travel"},
 ]
 
+def _seed(user_id: str):
+    metadatas = [
+        {"source": mem["source"], "tags": [t.strip() for t in mem["tags"].split(",") if t.strip()]}
+        for mem in SEED_MEMORIES
+    ]
+    add_memories(user_id, [mem["text"] for mem in SEED_MEMORIES], metadatas, "main")
+
+
 @app.post("/api/seed")
 def api_seed_data(user_id: str = "demo-user"):
     with get_session() as db:
@@ -229,13 +461,8 @@ def api_seed_data(user_id: str = "demo-user"):
         if count > 0:
             return {"seeded": False, "message": "Main branch already has data"}
 
-    # main is empty, add seed data
-    for mem in SEED_MEMORIES:
-        metadata = {
-            "source": mem["source"],
-            "tags": [t.strip() for t in mem["tags"].split(",") if t.strip()]
-        }
-        add_memory(user_id, mem["text"], metadata, "main")
+    # main is empty, add seed data in one batch
+    _seed(user_id)
 
     return {"seeded": True, "count": len(SEED_MEMORIES)}
 
@@ -243,17 +470,26 @@ def api_seed_data(user_id: str = "demo-user"):
 @app.post("/api/reset")
 def api_reset_demo(user_id: str = "demo-user"):
     with get_session() as db:
-        # delete everything for this user
+        # delete everything for this user, hot and archived, the way delete_branch does per branch
+        branches = {r.branch for r in db.query(Memory.branch).filter(Memory.user_id == user_id).distinct()}
+        branches |= {
+            r.branch for r in db.query(MemoryArchive.branch).filter(MemoryArchive.user_id == user_id).distinct()
+        }
         db.query(Memory).filter(Memory.user_id == user_id).delete()
+        db.query(MemoryArchive).filter(MemoryArchive.user_id == user_id).delete()
+        db.query(SavePoint).filter(SavePoint.user_id == user_id).delete()
+        for branch in sorted(branches):
+            bump_version(db, user_id, branch)
+            record_change(db, user_id, branch, "delete_branch")
         db.commit()
 
+    cache = get_vector_cache()
+    if cache is not None:
+        for branch in branches:
+            cache.discard(user_id, branch)
+
     # re-seed
-    for mem in SEED_MEMORIES:
-        metadata = {
-            "source": mem["source"],
-            "tags": [t.strip() for t in mem["tags"].split(",") if t.strip()]
-        }
-        add_memory(user_id, mem["text"], metadata, "main")
+    _seed(user_id)
 
     return {"reset": True, "seeded": len(SEED_MEMORIES)}
 